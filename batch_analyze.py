@@ -0,0 +1,236 @@
+﻿import os
+import csv
+import sys
+import json
+import time
+import asyncio
+import hashlib
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+# ================================================
+# Análise em lote de uma pasta de contratos (sem Streamlit)
+# ================================================
+# Uso:
+#   python batch_analyze.py contratos/ --contract-type 5 --output resultados.jsonl
+#   python batch_analyze.py contratos/ --mapping mapeamento.csv --provider groq
+#
+# A extração dos PDFs roda num pool de processos e as chamadas ao LLM num pool
+# assíncrono limitado por --concurrency. Só --workers + --concurrency contratos
+# ficam em andamento ao mesmo tempo, então uma pasta com milhares de PDFs não
+# mantém todos os textos extraídos na memória. Cada contrato analisado vira uma linha
+# do JSONL de saída, gravada assim que termina; esse arquivo é também o
+# checkpoint: ao rodar de novo, contratos já concluídos (mesmo caminho e mesmo
+# conteúdo) são pulados.
+
+# qa.py é importado fora do `streamlit run`; os avisos de "bare mode" são
+# esperados. Definido antes de qualquer import do Streamlit (e herdado pelos workers).
+os.environ.setdefault("STREAMLIT_LOGGER_LEVEL", "error")
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_mapping(mapping_file: str) -> dict:
+    """
+    CSV com as colunas `arquivo` e `contrato` (ex.: "contrato_acme.pdf,5").
+    """
+    mapping = {}
+    with open(mapping_file, "r", encoding="utf-8-sig") as f:
+        for row in csv.DictReader(f):
+            mapping[row["arquivo"].strip()] = row["contrato"].strip()
+    return mapping
+
+
+def load_checkpoint(output_file: str) -> set:
+    done = set()
+    if not os.path.exists(output_file):
+        return done
+    with open(output_file, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # Linha incompleta de uma execução interrompida
+                continue
+            if record.get("status") == "ok":
+                done.add((record["file"], record["sha256"]))
+    return done
+
+
+# Cache de textos extraídos do processo do pool (criado em _init_worker)
+_pdf_cache = None
+
+
+def _init_worker():
+    # Cada processo do lote já é um worker: a extração dentro dele é sequencial
+    global _pdf_cache
+    import pdf_extract
+    from pdf_cache import PdfTextCache
+    pdf_extract.PDF_EXTRACTION_MODE = "sequential"
+    _pdf_cache = PdfTextCache()
+
+
+def _extract(path: str, normalize_model: str = None) -> tuple:
+    """
+    Texto do PDF e, se normalize_model for informado, já limpo por
+    text_normalize (a limpeza também roda no processo do pool).
+    Sem passar por qa.process_pdf, que mostra o erro na tela e devolve "":
+    a exceção original chega ao registro do arquivo no JSONL.
+    """
+    from pdf_extract import extract_text
+    with open(path, "rb") as f:
+        data = f.read()
+    key = _pdf_cache.key_for(data)
+    text = _pdf_cache.get(key)
+    if text is None:
+        text = extract_text(data)
+        if not text.strip():
+            raise ValueError("Nenhum texto encontrado no PDF.")
+        _pdf_cache.put(key, text)
+    if not normalize_model:
+        return text, None
+    from text_normalize import normalize_text
+    normalized = normalize_text(text, normalize_model)
+    stats = {
+        "chars_removed": normalized.chars_removed,
+        "tokens_removed": normalized.tokens_removed,
+        "percent_tokens_removed": round(normalized.percent_tokens_removed, 1),
+    }
+    return normalized.text, stats
+
+
+class JsonlWriter:
+    def __init__(self, output_file: str):
+        self._file = open(output_file, "a", encoding="utf-8")
+
+    def write(self, record: dict):
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
+
+
+async def run_batch(args) -> int:
+    from qa import generate_response, initialize_embeddings
+    from structured_output import try_parse
+
+    mapping = load_mapping(args.mapping) if args.mapping else {}
+    files = sorted(
+        name for name in os.listdir(args.folder)
+        if name.lower().endswith(".pdf") and os.path.isfile(os.path.join(args.folder, name))
+    )
+    done = load_checkpoint(args.output)
+
+    pending = []
+    for name in files:
+        contract = mapping.get(name, args.contract_type)
+        if not contract:
+            print(f"[pulado] {name}: sem tipo de contrato (use --contract-type ou --mapping)", file=sys.stderr)
+            continue
+        path = os.path.join(args.folder, name)
+        sha = file_sha256(path)
+        if (name, sha) in done:
+            continue
+        pending.append((name, path, sha, contract))
+
+    print(f"{len(files)} PDFs, {len(files) - len(pending)} já concluídos ou pulados, {len(pending)} a analisar.")
+    if not pending:
+        return 0
+
+    llm = initialize_embeddings(args.provider)
+    fallback_llm = None
+    if args.failover:
+        fallback_llm = initialize_embeddings("groq" if args.provider == "openai" else "openai")
+
+    writer = JsonlWriter(args.output)
+    semaphore = asyncio.Semaphore(args.concurrency)
+    # Contratos em andamento (extraindo ou esperando/analisando no LLM)
+    in_flight = asyncio.Semaphore(args.workers + args.concurrency)
+    loop = asyncio.get_running_loop()
+    failures = 0
+
+    async def analyze(executor, name, path, sha, contract):
+        async with in_flight:
+            await _analyze(executor, name, path, sha, contract)
+
+    async def _analyze(executor, name, path, sha, contract):
+        nonlocal failures
+        record = {
+            "file": name, "sha256": sha, "contract": contract, "mode": args.mode,
+            "provider": args.provider, "strategy": args.strategy, "format": args.format,
+        }
+        started = time.perf_counter()
+        try:
+            text, normalization = await loop.run_in_executor(
+                executor, _extract, path, None if args.no_normalize else llm.model
+            )
+            record["normalization"] = normalization
+            async with semaphore:
+                timings = {}
+                result = await asyncio.to_thread(
+                    generate_response, text, contract, llm, args.mode,
+                    strategy=args.strategy, timings=timings, fallback_llm=fallback_llm,
+                    output_format=args.format,
+                )
+            if timings.get("output_format") == "json":
+                # Em modo JSON o resultado vai para o JSONL como objeto, não como texto
+                analysis = try_parse(result)
+                if analysis is None:
+                    raise ValueError(result)
+                result = analysis.model_dump()
+            record.update(status="ok", result=result, timings=timings)
+        except Exception as e:
+            failures += 1
+            record.update(status="error", error=f"{type(e).__name__}: {e}")
+        record["seconds"] = round(time.perf_counter() - started, 3)
+        writer.write(record)
+        print(f"[{record['status']}] {name} ({record['seconds']}s)")
+
+    with ProcessPoolExecutor(
+        max_workers=args.workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+    ) as executor:
+        try:
+            await asyncio.gather(*(analyze(executor, *item) for item in pending))
+        finally:
+            writer.close()
+
+    print(f"Concluído: {len(pending) - failures} ok, {failures} com erro. Resultados em {args.output}")
+    return 1 if failures else 0
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Analisa em lote uma pasta de contratos em PDF.")
+    parser.add_argument("folder", help="Pasta com os PDFs")
+    parser.add_argument("--contract-type", help="ID do tipo de contrato para todos os arquivos (ex.: 5)")
+    parser.add_argument("--mapping", help="CSV com as colunas arquivo,contrato")
+    parser.add_argument("--output", default="resultados.jsonl", help="Arquivo JSONL de saída (e checkpoint)")
+    parser.add_argument("--provider", choices=("openai", "groq"), default="openai")
+    parser.add_argument("--mode", choices=("Apenas Requisitos", "Completo"), default="Apenas Requisitos")
+    parser.add_argument("--strategy", default="auto",
+                        choices=("auto", "single", "map_reduce", "per_requirement", "relevant_clauses"))
+    parser.add_argument("--no-normalize", action="store_true",
+                        help="Não limpar cabeçalhos, rodapés e ruído do texto extraído")
+    parser.add_argument("--format", choices=("text", "json"), default="text",
+                        help="json: vereditos estruturados por requisito (só em Apenas Requisitos)")
+    parser.add_argument("--failover", action="store_true", help="Hedge/failover para o outro provedor")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Processos de extração de PDF")
+    parser.add_argument("--concurrency", type=int, default=4, help="Análises simultâneas no LLM")
+    args = parser.parse_args(argv)
+    if not args.contract_type and not args.mapping:
+        parser.error("informe --contract-type ou --mapping")
+    return args
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(run_batch(parse_args())))
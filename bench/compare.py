@@ -0,0 +1,51 @@
+﻿import sys
+import json
+import argparse
+
+# ================================================
+# Comparação de dois resultados de bench/run_benchmark.py
+# ================================================
+# Uso:
+#   python bench/compare.py bench/results/antes.json bench/results/depois.json
+# Mostra, para cada etapa e tamanho presentes nos dois arquivos, p50/p95 e a
+# variação percentual; termina com código 1 se alguma etapa piorou mais que
+# --threshold no p50 (útil para barrar regressões).
+
+
+def load(path: str) -> dict:
+    with open(path, encoding="utf-8") as f:
+        report = json.load(f)
+    return report["meta"], {(entry["step"], entry["pages"]): entry for entry in report["results"]}
+
+
+def change(before: float, after: float) -> float:
+    return 100.0 * (after - before) / before if before else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compara dois resultados de benchmark.")
+    parser.add_argument("before")
+    parser.add_argument("after")
+    parser.add_argument("--threshold", type=float, default=10.0, help="piora máxima aceita no p50 (%%)")
+    args = parser.parse_args()
+
+    meta_before, before = load(args.before)
+    meta_after, after = load(args.after)
+    print(f"{meta_before['commit']} -> {meta_after['commit']}")
+    print(f"{'etapa':<26} {'pág.':>5} {'p50 antes':>10} {'p50 depois':>10} {'Δ p50':>8} {'p95 antes':>10} {'p95 depois':>10} {'Δ p95':>8}")
+    regressions = []
+    for key in sorted(set(before) & set(after), key=lambda k: (k[1], k[0])):
+        old, new = before[key], after[key]
+        p50 = change(old["p50_s"], new["p50_s"])
+        p95 = change(old["p95_s"], new["p95_s"])
+        print(f"{key[0]:<26} {key[1]:>5} {old['p50_s']:>10.4f} {new['p50_s']:>10.4f} {p50:>+7.1f}% "
+              f"{old['p95_s']:>10.4f} {new['p95_s']:>10.4f} {p95:>+7.1f}%")
+        if p50 > args.threshold:
+            regressions.append(f"{key[0]} ({key[1]} pág.)")
+    if regressions:
+        print(f"Piora acima de {args.threshold:.0f}% no p50: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+﻿import os
+import random
+import argparse
+import textwrap
+
+# ================================================
+# Contratos sintéticos em PDF para os benchmarks
+# ================================================
+# Gera contratos de prestação de serviços em português com o número de páginas
+# pedido, a partir de cláusulas-modelo sobre os mesmos temas dos CSVs de
+# requisitos (partes, objeto, preço, rescisão, garantias, dados pessoais...).
+# Cada página tem o timbre no topo e "Página X de Y" e a linha de rubrica no
+# rodapé, como os contratos reais escaneados, para que a limpeza do texto
+# também seja exercitada. O PDF é escrito à mão (texto em Helvetica com
+# WinAnsiEncoding), sem dependências além da biblioteca padrão; a geração é
+# determinística pela semente, então o mesmo tamanho gera sempre o mesmo arquivo.
+
+LINES_PER_PAGE = 52
+LINE_WIDTH = 95
+FONT_SIZE = 10
+LEADING = 13
+
+HEADER = "CONTRATO DE PRESTAÇÃO DE SERVIÇOS Nº {number}/2024 – TAHECH ADVOGADOS"
+
+CLAUSES = [
+    ("DAS PARTES", [
+        "CONTRATANTE: {empresa}, pessoa jurídica de direito privado, inscrita no CNPJ sob o nº {cnpj}, "
+        "com sede na {endereco}, neste ato representada por seu sócio-administrador.",
+        "CONTRATADA: {empresa2}, inscrita no CNPJ sob o nº {cnpj2}, com sede na {endereco2}, "
+        "doravante denominada simplesmente CONTRATADA.",
+    ]),
+    ("DO OBJETO", [
+        "O presente contrato tem por objeto a prestação, pela CONTRATADA, de serviços de {servico}, "
+        "conforme especificações constantes do Anexo I, que integra este instrumento para todos os fins.",
+        "Os serviços serão executados nas dependências da CONTRATANTE ou remotamente, a critério das partes, "
+        "observados os níveis de serviço descritos no Anexo II.",
+    ]),
+    ("DO PREÇO E DAS CONDIÇÕES DE PAGAMENTO", [
+        "Pela execução dos serviços, a CONTRATANTE pagará à CONTRATADA o valor mensal de R$ {valor}, "
+        "mediante a apresentação da nota fiscal correspondente até o quinto dia útil do mês subsequente.",
+        "O atraso no pagamento sujeitará a CONTRATANTE à multa de 2% (dois por cento) sobre o valor devido, "
+        "acrescida de juros de mora de 1% (um por cento) ao mês e correção monetária pelo IPCA.",
+    ]),
+    ("DO PRAZO E DA RESCISÃO", [
+        "Este contrato vigorará pelo prazo de {meses} meses, contados da data de sua assinatura, "
+        "podendo ser prorrogado mediante termo aditivo.",
+        "Qualquer das partes poderá rescindir o presente contrato, sem ônus, mediante aviso prévio "
+        "por escrito com antecedência mínima de 30 (trinta) dias.",
+        "O descumprimento de qualquer obrigação contratual autoriza a parte inocente a rescindir o contrato "
+        "de pleno direito, independentemente de notificação judicial ou extrajudicial.",
+    ]),
+    ("DAS GARANTIAS E DOS VÍCIOS", [
+        "A CONTRATADA garante a qualidade dos serviços prestados pelo prazo de 90 (noventa) dias, "
+        "obrigando-se a refazer, sem custo adicional, os serviços que apresentarem vícios ou defeitos.",
+        "Os vícios aparentes deverão ser comunicados pela CONTRATANTE no prazo de 30 (trinta) dias "
+        "contados da entrega, nos termos do Código de Defesa do Consumidor.",
+    ]),
+    ("DO DIREITO DE ARREPENDIMENTO", [
+        "Quando a contratação ocorrer fora do estabelecimento comercial, a CONTRATANTE poderá desistir "
+        "do contrato no prazo de 7 (sete) dias, com a devolução integral dos valores eventualmente pagos.",
+    ]),
+    ("DA PROTEÇÃO DE DADOS PESSOAIS", [
+        "As partes obrigam-se a tratar os dados pessoais a que tiverem acesso em razão deste contrato "
+        "em conformidade com a Lei nº 13.709/2018 (Lei Geral de Proteção de Dados Pessoais).",
+        "A CONTRATADA adotará medidas técnicas e administrativas aptas a proteger os dados pessoais de "
+        "acessos não autorizados e comunicará à CONTRATANTE qualquer incidente de segurança em até 48 horas.",
+    ]),
+    ("DAS OBRIGAÇÕES DA CONTRATADA", [
+        "Executar os serviços com zelo, diligência e observância das normas técnicas aplicáveis, "
+        "mantendo equipe qualificada e devidamente treinada.",
+        "Responsabilizar-se por todos os encargos trabalhistas, previdenciários e fiscais decorrentes "
+        "da execução deste contrato, isentando a CONTRATANTE de qualquer responsabilidade solidária.",
+    ]),
+    ("DAS OBRIGAÇÕES DA CONTRATANTE", [
+        "Fornecer à CONTRATADA as informações e os acessos necessários à execução dos serviços.",
+        "Efetuar os pagamentos nas datas aprazadas e comunicar por escrito quaisquer irregularidades observadas.",
+    ]),
+    ("DA CONFIDENCIALIDADE", [
+        "As partes manterão sigilo sobre todas as informações confidenciais recebidas em razão deste contrato, "
+        "durante sua vigência e por 5 (cinco) anos após o seu término.",
+    ]),
+    ("DO FORO", [
+        "Fica eleito o foro da comarca de {cidade} para dirimir quaisquer questões oriundas deste contrato, "
+        "com renúncia expressa a qualquer outro, por mais privilegiado que seja.",
+    ]),
+]
+
+_FIELDS = {
+    "empresa": ["Alfa Comércio de Alimentos Ltda.", "Beta Indústria Têxtil S.A.", "Gama Serviços Médicos Ltda."],
+    "empresa2": ["Delta Tecnologia da Informação Ltda.", "Épsilon Manutenção Predial Ltda.", "Zeta Consultoria S.A."],
+    "endereco": ["Rua das Palmeiras, 120, São Paulo/SP", "Av. Paulista, 1500, São Paulo/SP"],
+    "endereco2": ["Rua XV de Novembro, 45, Curitiba/PR", "Av. Getúlio Vargas, 800, Belo Horizonte/MG"],
+    "servico": ["manutenção preventiva e corretiva de equipamentos", "suporte técnico de informática",
+                "limpeza e conservação predial"],
+    "cidade": ["São Paulo/SP", "Curitiba/PR", "Belo Horizonte/MG"],
+}
+
+
+def _fill(template: str, rng: random.Random) -> str:
+    values = {name: rng.choice(options) for name, options in _FIELDS.items()}
+    values.update(
+        cnpj=f"{rng.randint(10, 99)}.{rng.randint(100, 999)}.{rng.randint(100, 999)}/0001-{rng.randint(10, 99)}",
+        cnpj2=f"{rng.randint(10, 99)}.{rng.randint(100, 999)}.{rng.randint(100, 999)}/0001-{rng.randint(10, 99)}",
+        valor=f"{rng.randint(2, 90)}.{rng.randint(100, 999)},00",
+        meses=rng.choice([12, 24, 36]),
+    )
+    return template.format(**values)
+
+
+def contract_lines(rng: random.Random):
+    """
+    Gera as linhas do corpo do contrato, cláusula após cláusula, sem fim.
+    """
+    number = 0
+    while True:
+        for title, paragraphs in CLAUSES:
+            number += 1
+            yield f"CLÁUSULA {number}ª – {title}"
+            for position, paragraph in enumerate(paragraphs, start=1):
+                label = "Parágrafo único. " if len(paragraphs) == 1 else f"{number}.{position}. "
+                yield from textwrap.wrap(label + _fill(paragraph, rng), LINE_WIDTH)
+            yield ""
+
+
+def contract_pages(pages: int, seed: int = 0) -> list:
+    """
+    Texto de cada página (cabeçalho, corpo e rodapé), como lista de listas de linhas.
+    """
+    rng = random.Random(seed)
+    header = HEADER.format(number=rng.randint(100, 999))
+    body = contract_lines(rng)
+    body_lines = LINES_PER_PAGE - 5
+    result = []
+    for page in range(1, pages + 1):
+        lines = [header, ""]
+        lines.extend(next(body) for _ in range(body_lines))
+        lines.extend(["", f"Página {page} de {pages}", "Rubrica: ____________   ____________"])
+        result.append(lines)
+    return result
+
+
+# ================================================
+# Escrita do PDF
+# ================================================
+def _pdf_string(line: str) -> bytes:
+    escaped = line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+    return b"(" + escaped.encode("cp1252", errors="replace") + b")"
+
+
+def write_pdf(pages: list) -> bytes:
+    """
+    PDF mínimo com uma página por item de `pages` (listas de linhas).
+    """
+    count = len(pages)
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        ("<< /Type /Pages /Kids [%s] /Count %d >>"
+         % (" ".join(f"{4 + 2 * i} 0 R" for i in range(count)), count)).encode(),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+    ]
+    for i, lines in enumerate(pages):
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {5 + 2 * i} 0 R >>".encode()
+        )
+        content = b"BT /F1 %d Tf 40 810 Td %d TL " % (FONT_SIZE, LEADING)
+        content += b" ".join(_pdf_string(line) + b" '" for line in lines) + b" ET"
+        objects.append(b"<< /Length %d >>\nstream\n" % len(content) + content + b"\nendstream")
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(out)
+
+
+def make_contract_pdf(pages: int, seed: int = 0) -> bytes:
+    return write_pdf(contract_pages(pages, seed))
+
+
+def ensure_contract(pages: int, directory: str, seed: int = 0) -> str:
+    """
+    Caminho do PDF sintético de `pages` páginas em `directory`, gerado só se ainda não existir.
+    """
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"contrato_{pages:03d}p_s{seed}.pdf")
+    if not os.path.exists(path):
+        with open(path, "wb") as f:
+            f.write(make_contract_pdf(pages, seed))
+    return path
+
+
+DEFAULT_DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gera contratos sintéticos em PDF para os benchmarks.")
+    parser.add_argument("--pages", type=int, nargs="+", default=[5, 50, 500], help="tamanhos em páginas (5 a 500)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output-dir", default=DEFAULT_DATA_DIR)
+    args = parser.parse_args()
+    for pages in args.pages:
+        path = ensure_contract(pages, args.output_dir, args.seed)
+        print(f"{path} ({os.path.getsize(path) / 1024:.0f} KB)")
+
+
+if __name__ == "__main__":
+    main()
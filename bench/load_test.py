@@ -0,0 +1,509 @@
+﻿import os
+import sys
+import json
+import time
+import queue
+import shutil
+import socket
+import asyncio
+import argparse
+import tempfile
+import threading
+import traceback
+import subprocess
+import urllib.request
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+
+# ================================================
+# Teste de carga: N advogados usando o app ao mesmo tempo
+# ================================================
+# Uso:
+#   python bench/load_test.py --levels 1 2 4 8 16 --pages 20
+#   python bench/load_test.py --levels 4 8 --latency 2 --max-rerun-seconds 1
+#
+# O app roda como em produção: um servidor `streamlit run qa.py` num processo
+# próprio, com o LLM falso (bench/mock_llm.py) no lugar dos provedores. Cada
+# usuário simulado é um processo cliente separado, com a sua própria conta
+# (carga01, carga02...; cota e limite por usuário do agendador valem como
+# configurados), que fala o protocolo websocket do Streamlit (/_stcore/stream):
+# envia rerun_script com o estado dos widgets, como o navegador, e espera o
+# script_finished. A árvore de elementos recebida é montada com o parser do
+# AppTest (streamlit.testing), o que permite achar os widgets pelo rótulo. Os
+# reruns das sessões rodam em paralelo no servidor, então a latência medida
+# inclui a disputa real por CPU, GIL, caches e SQLite.
+#
+# O fluxo é login -> contrato -> seleção -> análise (clique e reruns até o
+# resultado). O "upload" usa a opção "Inserir Manualmente", com o texto de um
+# contrato sintético (bench/contracts.py); a extração do PDF fica de fora e é
+# medida por bench/run_benchmark.py. O navegador dispararia o fragmento de
+# progresso sozinho (run_every); aqui o cliente pede um rerun completo a cada
+# --poll-seconds.
+#
+# A concorrência sobe nível a nível, sempre no mesmo servidor (já aquecido);
+# em cada um são medidos a latência de cada passo e de cada rerun (do envio
+# até o script_finished), e a CPU e a memória (RSS) do processo do servidor.
+# O ponto de falha é o primeiro nível com taxa de erro acima de
+# --max-error-rate ou p95 de rerun acima de --max-rerun-seconds.
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_DIR = os.path.join(ROOT, "bench")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, BENCH_DIR)
+
+from contracts import contract_pages
+from run_benchmark import prepare_environment, percentile, git_commit, PERCENTILES
+
+STEPS = ("open", "login", "upload", "select", "analyze", "rerun")
+
+ACCOUNT_PREFIX = "carga"
+ACCOUNT_PASSWORD = "carga-1234"
+
+
+# ================================================
+# CPU e memória do servidor
+# ================================================
+def _cpu_seconds(pid: int) -> float:
+    # utime + stime do /proc/<pid>/stat (campos 14 e 15, contando do nome)
+    with open(f"/proc/{pid}/stat", encoding="ascii") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def rss_mb(pid: int) -> float:
+    with open(f"/proc/{pid}/status", encoding="ascii") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return None
+
+
+class ResourceSampler:
+    """
+    Amostra CPU (% de um núcleo, somando todas as threads) e RSS do processo
+    `pid` (só em Linux, via /proc; fora dele as medidas ficam vazias).
+    """
+
+    def __init__(self, pid: int, interval: float = 0.5):
+        self.pid = pid
+        self.interval = interval
+        self.cpu = []
+        self.rss = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="resource-sampler", daemon=True)
+
+    def _run(self):
+        try:
+            last_cpu, last_wall = _cpu_seconds(self.pid), time.perf_counter()
+            while not self._stop.wait(self.interval):
+                cpu, wall = _cpu_seconds(self.pid), time.perf_counter()
+                self.cpu.append(100.0 * (cpu - last_cpu) / (wall - last_wall))
+                self.rss.append(rss_mb(self.pid))
+                last_cpu, last_wall = cpu, wall
+        except (OSError, ValueError, IndexError):
+            pass
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def summary(self) -> dict:
+        rss = [value for value in self.rss if value is not None]
+        return {
+            "cpu_mean_pct": round(sum(self.cpu) / len(self.cpu), 1) if self.cpu else None,
+            "cpu_max_pct": round(max(self.cpu), 1) if self.cpu else None,
+            "rss_max_mb": round(max(rss), 1) if rss else None,
+        }
+
+
+# ================================================
+# Servidor Streamlit
+# ================================================
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(port: int, log_path: str, timeout: float) -> subprocess.Popen:
+    """
+    Sobe `streamlit run qa.py` com o ambiente atual e espera o /_stcore/health.
+    """
+    log = open(log_path, "wb")
+    process = subprocess.Popen(
+        [sys.executable, "-m", "streamlit", "run", os.path.join(ROOT, "qa.py"),
+         "--server.headless=true", f"--server.port={port}", "--server.address=127.0.0.1",
+         "--server.fileWatcherType=none", "--browser.gatherUsageStats=false"],
+        cwd=ROOT, env=os.environ.copy(), stdout=log, stderr=subprocess.STDOUT,
+    )
+    log.close()
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            break
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/_stcore/health", timeout=1) as response:
+                if response.status == 200:
+                    return process
+        except OSError:
+            time.sleep(0.2)
+    stop_server(process)
+    with open(log_path, encoding="utf-8", errors="replace") as f:
+        tail = f.read()[-2000:]
+    raise RuntimeError(f"O servidor Streamlit não subiu em {timeout:.0f}s:\n{tail}")
+
+
+def stop_server(process: subprocess.Popen):
+    if process.poll() is None:
+        process.terminate()
+        try:
+            process.wait(10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+
+def create_accounts(count: int):
+    # Uma conta por usuário simulado, no mesmo cadastro (USERS_PATH) que o servidor usa
+    from user_store import UserStore
+    store = UserStore(os.environ["USERS_PATH"])
+    with ThreadPoolExecutor() as pool:
+        list(pool.map(lambda i: store.set_password(account(i), ACCOUNT_PASSWORD), range(count)))
+
+
+def account(user_index: int) -> str:
+    return f"{ACCOUNT_PREFIX}{user_index + 1:02d}"
+
+
+# ================================================
+# Um usuário simulado (cliente websocket)
+# ================================================
+def find(elements, label: str):
+    for element in elements:
+        if element.label.startswith(label):
+            return element
+    raise LookupError(f"Elemento não encontrado na tela: {label!r}")
+
+
+def choose(widget, option: str):
+    """
+    Estado de um radio/selectbox com `option` marcada. O set_value do AppTest
+    precisa da sessão local do AppTest para formatar as opções; aqui o índice
+    vai direto, como o frontend manda.
+    """
+    from streamlit.proto.WidgetStates_pb2 import WidgetState
+    return WidgetState(id=widget.id, int_value=widget.options.index(option))
+
+
+class VirtualUser:
+    """
+    Uma sessão do navegador: guarda o estado dos widgets alterados, como o
+    frontend, e o reenvia a cada rerun.
+    """
+
+    def __init__(self, user_index: int, port: int, args, text: str):
+        self.user_index = user_index
+        self.base_url = f"127.0.0.1:{port}"
+        self.args = args
+        self.text = text
+        self.steps = {step: [] for step in STEPS}
+        self.error = None
+        self._ws = None
+        self._widgets = {}
+        self._messages = {}
+        self._query_string = ""
+        self._page_hash = ""
+
+    async def _connect(self):
+        from tornado.websocket import websocket_connect
+        self._ws = await websocket_connect(
+            f"ws://{self.base_url}/_stcore/stream", subprotocols=["streamlit"],
+            max_message_size=256 * 1024 * 1024,
+        )
+
+    async def _resolve(self, message):
+        """
+        Mensagens grandes repetidas chegam só como referência (ref_hash) a
+        uma já recebida; como o frontend, busca no cache local ou no servidor.
+        """
+        from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+        if message.WhichOneof("type") != "ref_hash":
+            if message.metadata.cacheable and message.hash:
+                self._messages[message.hash] = message
+            return message
+        cached = self._messages.get(message.ref_hash)
+        if cached is None:
+            from tornado.httpclient import AsyncHTTPClient
+            response = await AsyncHTTPClient().fetch(f"http://{self.base_url}/_stcore/message?hash={message.ref_hash}")
+            cached = ForwardMsg()
+            cached.ParseFromString(response.body)
+            self._messages[message.ref_hash] = cached
+        resolved = ForwardMsg()
+        resolved.CopyFrom(cached)
+        resolved.metadata.CopyFrom(message.metadata)
+        return resolved
+
+    async def _run(self, step: str, *touched):
+        """
+        Rerun com os widgets alterados em `touched` (elementos já com o novo
+        valor ou WidgetState prontos) e devolve a árvore de elementos resultante.
+        """
+        from streamlit.proto.BackMsg_pb2 import BackMsg
+        from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+        from streamlit.proto.WidgetStates_pb2 import WidgetStates
+        from streamlit.testing.v1.element_tree import parse_tree_from_messages
+
+        states = dict(self._widgets)
+        for widget in touched:
+            state = getattr(widget, "_widget_state", widget)
+            states[state.id] = state
+        # Botões valem só para este rerun, como no navegador
+        self._widgets = {key: state for key, state in states.items() if not state.HasField("trigger_value")}
+        request = BackMsg()
+        request.rerun_script.query_string = self._query_string
+        request.rerun_script.page_script_hash = self._page_hash
+        request.rerun_script.widget_states.CopyFrom(WidgetStates(widgets=list(states.values())))
+
+        started = time.perf_counter()
+        await self._ws.write_message(request.SerializeToString(), binary=True)
+        deltas = []
+        while True:
+            raw = await asyncio.wait_for(self._ws.read_message(), self.args.step_timeout)
+            if raw is None:
+                raise ConnectionError("O servidor fechou a conexão.")
+            message = ForwardMsg()
+            message.ParseFromString(raw)
+            message = await self._resolve(message)
+            kind = message.WhichOneof("type")
+            if kind == "new_session":
+                self._page_hash = message.new_session.page_script_hash
+            elif kind == "page_info_changed":
+                self._query_string = message.page_info_changed.query_string
+            elif kind == "delta":
+                deltas.append(message)
+            elif kind == "script_finished":
+                if message.script_finished == ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                    # st.rerun(): o servidor já começa a próxima execução sozinho
+                    deltas = []
+                    continue
+                break
+        self.steps[step].append(time.perf_counter() - started)
+        tree = parse_tree_from_messages(deltas)
+        if tree.exception:
+            raise RuntimeError(tree.exception[0].message)
+        return tree
+
+    async def flow(self):
+        args = self.args
+        await self._connect()
+        tree = await self._run("open")
+
+        username = find(tree.text_input, "Usuário").input(account(self.user_index))
+        password = find(tree.text_input, "Senha").input(ACCOUNT_PASSWORD)
+        tree = await self._run("login", username, password, find(tree.button, "Entrar").click())
+        if tree.error:
+            raise RuntimeError(tree.error[0].value)
+        tree = await self._run("login")
+
+        provider = choose(find(tree.radio, "Escolha o provedor"), args.provider)
+        input_mode = choose(find(tree.radio, "Modo de entrada do contrato"), "Inserir Manualmente")
+        tree = await self._run("upload", provider, input_mode)
+        tree = await self._run("upload", find(tree.text_area, "Digite o texto do contrato").input(self.text))
+
+        contract = find(tree.selectbox, "Selecione a característica")
+        contract = choose(contract, contract.options[1])
+        strategy = find(tree.radio, "Estratégia de execução")
+        strategy = choose(strategy, next(option for option in strategy.options if option.startswith(args.strategy_label)))
+        tree = await self._run("select", contract, strategy)
+
+        started = time.perf_counter()
+        tree = await self._run("rerun", find(tree.button, "Analisar Informação").click())
+        deadline = started + args.analysis_timeout
+        while not any(area.label == "Resultado da Análise" for area in tree.text_area):
+            if tree.error:
+                raise RuntimeError(tree.error[0].value)
+            if time.perf_counter() > deadline:
+                raise TimeoutError(f"Análise sem resultado após {args.analysis_timeout:.0f}s")
+            await asyncio.sleep(args.poll_seconds)
+            tree = await self._run("rerun")
+        self.steps["analyze"].append(time.perf_counter() - started)
+
+    async def run(self) -> dict:
+        try:
+            await self.flow()
+        except Exception as e:
+            self.error = f"{type(e).__name__}: {e}"
+            if self.args.verbose:
+                traceback.print_exc()
+        finally:
+            if self._ws is not None:
+                self._ws.close()
+        return {"steps": self.steps, "error": self.error}
+
+
+def _client_process(user_index: int, port: int, args, text: str, barrier, results):
+    # Processo de um usuário: importa tudo, espera os demais e só então começa
+    user = VirtualUser(user_index, port, args, text)
+    try:
+        barrier.wait(args.start_timeout)
+    except threading.BrokenBarrierError:
+        pass
+    results.put(asyncio.run(user.run()))
+
+
+# ================================================
+# Rampa de concorrência
+# ================================================
+def latency_summary(durations: list) -> dict:
+    if not durations:
+        return None
+    return {"n": len(durations), **{
+        f"p{round(q * 100)}_s": round(percentile(durations, q), 3) for q in PERCENTILES
+    }}
+
+
+def run_level(users: int, port: int, server_pid: int, args, texts: list) -> dict:
+    context = multiprocessing.get_context("spawn")
+    barrier = context.Barrier(users)
+    results = context.Queue()
+    processes = [
+        context.Process(target=_client_process, args=(i, port, args, texts[i % len(texts)], barrier, results),
+                        name=f"usuario-{i + 1}", daemon=True)
+        for i in range(users)
+    ]
+    sessions = []
+    started = time.perf_counter()
+    with ResourceSampler(server_pid) as sampler:
+        for process in processes:
+            process.start()
+        deadline = time.monotonic() + args.start_timeout + args.analysis_timeout + 60
+        while len(sessions) < users:
+            try:
+                sessions.append(results.get(timeout=max(0.1, deadline - time.monotonic())))
+            except queue.Empty:
+                break
+    wall = time.perf_counter() - started
+    for process in processes:
+        process.join(5)
+        if process.is_alive():
+            process.kill()
+    # Cliente que morreu sem devolver resultado conta como erro
+    sessions += [{"steps": {step: [] for step in STEPS}, "error": "cliente sem resposta"}] * (users - len(sessions))
+
+    steps = {}
+    for step in STEPS:
+        steps[step] = latency_summary([duration for session in sessions for duration in session["steps"][step]])
+    steps = {step: summary for step, summary in steps.items() if summary}
+    errors = [session["error"] for session in sessions if session["error"]]
+    completed = users - len(errors)
+    return {
+        "users": users,
+        "wall_s": round(wall, 2),
+        "completed": completed,
+        "error_rate": round(len(errors) / users, 3),
+        "analyses_per_min": round(60 * completed / wall, 2) if wall else None,
+        "steps": steps,
+        **sampler.summary(),
+        "errors": sorted(set(errors))[:10],
+    }
+
+
+def failure_reason(level: dict, args) -> str:
+    if level["error_rate"] > args.max_error_rate:
+        return f"taxa de erro {level['error_rate']:.0%} acima de {args.max_error_rate:.0%}"
+    rerun = level["steps"].get("rerun")
+    if rerun and rerun["p95_s"] > args.max_rerun_seconds:
+        return f"p95 do rerun {rerun['p95_s']:.2f}s acima de {args.max_rerun_seconds:.2f}s"
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Teste de carga do app: servidor Streamlit real e um processo por usuário.")
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 2, 4, 8, 16], help="usuários simultâneos por nível")
+    parser.add_argument("--pages", type=int, default=20, help="páginas do contrato sintético de cada usuário")
+    parser.add_argument("--same-contract", action="store_true",
+                        help="todos enviam o mesmo contrato (exercita o cache de respostas entre usuários)")
+    parser.add_argument("--provider", choices=["openai", "groq"], default="openai")
+    parser.add_argument("--strategy-label", default="Automática", help="início do rótulo da estratégia na tela")
+    parser.add_argument("--latency", type=float, default=0.5, help="latência do LLM falso até o 1º token (s)")
+    parser.add_argument("--tokens-per-second", type=float, default=100.0)
+    parser.add_argument("--jitter", type=float, default=0.1)
+    parser.add_argument("--poll-seconds", type=float, default=0.5, help="intervalo entre reruns aguardando o resultado")
+    parser.add_argument("--step-timeout", type=float, default=60.0, help="tempo máximo de um rerun (s)")
+    parser.add_argument("--analysis-timeout", type=float, default=300.0)
+    parser.add_argument("--start-timeout", type=float, default=120.0,
+                        help="tempo máximo para subir o servidor e os processos clientes (s)")
+    parser.add_argument("--per-user-cap", type=int,
+                        help="SCHEDULER_MAX_PER_USER do servidor (padrão: o configurado no ambiente)")
+    parser.add_argument("--user-token-quota", type=int,
+                        help="USER_TOKEN_QUOTA do servidor, 0 desliga (padrão: o configurado no ambiente)")
+    parser.add_argument("--max-error-rate", type=float, default=0.05)
+    parser.add_argument("--max-rerun-seconds", type=float, default=2.0)
+    parser.add_argument("--keep-going", action="store_true", help="continua a rampa depois do ponto de falha")
+    parser.add_argument("--verbose", action="store_true")
+    parser.add_argument("--output", help="arquivo JSON (padrão: bench/results/load-<commit>-<data>.json)")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="load-")
+    mock_server, settings = prepare_environment(args, workdir)
+    if args.per_user_cap is not None:
+        os.environ["SCHEDULER_MAX_PER_USER"] = str(args.per_user_cap)
+    if args.user_token_quota is not None:
+        os.environ["USER_TOKEN_QUOTA"] = str(args.user_token_quota)
+    texts = ["\n".join("\n".join(page) for page in contract_pages(args.pages, seed=0 if args.same_contract else i))
+             for i in range(1 if args.same_contract else max(args.levels))]
+
+    levels = []
+    failure = None
+    server = None
+    try:
+        create_accounts(max(args.levels))
+        port = free_port()
+        server = start_server(port, os.path.join(workdir, "streamlit.log"), args.start_timeout)
+        for users in args.levels:
+            print(f"{users} usuário(s)...", flush=True)
+            level = run_level(users, port, server.pid, args, texts)
+            levels.append(level)
+            steps = level["steps"]
+            print(f"  concluídos {level['completed']}/{users} em {level['wall_s']}s | "
+                  f"análise p50 {steps.get('analyze', {}).get('p50_s')}s p95 {steps.get('analyze', {}).get('p95_s')}s | "
+                  f"rerun p95 {steps.get('rerun', {}).get('p95_s')}s | "
+                  f"CPU média do servidor {level['cpu_mean_pct']}% | RSS máx. {level['rss_max_mb']} MB", flush=True)
+            reason = failure_reason(level, args)
+            if reason and failure is None:
+                failure = {"users": users, "reason": reason}
+                print(f"  ponto de falha: {reason}", flush=True)
+                if not args.keep_going:
+                    break
+    finally:
+        if server is not None:
+            stop_server(server)
+        mock_server.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    commit = git_commit()
+    report = {
+        "meta": {
+            "commit": commit,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "cpus": os.cpu_count(),
+            "mock_requests": settings.requests,
+            "settings": {k: v for k, v in vars(args).items() if k != "output"},
+        },
+        "levels": levels,
+        "failure_point": failure,
+        "max_users_ok": max((level["users"] for level in levels if not failure_reason(level, args)), default=0),
+    }
+    output = args.output or os.path.join(BENCH_DIR, "results", f"load-{commit}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Maior nível sem falha: {report['max_users_ok']} usuário(s). Resultado em {output}")
+
+
+if __name__ == "__main__":
+    main()
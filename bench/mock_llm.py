@@ -0,0 +1,162 @@
+﻿import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# ================================================
+# Servidor LLM falso (compatível com OpenAI e Groq) para benchmarks
+# ================================================
+# Atende POST em /v1/chat/completions (SDK da OpenAI) e
+# /openai/v1/chat/completions (SDK da Groq), com ou sem stream (SSE). A
+# latência até o primeiro token e a velocidade de geração (tokens/s) são
+# configuráveis, então o tempo medido no benchmark é o do analisador e não o
+# da internet. A resposta segue o formato ✅/❌/💡 (ou o JSON de vereditos
+# quando response_format é pedido) e informa o uso de tokens, estimado em
+# 4 caracteres por token. Uso avulso:
+#   python bench/mock_llm.py --port 8765 --latency 0.5 --tokens-per-second 80
+# e depois OPENAI_BASE_URL=http://127.0.0.1:8765/v1 GROQ_BASE_URL=http://127.0.0.1:8765
+
+CHARS_PER_TOKEN = 4
+
+TEXT_RESPONSE = (
+    "REQUISITOS\n"
+    "✅ (1) Identificação das partes — \"CONTRATANTE: ... inscrita no CNPJ\"\n"
+    "✅ (2) Objeto — \"O presente contrato tem por objeto a prestação\"\n"
+    "✅ (3) Preço e Pagamento — \"valor mensal de R$\"\n"
+    "✅ (4) Rescisão — \"aviso prévio por escrito com antecedência mínima de 30 (trinta) dias\"\n"
+    "❌ (5) Garantias/Vícios\n"
+    "\nSUGESTÕES DE MELHORIA\n"
+    "💡 (5) Incluir prazo de garantia para vícios ocultos.\n"
+)
+
+JSON_RESPONSE = json.dumps({"verdicts": [
+    {"id": "1", "status": "atendido", "evidencia": "CONTRATANTE: ... inscrita no CNPJ", "clausula": "1ª", "sugestao": ""},
+    {"id": "2", "status": "atendido", "evidencia": "tem por objeto a prestação", "clausula": "2ª", "sugestao": ""},
+    {"id": "5", "status": "nao_atendido", "evidencia": "", "clausula": "", "sugestao": "Incluir prazo de garantia."},
+]}, ensure_ascii=False)
+
+
+class MockSettings:
+    def __init__(self, latency: float = 0.2, tokens_per_second: float = 200.0, jitter: float = 0.0,
+                 error_rate: float = 0.0):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.requests = 0
+        self.prompt_tokens = 0
+        self._lock = threading.Lock()
+
+    def delay(self) -> float:
+        return max(0.0, self.latency + random.uniform(-self.jitter, self.jitter))
+
+
+def _pieces(text: str) -> list:
+    # Pedaços de ~1 token, como num stream de verdade
+    return [text[i:i + CHARS_PER_TOKEN] for i in range(0, len(text), CHARS_PER_TOKEN)]
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    settings = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, payload: dict):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("x-ratelimit-remaining-requests", "10000")
+        self.send_header("x-ratelimit-remaining-tokens", "10000000")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _chunk(self, data: bytes):
+        self.wfile.write(b"%x\r\n" % len(data) + data + b"\r\n")
+        self.wfile.flush()
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": "not found"}})
+            return
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        settings = self.settings
+        prompt_chars = sum(len(message.get("content") or "") for message in request.get("messages", []))
+        prompt_tokens = -(-prompt_chars // CHARS_PER_TOKEN)
+        with settings._lock:
+            settings.requests += 1
+            settings.prompt_tokens += prompt_tokens
+        if settings.error_rate and random.random() < settings.error_rate:
+            self._send_json(503, {"error": {"message": "mock overloaded", "type": "server_error"}})
+            return
+        text = JSON_RESPONSE if request.get("response_format") else TEXT_RESPONSE
+        pieces = _pieces(text)
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(pieces),
+                 "total_tokens": prompt_tokens + len(pieces)}
+        per_token = 1.0 / settings.tokens_per_second if settings.tokens_per_second else 0.0
+        model = request.get("model", "mock")
+        time.sleep(settings.delay())
+
+        if not request.get("stream"):
+            time.sleep(per_token * len(pieces))
+            self._send_json(200, {
+                "id": "mock", "object": "chat.completion", "created": int(time.time()), "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                "usage": usage,
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def event(choices: list, **extra) -> bytes:
+            payload = {"id": "mock", "object": "chat.completion.chunk", "created": int(time.time()),
+                       "model": model, "choices": choices, **extra}
+            return b"data: " + json.dumps(payload, ensure_ascii=False).encode("utf-8") + b"\n\n"
+
+        for piece in pieces:
+            self._chunk(event([{"index": 0, "delta": {"content": piece}, "finish_reason": None}]))
+            time.sleep(per_token)
+        # Uso no último pedaço: `usage` (OpenAI, com include_usage) e `x_groq.usage` (Groq)
+        self._chunk(event([{"index": 0, "delta": {}, "finish_reason": "stop"}], usage=usage, x_groq={"usage": usage}))
+        self._chunk(b"data: [DONE]\n\n")
+        self._chunk(b"")
+
+
+def start_mock_server(port: int = 0, settings: MockSettings = None):
+    """
+    Sobe o servidor numa thread de fundo. Retorna (servidor, settings); a
+    porta escolhida fica em servidor.server_address[1].
+    """
+    settings = settings or MockSettings()
+    handler = type("MockHandler", (_Handler,), {"settings": settings})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="mock-llm", daemon=True).start()
+    return server, settings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor LLM falso compatível com OpenAI/Groq.")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.2, help="segundos até o primeiro token")
+    parser.add_argument("--tokens-per-second", type=float, default=200.0, help="velocidade de geração (0 = instantâneo)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="variação aleatória (±s) da latência")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fração de respostas 503")
+    args = parser.parse_args()
+    server, _ = start_mock_server(args.port, MockSettings(args.latency, args.tokens_per_second, args.jitter, args.error_rate))
+    print(f"Mock LLM em http://127.0.0.1:{server.server_address[1]} (Ctrl+C para sair)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
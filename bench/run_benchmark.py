@@ -0,0 +1,263 @@
+﻿import io
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import resource
+import tempfile
+import importlib
+import subprocess
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+# ================================================
+# Benchmark do analisador
+# ================================================
+# Uso:
+#   python bench/run_benchmark.py --pages 5 50 500 --repeat 5
+#   python bench/run_benchmark.py --provider groq --strategy per_requirement --latency 1.0
+#   python bench/compare.py bench/results/antes.json bench/results/depois.json
+#
+# Para cada tamanho de contrato sintético (bench/contracts.py) mede, com o
+# código de qa.py e um servidor LLM falso local (bench/mock_llm.py):
+#   - process_pdf sem cache (extração) e com cache;
+#   - leitura dos requisitos, com o registro recém-criado e já carregado;
+#   - generate_response (sempre com force_refresh), em série ou com --concurrency.
+# O resultado (percentis de latência, vazão e pico de memória Python via
+# tracemalloc) vai para um JSON com o commit atual, para comparar execuções.
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_DIR = os.path.join(ROOT, "bench")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, BENCH_DIR)
+
+from contracts import ensure_contract, DEFAULT_DATA_DIR
+from mock_llm import start_mock_server, MockSettings
+
+PERCENTILES = (0.50, 0.95, 0.99)
+
+
+def percentile(values: list, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def summarize(step: str, pages: int, durations: list, wall: float = None, units: float = 1, **extra) -> dict:
+    """
+    units: itens processados por execução (páginas, análises...), para a vazão.
+    wall: tempo de parede total, quando as execuções foram concorrentes.
+    """
+    wall = wall if wall is not None else sum(durations)
+    summary = {
+        "step": step,
+        "pages": pages,
+        "runs": len(durations),
+        "mean_s": round(sum(durations) / len(durations), 4),
+        "min_s": round(min(durations), 4),
+        "max_s": round(max(durations), 4),
+        "throughput_per_s": round(len(durations) * units / wall, 3) if wall else None,
+    }
+    for q in PERCENTILES:
+        summary[f"p{round(q * 100)}_s"] = round(percentile(durations, q), 4)
+    summary.update(extra)
+    return summary
+
+
+def timed(function, *args, **kwargs) -> tuple:
+    started = time.perf_counter()
+    result = function(*args, **kwargs)
+    return time.perf_counter() - started, result
+
+
+def peak_memory_mb(function, *args, **kwargs) -> float:
+    # Só a memória alocada pelo Python neste processo (não conta os workers de extração)
+    tracemalloc.start()
+    try:
+        function(*args, **kwargs)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return round(peak / (1024 * 1024), 2)
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "desconhecido"
+
+
+def prepare_environment(args, workdir: str):
+    """
+    Caches e logs num diretório temporário e provedores apontando para o mock.
+    Precisa rodar antes de importar qa.py.
+    """
+    server, settings = start_mock_server(0, MockSettings(args.latency, args.tokens_per_second, args.jitter))
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    os.environ.update({
+        "STREAMLIT_LOGGER_LEVEL": "error",
+        "OPENAI_BASE_URL": f"{base}/v1",
+        "GROQ_BASE_URL": base,
+        "OPENAI_API_KEY": os.environ.get("OPENAI_API_KEY") or "bench",
+        "GROQ_API_KEY": os.environ.get("GROQ_API_KEY") or "bench",
+        # Os limites de taxa reais mediriam o controle de taxa, e não o analisador
+        "OPENAI_RPM": "1000000", "OPENAI_TPM": "1000000000",
+        "GROQ_RPM": "1000000", "GROQ_TPM": "1000000000",
+        "PDF_CACHE_DIR": os.path.join(workdir, "pdf_text"),
+        "USAGE_LOG_FILE": os.path.join(workdir, "usage.jsonl"),
+        "METRICS_PATH": os.path.join(workdir, "metrics.sqlite"),
+        "METRICS_PROM_FILE": os.path.join(workdir, "metrics.prom"),
+        "CONTRACT_VERSIONS_PATH": os.path.join(workdir, "contract_versions.sqlite"),
+        "JOBS_PATH": os.path.join(workdir, "jobs.sqlite"),
+        "USERS_PATH": os.path.join(workdir, "users.sqlite"),
+    })
+    return server, settings
+
+
+def bench_size(qa, args, pages: int, contract: str) -> list:
+    path = ensure_contract(pages, args.data_dir)
+    with open(path, "rb") as f:
+        data = f.read()
+    results = []
+
+    def data_file():
+        return io.BytesIO(data)
+
+    def extract_cold():
+        shutil.rmtree(os.environ["PDF_CACHE_DIR"], ignore_errors=True)
+        qa.get_pdf_cache.clear()
+        return qa.process_pdf(data_file())
+
+    durations = []
+    for _ in range(args.repeat):
+        duration, text = timed(extract_cold)
+        durations.append(duration)
+    results.append(summarize(
+        "process_pdf", pages, durations, units=pages, bytes=len(data), chars=len(text),
+        peak_python_mb=None if args.no_memory else peak_memory_mb(extract_cold),
+    ))
+
+    durations = [timed(qa.process_pdf, data_file())[0] for _ in range(args.repeat)]
+    results.append(summarize("process_pdf_cached", pages, durations, units=pages))
+
+    contract_id = contract.split("-")[0].strip()
+
+    def load_cold():
+        qa.get_requirements_registry.clear()
+        return qa.load_contract_requirements(contract_id)
+
+    durations = [timed(load_cold)[0] for _ in range(args.repeat)]
+    rows = qa.load_contract_requirements(contract_id)
+    results.append(summarize(
+        "requirements_load", pages, durations, requirements=len(rows),
+        peak_python_mb=None if args.no_memory else peak_memory_mb(load_cold),
+    ))
+    durations = [timed(qa.load_contract_requirements, contract_id)[0] for _ in range(args.repeat)]
+    results.append(summarize("requirements_load_cached", pages, durations))
+
+    llm = qa.initialize_embeddings(args.provider)
+
+    def analyze():
+        timings = {}
+        try:
+            response = qa.generate_response(
+                text, contract, llm, args.mode, force_refresh=True, strategy=args.strategy,
+                on_partial=lambda partial: None, timings=timings, output_format=args.format,
+            )
+        except qa.AnalysisError as e:
+            # Conta nos erros abaixo sem interromper a medição
+            response = str(e)
+        return timings, response
+
+    # Uma execução de aquecimento: índices BM25, tokenizador e conexões HTTP
+    analyze()
+    runs = args.repeat * args.concurrency
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        outcomes = list(pool.map(lambda _: timed(analyze), range(runs)))
+    wall = time.perf_counter() - started
+    durations = [duration for duration, _ in outcomes]
+    timings = [outcome[1][0] for outcome in outcomes]
+    ttfts = [t["ttft"] for t in timings if t.get("ttft") is not None]
+    results.append(summarize(
+        "generate_response", pages, durations, wall=wall,
+        concurrency=args.concurrency,
+        strategies=sorted({t.get("strategy") for t in timings}),
+        llm_calls_per_run=timings[-1].get("usage", {}).get("calls"),
+        prompt_tokens_per_run=timings[-1].get("usage", {}).get("prompt_tokens"),
+        ttft_p50_s=round(percentile(ttfts, 0.5), 4) if ttfts else None,
+        # Em erro (AnalysisError), nenhuma chamada entra no uso
+        errors=sum(1 for t in timings if not t.get("usage", {}).get("calls")),
+        peak_python_mb=None if args.no_memory else peak_memory_mb(analyze),
+    ))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de extração, requisitos e análise com LLM falso.")
+    parser.add_argument("--pages", type=int, nargs="+", default=[5, 50, 500])
+    parser.add_argument("--repeat", type=int, default=5, help="execuções medidas por etapa")
+    parser.add_argument("--concurrency", type=int, default=1, help="análises simultâneas em generate_response")
+    parser.add_argument("--provider", choices=["openai", "groq"], default="openai")
+    parser.add_argument("--mode", choices=["Apenas Requisitos", "Completo"], default="Apenas Requisitos")
+    parser.add_argument("--strategy", default="auto",
+                        choices=["auto", "single", "map_reduce", "per_requirement", "relevant_clauses"])
+    parser.add_argument("--format", choices=["text", "json"], default="text")
+    parser.add_argument("--contract", default="5 - Contrato de Consumo ou prestação de serviços",
+                        help="opção de contrato como na tela (o ID antes do hífen escolhe o CSV)")
+    parser.add_argument("--latency", type=float, default=0.2, help="latência do LLM falso até o 1º token (s)")
+    parser.add_argument("--tokens-per-second", type=float, default=200.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--data-dir", default=DEFAULT_DATA_DIR)
+    parser.add_argument("--no-memory", action="store_true", help="não medir o pico de memória (mais rápido)")
+    parser.add_argument("--output", help="arquivo JSON (padrão: bench/results/<commit>-<data>.json)")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench-")
+    server, settings = prepare_environment(args, workdir)
+    # qa.py lê users.csv e os CSVs de requisitos com caminhos relativos
+    os.chdir(ROOT)
+    import_seconds, qa = timed(importlib.import_module, "qa")
+
+    results = []
+    try:
+        for pages in args.pages:
+            print(f"{pages} páginas...", flush=True)
+            results.extend(bench_size(qa, args, pages, args.contract))
+    finally:
+        server.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    commit = git_commit()
+    report = {
+        "meta": {
+            "commit": commit,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "import_qa_s": round(import_seconds, 3),
+            "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+            "mock_requests": settings.requests,
+            "settings": {k: v for k, v in vars(args).items() if k not in ("output", "data_dir")},
+        },
+        "results": results,
+    }
+    output = args.output or os.path.join(BENCH_DIR, "results", f"{commit}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    for entry in results:
+        print(f"{entry['step']:<26} {entry['pages']:>4} pág.  p50 {entry['p50_s']:.4f}s  "
+              f"p95 {entry['p95_s']:.4f}s  vazão {entry['throughput_per_s']}/s")
+    print(f"Resultado em {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+﻿import re
+import math
+import heapq
+import bisect
+import functools
+import unicodedata
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from pdf_extract import PAGE_SEPARATOR
+
+# ================================================
+# Segmentação em cláusulas e índice BM25
+# ================================================
+# Depois de process_pdf, o texto é dividido em cláusulas/parágrafos (CLÁUSULA,
+# §, Parágrafo, itens numerados), guardando página e posição de cada trecho.
+# Sobre esses trechos é montado um índice invertido BM25 em memória: qualquer
+# requisito busca as cláusulas mais relevantes em milissegundos, e os prompts
+# levam só essas cláusulas em vez do documento inteiro.
+
+MAX_CLAUSE_CHARS = 2000
+
+STOPWORDS = {
+    "a", "o", "as", "os", "de", "da", "do", "das", "dos", "e", "ou", "em", "no", "na",
+    "nos", "nas", "um", "uma", "para", "por", "com", "sem", "que", "se", "ao", "aos",
+    "etc", "art", "arts", "cdc", "sobre", "como", "ser", "caso", "entre", "sua", "seu",
+}
+
+# Tamanho máximo de uma linha de título com número simples ("1. DO OBJETO"):
+# linhas maiores que começam com número ("2024. O contratante...") são texto
+HEADING_MAX_CHARS = 80
+
+# Numeral romano de duas letras ou mais (II, IV, XII...). Uma letra sozinha
+# só abre cláusula depois de uma palavra-chave (CAPÍTULO I, Seção V): "C. Silva
+# assinou" e "L - teste" são texto
+_ROMAN = r"(?=[IVXLC]{2})C{0,3}(XC|XL|L?X{0,3})(IX|IV|V?I{0,3})"
+
+HEADING_PATTERN = re.compile(
+    r"^\s*("
+    r"(?i:CL[ÁA]USULA)\b"                                          # CLÁUSULA PRIMEIRA / Cláusula 3ª
+    r"|(?i:ART(IGO|\.))\s*\d+"                                     # Art. 5º / Artigo 12
+    r"|(?i:CAP[ÍI]TULO|SE[ÇC][ÃA]O|T[ÍI]TULO)\s+([IVXLC]+|\d+)\b"  # CAPÍTULO I / Seção 2
+    r"|§\s*\d*"                                                    # § 1º
+    r"|(?i:PAR[ÁA]GRAFO)\b"                                        # Parágrafo único
+    r"|\d+(\.\d+)+\s*[\.\)\-–]\s+\S"                               # 2.1 - / 3.4.1.
+    r"|\d{1,3}\s*\)\s+\S"                                          # 3)
+    rf"|\d{{1,3}}\s*[\.\-–]\s+\S.{{0,{HEADING_MAX_CHARS}}}$"       # 1. DO OBJETO (linha curta)
+    rf"|{_ROMAN}\s*[\.\)\-–]\s+\S"                                 # IV - / II) (só maiúsculas)
+    r"|(?i:[a-z])\)\s+\S"                                          # a) b)
+    r")"
+)
+
+
+def normalize_terms(text: str) -> list:
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return [t for t in re.findall(r"[a-z0-9]+", text) if len(t) > 2 and t not in STOPWORDS]
+
+
+@dataclass
+class Clause:
+    position: int
+    title: str
+    text: str
+    start: int
+    end: int
+    page: int
+
+    def render(self) -> str:
+        return f"[{self.title} | pág. {self.page}]\n{self.text}"
+
+
+def segment_clauses(text: str, max_chars: int = MAX_CLAUSE_CHARS) -> list:
+    """
+    Divide o texto em cláusulas. Cada linha de título (CLÁUSULA, §, item
+    numerado...) abre um novo trecho; trechos longos demais são quebrados em
+    parágrafos. start/end são posições de caractere em `text`.
+    """
+    flat = text.replace(PAGE_SEPARATOR, "\n")
+    page_breaks = [m.start() for m in re.finditer(PAGE_SEPARATOR, text)]
+    clauses = []
+    segment_start = None
+    segment_lines = []
+
+    def flush():
+        if segment_start is None:
+            return
+        body = "\n".join(segment_lines).strip()
+        if not body:
+            return
+        first_line = body.split("\n", 1)[0].strip()
+        title = first_line[:80] if HEADING_PATTERN.match(first_line) else f"Trecho {len(clauses) + 1}"
+        # Quebra trechos longos mantendo o mesmo título
+        offset = segment_start
+        for piece in _split_long(body, max_chars):
+            start = flat.find(piece[:40], offset)
+            start = start if start >= 0 else offset
+            page = bisect.bisect_right(page_breaks, start) + 1
+            clauses.append(Clause(len(clauses), title, piece, start, start + len(piece), page))
+            offset = start + len(piece)
+
+    position = 0
+    for line in flat.split("\n"):
+        line_start = position
+        position += len(line) + 1
+        if HEADING_PATTERN.match(line):
+            flush()
+            segment_start = line_start
+            segment_lines = [line]
+        else:
+            if segment_start is None:
+                segment_start = line_start
+            segment_lines.append(line)
+    flush()
+    return clauses
+
+
+def _split_long(body: str, max_chars: int) -> list:
+    if len(body) <= max_chars:
+        return [body]
+    pieces = []
+    current = ""
+    for paragraph in body.split("\n"):
+        if current and len(current) + len(paragraph) + 1 > max_chars:
+            pieces.append(current)
+            current = ""
+        while len(paragraph) > max_chars:
+            pieces.append(paragraph[:max_chars])
+            paragraph = paragraph[max_chars:]
+        current = f"{current}\n{paragraph}" if current else paragraph
+    if current.strip():
+        pieces.append(current)
+    return [p.strip() for p in pieces if p.strip()]
+
+
+class BM25Index:
+    def __init__(self, documents: list, k1: float = 1.5, b: float = 0.75):
+        """
+        documents: lista de listas de termos (já normalizados).
+        """
+        self.k1 = k1
+        self.b = b
+        self.doc_lengths = [len(doc) for doc in documents]
+        self.avg_length = (sum(self.doc_lengths) / len(documents)) if documents else 0.0
+        self.postings = defaultdict(list)  # termo -> [(documento, frequência)]
+        for doc_id, doc in enumerate(documents):
+            for term, freq in Counter(doc).items():
+                self.postings[term].append((doc_id, freq))
+        total = len(documents)
+        self.idf = {
+            term: math.log(1 + (total - len(posting) + 0.5) / (len(posting) + 0.5))
+            for term, posting in self.postings.items()
+        }
+
+    def search(self, query_terms: list, k: int) -> list:
+        """
+        Retorna até k pares (documento, pontuação), do mais relevante ao menos.
+        """
+        scores = defaultdict(float)
+        for term in set(query_terms):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for doc_id, freq in self.postings[term]:
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_id] / (self.avg_length or 1))
+                scores[doc_id] += idf * freq * (self.k1 + 1) / (freq + norm)
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+
+class ClauseIndex:
+    def __init__(self, text: str):
+        self.clauses = segment_clauses(text)
+        self.bm25 = BM25Index([normalize_terms(c.text) for c in self.clauses])
+
+    def search(self, query: str, k: int = 5) -> list:
+        """
+        As k cláusulas mais relevantes para a consulta, na ordem em que aparecem no contrato.
+        """
+        hits = self.bm25.search(normalize_terms(query), k)
+        return sorted((self.clauses[doc_id] for doc_id, _ in hits), key=lambda c: c.position)
+
+    def search_many(self, queries: list, k: int = 5) -> list:
+        """
+        União das cláusulas relevantes para várias consultas, sem repetição e em ordem.
+        """
+        found = {}
+        for query in queries:
+            for clause in self.search(query, k):
+                found[clause.position] = clause
+        return [found[position] for position in sorted(found)]
+
+
+def requirement_query(row: dict) -> str:
+    return f"{row.get('tema', '')} {row.get('requisito', '')}"
+
+
+@functools.lru_cache(maxsize=32)
+def get_clause_index(text: str) -> ClauseIndex:
+    # Um índice por texto de contrato, reaproveitado por todos os modos de análise
+    return ClauseIndex(text)
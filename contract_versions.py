@@ -0,0 +1,373 @@
+﻿import os
+import re
+import time
+import difflib
+import hashlib
+import sqlite3
+import threading
+from dataclasses import dataclass, field
+from concurrent.futures import ThreadPoolExecutor
+from clause_index import segment_clauses, get_clause_index, requirement_query
+from map_reduce import build_map_prompt, parse_map_output, STATUS_FOUND, STATUS_MISSING
+from requirements_registry import render_requirements
+from tokens import split_by_tokens
+
+# ================================================
+# Reanálise incremental de novas versões de um contrato
+# ================================================
+# Cada versão analisada fica guardada (SQLite) com a impressão digital de cada
+# cláusula e o veredito de cada requisito, junto com a cláusula que serviu de
+# evidência. Numa nova versão do mesmo contrato (mesmo identificador informado
+# pelo usuário), o texto é comparado cláusula a cláusula com a versão anterior
+# e só as cláusulas novas ou alteradas vão para o modelo:
+#   - requisito atendido cuja cláusula de evidência não mudou: veredito reaproveitado;
+#   - requisito atendido cuja evidência foi alterada/removida: reavaliado;
+#   - requisito não atendido: reavaliado só contra as cláusulas novas/alteradas.
+# O relatório final junta tudo e marca o que mudou em relação à versão anterior.
+
+DEFAULT_STORE_PATH = os.getenv("CONTRACT_VERSIONS_PATH", os.path.join(".cache", "contract_versions.sqlite"))
+DEFAULT_CHUNK_TOKENS = 3000
+DEFAULT_MAX_CONCURRENCY = 4
+# Cláusulas de contexto enviadas para um requisito que perdeu a evidência
+CONTEXT_CLAUSES = 3
+
+# Numeração no início da cláusula ("CLÁUSULA SEXTA", "§ 2º", "3.1 -"): fica fora
+# da impressão digital, para que inserir uma cláusula não "altere" as seguintes
+_NUMBERING = re.compile(
+    r"^\s*(CL[ÁA]USULA\s+\S+|§\s*\d+\S*|PAR[ÁA]GRAFO\s+\S+|\d+(\.\d+)*\s*[\.\)\-–]|[IVXLC]+\s*[\.\)\-–]|[a-z]\))",
+    re.IGNORECASE,
+)
+
+
+def clause_fingerprint(text: str) -> str:
+    body = _NUMBERING.sub("", text, count=1)
+    normalized = " ".join(body.lower().split())
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()[:32]
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class Verdict:
+    found: bool
+    evidence: str = ""
+    clause: str = None  # impressão digital da cláusula de evidência
+
+
+@dataclass
+class StoredVersion:
+    version: int
+    contract_id: str
+    requirements_digest: str
+    text_hash: str
+    clauses: list  # [(impressão digital, título, página)]
+    verdicts: dict  # id do requisito -> Verdict
+
+
+@dataclass
+class ClauseDiff:
+    changed: list = field(default_factory=list)  # cláusulas que substituíram outra da versão anterior
+    added: list = field(default_factory=list)
+    removed: list = field(default_factory=list)  # (título, página) na versão anterior, sem substituta
+    unchanged: int = 0
+
+
+# ================================================
+# Armazenamento das versões
+# ================================================
+class VersionStore:
+    def __init__(self, path: str = DEFAULT_STORE_PATH):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS versions (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                document_key TEXT NOT NULL,
+                version INTEGER NOT NULL,
+                contract_id TEXT NOT NULL,
+                requirements_digest TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                created REAL NOT NULL,
+                UNIQUE (document_key, version)
+            );
+            CREATE TABLE IF NOT EXISTS clauses (
+                version_id INTEGER NOT NULL,
+                position INTEGER NOT NULL,
+                fingerprint TEXT NOT NULL,
+                title TEXT,
+                page INTEGER
+            );
+            CREATE TABLE IF NOT EXISTS verdicts (
+                version_id INTEGER NOT NULL,
+                requirement_id TEXT NOT NULL,
+                found INTEGER NOT NULL,
+                evidence TEXT,
+                clause TEXT
+            );
+            CREATE INDEX IF NOT EXISTS clauses_version ON clauses (version_id);
+            CREATE INDEX IF NOT EXISTS verdicts_version ON verdicts (version_id);
+        """)
+        self._conn.commit()
+
+    def latest(self, document_key: str) -> StoredVersion:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, version, contract_id, requirements_digest, text_hash FROM versions "
+                "WHERE document_key = ? ORDER BY version DESC LIMIT 1",
+                (document_key,),
+            ).fetchone()
+            if row is None:
+                return None
+            version_id = row[0]
+            clauses = self._conn.execute(
+                "SELECT fingerprint, title, page FROM clauses WHERE version_id = ? ORDER BY position",
+                (version_id,),
+            ).fetchall()
+            verdicts = {
+                requirement_id: Verdict(bool(found), evidence or "", clause)
+                for requirement_id, found, evidence, clause in self._conn.execute(
+                    "SELECT requirement_id, found, evidence, clause FROM verdicts WHERE version_id = ?",
+                    (version_id,),
+                )
+            }
+        return StoredVersion(row[1], row[2], row[3], row[4], clauses, verdicts)
+
+    def save(self, document_key: str, contract_id: str, requirements_digest: str, contract_text: str,
+             clauses: list, verdicts: dict) -> int:
+        """
+        Grava uma nova versão e retorna o número dela (1, 2, 3...).
+        """
+        with self._lock, self._conn:
+            (last,) = self._conn.execute(
+                "SELECT COALESCE(MAX(version), 0) FROM versions WHERE document_key = ?", (document_key,)
+            ).fetchone()
+            cursor = self._conn.execute(
+                "INSERT INTO versions (document_key, version, contract_id, requirements_digest, text_hash, created) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (document_key, last + 1, contract_id, requirements_digest, text_hash(contract_text), time.time()),
+            )
+            version_id = cursor.lastrowid
+            self._conn.executemany(
+                "INSERT INTO clauses (version_id, position, fingerprint, title, page) VALUES (?, ?, ?, ?, ?)",
+                [(version_id, c.position, clause_fingerprint(c.text), c.title, c.page) for c in clauses],
+            )
+            self._conn.executemany(
+                "INSERT INTO verdicts (version_id, requirement_id, found, evidence, clause) VALUES (?, ?, ?, ?, ?)",
+                [(version_id, req_id, int(v.found), v.evidence, v.clause) for req_id, v in verdicts.items()],
+            )
+        return last + 1
+
+
+# ================================================
+# Comparação e análise
+# ================================================
+def diff_clauses(previous: StoredVersion, clauses: list) -> ClauseDiff:
+    old = [fingerprint for fingerprint, _, _ in previous.clauses]
+    new = [clause_fingerprint(c.text) for c in clauses]
+    diff = ClauseDiff()
+    matcher = difflib.SequenceMatcher(None, old, new, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            diff.unchanged += i2 - i1
+            continue
+        # Num trecho substituído, as cláusulas são pareadas em ordem; as que sobram
+        # de um lado ou de outro são novas ou removidas
+        paired = min(i2 - i1, j2 - j1)
+        diff.changed.extend(clauses[j1:j1 + paired])
+        diff.added.extend(clauses[j1 + paired:j2])
+        diff.removed.extend((title, page) for _, title, page in previous.clauses[i1 + paired:i2])
+    return diff
+
+
+def _locate_evidence(contract_text: str, clauses: list, evidence: str):
+    """
+    Impressão digital da cláusula que contém a evidência citada pelo modelo.
+    """
+    if not evidence:
+        return None
+    quote = " ".join(evidence.strip('"“” ').lower().split())
+    for clause in clauses:
+        if quote and quote in " ".join(clause.text.lower().split()):
+            return clause_fingerprint(clause.text)
+    hits = get_clause_index(contract_text).search(evidence, 1)
+    return clause_fingerprint(hits[0].text) if hits else None
+
+
+def _run_map(texts: list, rows: list, contract_id: str, call, model: str,
+             chunk_tokens: int, max_concurrency: int) -> list:
+    # Mesmo formato de linhas da análise map-reduce (REQ|id|✅/❌|evidência)
+    requirements_text = render_requirements(rows)
+    chunks = [chunk for text in texts for chunk in split_by_tokens(text, chunk_tokens, model)]
+    if not chunks:
+        return []
+    prompts = [
+        build_map_prompt(chunk, i + 1, len(chunks), contract_id, requirements_text, "Apenas Requisitos")
+        for i, chunk in enumerate(chunks)
+    ]
+    with ThreadPoolExecutor(max_workers=min(max_concurrency, len(prompts))) as pool:
+        return [parse_map_output(output) for output in pool.map(call, prompts)]
+
+
+def _verdicts_from(findings: list, rows: list, contract_text: str, clauses: list) -> dict:
+    verdicts = {}
+    for row in rows:
+        req_id = str(row.get("id")).strip()
+        verdict = Verdict(False)
+        for f in findings:
+            found, evidence = f["requirements"].get(req_id, (False, ""))
+            if found:
+                clause = _locate_evidence(contract_text, clauses, evidence)
+                if clause is None:
+                    # Sem citação: a cláusula mais relevante para o requisito serve de referência
+                    hits = get_clause_index(contract_text).search(requirement_query(row), 1)
+                    clause = clause_fingerprint(hits[0].text) if hits else None
+                verdict = Verdict(True, evidence, clause)
+                break
+        verdicts[req_id] = verdict
+    return verdicts
+
+
+@dataclass
+class IncrementalResult:
+    report: str
+    version: int
+    previous_version: int = None
+    clauses_sent: int = 0
+    requirements_reviewed: int = 0
+
+
+def analyze_incremental(contract_text: str, rows: list, contract_id: str, document_key: str,
+                        requirements_digest: str, call, model: str, store: VersionStore,
+                        full: bool = False, chunk_tokens: int = DEFAULT_CHUNK_TOKENS,
+                        max_concurrency: int = DEFAULT_MAX_CONCURRENCY) -> IncrementalResult:
+    """
+    Analisa (só "Apenas Requisitos") uma versão do contrato `document_key`.
+    call: função que recebe um prompt e devolve o texto da resposta do LLM.
+    requirements_digest: identifica os requisitos e o prompt usados; se mudarem,
+                         a versão anterior não é reaproveitada.
+    full: ignora a versão anterior e analisa o texto inteiro.
+    """
+    clauses = segment_clauses(contract_text)
+    previous = None if full else store.latest(document_key)
+    if previous is not None and (previous.contract_id != contract_id
+                                 or previous.requirements_digest != requirements_digest):
+        previous = None
+
+    if previous is None:
+        findings = _run_map([contract_text], rows, contract_id, call, model, chunk_tokens, max_concurrency)
+        verdicts = _verdicts_from(findings, rows, contract_text, clauses)
+        version = store.save(document_key, contract_id, requirements_digest, contract_text, clauses, verdicts)
+        report = render_report(rows, verdicts, None, None, findings, document_key, version, None)
+        return IncrementalResult(report, version, None, len(clauses), len(rows))
+
+    if previous.text_hash == text_hash(contract_text):
+        # Mesmo texto da última versão: nada a reanalisar nem a gravar
+        report = render_report(rows, previous.verdicts, None, ClauseDiff(unchanged=len(clauses)), [],
+                               document_key, previous.version, previous.version)
+        return IncrementalResult(report, previous.version, previous.version)
+
+    diff = diff_clauses(previous, clauses)
+    current = {clause_fingerprint(c.text) for c in clauses}
+    modified = diff.changed + diff.added
+    index = get_clause_index(contract_text)
+
+    reviewed, reused = [], {}
+    context = {}
+    for row in rows:
+        req_id = str(row.get("id")).strip()
+        old = previous.verdicts.get(req_id)
+        if old is not None and old.found and old.clause in current:
+            reused[req_id] = old
+            continue
+        if old is None or old.found:
+            # Requisito novo ou evidência alterada/removida: leva também as cláusulas mais próximas
+            for clause in index.search(requirement_query(row), CONTEXT_CLAUSES):
+                context[clause.position] = clause
+        if modified or old is None or old.found:
+            reviewed.append(row)
+        else:
+            reused[req_id] = old
+
+    for clause in modified:
+        context[clause.position] = clause
+    sent = [context[position] for position in sorted(context)]
+
+    findings = []
+    if reviewed and sent:
+        findings = _run_map(["\n\n".join(c.render() for c in sent)], reviewed, contract_id, call, model,
+                            chunk_tokens, max_concurrency)
+    verdicts = dict(reused)
+    verdicts.update(_verdicts_from(findings, reviewed, contract_text, clauses))
+
+    version = store.save(document_key, contract_id, requirements_digest, contract_text, clauses, verdicts)
+    report = render_report(rows, verdicts, previous.verdicts, diff, findings, document_key, version,
+                           previous.version, reviewed={str(r.get("id")).strip() for r in reviewed})
+    return IncrementalResult(report, version, previous.version, len(sent), len(reviewed))
+
+
+# ================================================
+# Relatório
+# ================================================
+def _describe(clause) -> str:
+    return f"{clause.title} (pág. {clause.page})"
+
+
+def render_report(rows: list, verdicts: dict, previous_verdicts: dict, diff: ClauseDiff, findings: list,
+                  document_key: str, version: int, previous_version: int, reviewed: set = None) -> str:
+    lines = []
+    if previous_version is None:
+        lines.append(f'VERSÃO {version} de "{document_key}" (primeira análise, texto completo)')
+    elif previous_version == version:
+        lines.append(f'VERSÃO {version} de "{document_key}": texto idêntico à última análise, nada reanalisado')
+    else:
+        lines.append(f'VERSÃO {version} de "{document_key}" (comparada com a versão {previous_version})')
+        lines.append(
+            f"Cláusulas alteradas: {len(diff.changed)} | novas: {len(diff.added)} | "
+            f"removidas: {len(diff.removed)} | inalteradas: {diff.unchanged}"
+        )
+    lines.append("")
+
+    lines.append("REQUISITOS")
+    for row in rows:
+        req_id = str(row.get("id")).strip()
+        verdict = verdicts.get(req_id, Verdict(False))
+        line = f"{STATUS_FOUND if verdict.found else STATUS_MISSING} ({req_id}) {row.get('tema')}"
+        if verdict.evidence:
+            line += f' — "{verdict.evidence}"'
+        if previous_verdicts is not None and previous_version != version:
+            old = previous_verdicts.get(req_id)
+            if old is None:
+                line += " 🆕 requisito novo"
+            elif old.found != verdict.found:
+                before = STATUS_FOUND if old.found else STATUS_MISSING
+                line += f" ✏️ mudou ({before} → {STATUS_FOUND if verdict.found else STATUS_MISSING})"
+            elif reviewed and req_id in reviewed:
+                line += " (reavaliado, sem mudança)"
+            else:
+                line += " (mantido da versão anterior)"
+        lines.append(line)
+
+    if diff is not None and (diff.changed or diff.added or diff.removed):
+        lines.append("")
+        lines.append("ALTERAÇÕES EM RELAÇÃO À VERSÃO ANTERIOR")
+        lines.extend(f"✏️ alterada: {_describe(c)}" for c in diff.changed)
+        lines.extend(f"🆕 nova: {_describe(c)}" for c in diff.added)
+        lines.extend(f"🗑️ removida: {title} (pág. {page})" for title, page in diff.removed)
+
+    suggestions = []
+    for f in findings:
+        for suggestion in f["suggestions"]:
+            if suggestion not in suggestions:
+                suggestions.append(suggestion)
+    if suggestions:
+        lines.append("")
+        lines.append("SUGESTÕES DE MELHORIA")
+        lines.extend(f"💡 {suggestion}" for suggestion in suggestions)
+
+    return "\n".join(lines)
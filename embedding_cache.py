@@ -0,0 +1,124 @@
+﻿import os
+import hashlib
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+# ================================================
+# Camada de embeddings com cache persistente
+# ================================================
+# Envolve qualquer Embeddings do LangChain (ex.: OpenAIEmbeddings). Os textos
+# são normalizados e identificados por hash; repetidos na mesma chamada são
+# enviados uma vez só, e os que faltam no cache seguem em lotes do maior
+# tamanho aceito pelo cliente, vários lotes ao mesmo tempo. Os vetores ficam
+# num SQLite local como float32, então o mesmo texto nunca é embutido duas vezes.
+
+DEFAULT_STORE_PATH = os.getenv("EMBEDDING_CACHE_PATH", os.path.join(".cache", "embeddings.sqlite"))
+DEFAULT_MAX_CONCURRENCY = 4
+
+# Limite de linhas por consulta "IN (...)" no SQLite
+_SQL_CHUNK = 500
+
+
+def normalize_text(text: str) -> str:
+    return " ".join(text.split())
+
+
+class CachedEmbeddings(Embeddings):
+    def __init__(self, base: Embeddings, store_path: str = DEFAULT_STORE_PATH,
+                 batch_size: int = None, max_concurrency: int = DEFAULT_MAX_CONCURRENCY):
+        self.base = base
+        self.store_path = store_path
+        # Por padrão, o mesmo tamanho de lote que o cliente usa por requisição
+        self.batch_size = batch_size or getattr(base, "chunk_size", None) or 1000
+        self.max_concurrency = max_concurrency
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(store_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(store_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS vectors (key TEXT PRIMARY KEY, vector BLOB NOT NULL)"
+        )
+        self._conn.commit()
+
+    @property
+    def model(self) -> str:
+        return str(getattr(self.base, "model", type(self.base).__name__))
+
+    def _key(self, text: str) -> str:
+        # O modelo entra na chave: vetores de modelos diferentes não se misturam
+        return hashlib.sha256(f"{self.model}\0{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+    def _lookup(self, keys: list) -> dict:
+        found = {}
+        with self._lock:
+            for i in range(0, len(keys), _SQL_CHUNK):
+                chunk = keys[i:i + _SQL_CHUNK]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM vectors WHERE key IN ({placeholders})", chunk
+                )
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32).tolist()
+        return found
+
+    def _store(self, items: dict):
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO vectors (key, vector) VALUES (?, ?)",
+                [(key, np.asarray(vector, dtype=np.float32).tobytes()) for key, vector in items.items()],
+            )
+            self._conn.commit()
+
+    def embed_documents(self, texts: list) -> list:
+        keys = [self._key(text) for text in texts]
+
+        # Textos repetidos (após normalização) viram uma única entrada
+        unique = {}
+        for key, text in zip(keys, texts):
+            unique.setdefault(key, text)
+
+        vectors = self._lookup(list(unique))
+        missing = [key for key in unique if key not in vectors]
+        with self._lock:
+            self.hits += len(unique) - len(missing)
+            self.misses += len(missing)
+
+        if missing:
+            batches = [missing[i:i + self.batch_size] for i in range(0, len(missing), self.batch_size)]
+            with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(batches))) as pool:
+                results = pool.map(
+                    lambda batch: self.base.embed_documents([unique[key] for key in batch]), batches
+                )
+                for batch, embedded in zip(batches, results):
+                    new_vectors = dict(zip(batch, embedded))
+                    self._store(new_vectors)
+                    vectors.update(new_vectors)
+
+        return [vectors[key] for key in keys]
+
+    def embed_query(self, text: str) -> list:
+        key = self._key(text)
+        cached = self._lookup([key])
+        if key in cached:
+            with self._lock:
+                self.hits += 1
+            return cached[key]
+
+        vector = self.base.embed_query(text)
+        with self._lock:
+            self.misses += 1
+        self._store({key: vector})
+        return vector
+
+    def stats(self) -> dict:
+        with self._lock:
+            (entries,) = self._conn.execute("SELECT COUNT(*) FROM vectors").fetchone()
+            return {"hits": self.hits, "misses": self.misses, "entries": entries}
@@ -0,0 +1,81 @@
+﻿import os
+import json
+import hashlib
+from langchain_community.vectorstores import FAISS
+
+# ================================================
+# Índice FAISS persistente para o CSV de requisitos
+# ================================================
+# O índice é construído uma única vez e salvo em disco. Cada documento recebe
+# como ID o hash do seu conteúdo, e um manifesto guarda os IDs indexados: na
+# próxima inicialização só as linhas novas ou alteradas são enviadas para a
+# API de embeddings, e as que sumiram do CSV são removidas do índice. Quando
+# nada mudou, o índice salvo é lido do disco para a memória (um IndexFlatL2,
+# que o FAISS não mapeia com mmap), sem nenhuma chamada e sem regravá-lo.
+
+INDEX_NAME = "index"
+MANIFEST_FILE = "manifest.json"
+
+
+def content_id(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def default_index_dir(data_file: str) -> str:
+    name = os.path.splitext(os.path.basename(data_file))[0]
+    return os.path.join(os.getenv("FAISS_INDEX_DIR", os.path.join(".cache", "faiss")), name)
+
+
+def _embedding_model(embeddings) -> str:
+    return str(getattr(embeddings, "model", type(embeddings).__name__))
+
+
+def _read_manifest(index_dir: str):
+    try:
+        with open(os.path.join(index_dir, MANIFEST_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def _write_manifest(index_dir: str, ids, model: str):
+    path = os.path.join(index_dir, MANIFEST_FILE)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"model": model, "ids": sorted(ids)}, f)
+    os.replace(tmp_path, path)
+
+
+def load_or_build_index(documents, embeddings, index_dir: str) -> FAISS:
+    """
+    Retorna o FAISS para `documents`, reaproveitando o índice salvo em `index_dir`.
+    Só faz chamadas de embedding para documentos cujo conteúdo ainda não foi indexado.
+    """
+    current = {}
+    for doc in documents:
+        current.setdefault(content_id(doc.page_content), doc)
+
+    model = _embedding_model(embeddings)
+    manifest = _read_manifest(index_dir)
+    index_exists = os.path.exists(os.path.join(index_dir, f"{INDEX_NAME}.faiss"))
+
+    if manifest is not None and index_exists and manifest.get("model") == model:
+        stored = set(manifest.get("ids", []))
+        to_remove = [doc_id for doc_id in stored if doc_id not in current]
+        to_add = [doc_id for doc_id in current if doc_id not in stored]
+
+        db = FAISS.load_local(index_dir, embeddings, index_name=INDEX_NAME, allow_dangerous_deserialization=True)
+        if not to_remove and not to_add:
+            return db
+        if to_remove:
+            db.delete(to_remove)
+        if to_add:
+            db.add_documents([current[doc_id] for doc_id in to_add], ids=to_add)
+    else:
+        # Sem índice salvo (ou modelo de embedding diferente): constrói do zero
+        db = FAISS.from_documents(list(current.values()), embeddings, ids=list(current))
+
+    os.makedirs(index_dir, exist_ok=True)
+    db.save_local(index_dir, index_name=INDEX_NAME)
+    _write_manifest(index_dir, current.keys(), model)
+    return db
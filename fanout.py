@@ -0,0 +1,68 @@
+﻿from concurrent.futures import ThreadPoolExecutor, as_completed
+from clause_index import get_clause_index, requirement_query
+
+# ================================================
+# Análise por requisito ("Apenas Requisitos" em paralelo)
+# ================================================
+# Cada requisito do CSV vira uma requisição pequena, com concorrência limitada,
+# levando só as cláusulas mais relevantes para ele (busca BM25 no clause_index).
+# Os resultados são exibidos à medida que chegam e o relatório final segue a
+# ordem dos IDs.
+
+DEFAULT_MAX_CONCURRENCY = 4
+DEFAULT_MAX_PASSAGES = 5
+
+
+def select_passages(pdf_text: str, row: dict, max_passages: int = DEFAULT_MAX_PASSAGES) -> list:
+    """
+    Retorna as cláusulas mais relevantes para o requisito (BM25), na ordem do contrato.
+    """
+    index = get_clause_index(pdf_text)
+    return [clause.render() for clause in index.search(requirement_query(row), max_passages)]
+
+
+def build_requirement_prompt(row: dict, passages: list) -> str:
+    excerpt = "\n\n".join(passages) if passages else "(nenhum trecho relacionado encontrado)"
+    return f"""
+        Você é um assistente virtual especializado em análise de contratos.
+
+        TRECHOS DO CONTRATO RELACIONADOS AO REQUISITO:
+        {excerpt}
+
+        REQUISITO:
+        ({row.get('id')}) {row.get('tema')}: {row.get('requisito')}
+        [Fundamento: {row.get('fundamento_legal')}]
+
+        INSTRUÇÕES:
+        1. Procure termos iguais ou equivalentes (sinônimos) nos trechos acima.
+        2. Se encontrar, responda na primeira linha "✅ ({row.get('id')}) {row.get('tema')}" e cite o trecho exato como evidência.
+        3. Se não encontrar, responda na primeira linha "❌ ({row.get('id')}) {row.get('tema')}".
+        4. Termine com uma sugestão de melhoria curta iniciada por 💡.
+        Seja breve.
+        """
+
+
+def _assemble(results: list) -> str:
+    return "\n\n".join(text.strip() for text in results if text is not None)
+
+
+def analyze_per_requirement(pdf_text: str, rows: list, call, on_partial=None,
+                            max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+                            select=select_passages) -> str:
+    """
+    call: função que recebe um prompt e devolve o texto da resposta do LLM.
+    on_partial: chamada (na thread de quem chamou) com o relatório parcial,
+                em ordem de ID, sempre que um requisito termina.
+    select: função (pdf_text, row) -> lista de trechos relevantes do contrato.
+    """
+    results = [None] * len(rows)
+    with ThreadPoolExecutor(max_workers=max(1, min(max_concurrency, len(rows)))) as pool:
+        futures = {
+            pool.submit(call, build_requirement_prompt(row, select(pdf_text, row))): i
+            for i, row in enumerate(rows)
+        }
+        for future in as_completed(futures):
+            results[futures[future]] = future.result()
+            if on_partial is not None:
+                on_partial(_assemble(results))
+    return _assemble(results)
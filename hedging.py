@@ -0,0 +1,138 @@
+﻿import os
+import asyncio
+from providers import latency_tracker, DEFAULT_SYSTEM_PROMPT
+
+# ================================================
+# Requisições com hedge e failover entre provedores
+# ================================================
+# A análise vai primeiro para o provedor escolhido. Se ele não entregar o
+# primeiro token (ou a resposta, em chamadas sem stream) dentro do percentil
+# HEDGE_PERCENTILE das latências recentes, uma cópia é enviada ao outro
+# provedor; fica valendo quem responder primeiro e a outra chamada é cancelada.
+# Se o provedor principal falhar antes disso, a cópia sai na hora (failover).
+# As latências de referência são as de prompts da mesma faixa de tamanho
+# (providers.LatencyTracker). Em chamadas sem stream, a espera é o percentil
+# da latência total, não do primeiro token. O hedge só vale para a análise
+# inteira ou em stream: as várias chamadas curtas de map_reduce, fan-out por
+# requisito e reanálise incremental (hedge=False) só têm failover, para não
+# dobrar as chamadas pagas justamente onde há mais delas.
+
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", 0.95))
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", 5))
+HEDGE_MIN_DELAY = float(os.getenv("HEDGE_MIN_DELAY", 2.0))
+# Espera usada enquanto ainda não há latências suficientes do provedor
+HEDGE_DEFAULT_DELAY = float(os.getenv("HEDGE_DEFAULT_DELAY", 10.0))
+
+
+def hedge_delay(provider, kind: str, prompt_chars: int = 0, percentile: float = HEDGE_PERCENTILE) -> float:
+    observed = latency_tracker.percentile(
+        provider.name, provider.model, kind, percentile, min_samples=HEDGE_MIN_SAMPLES,
+        prompt_chars=prompt_chars,
+    )
+    if observed is None:
+        return HEDGE_DEFAULT_DELAY
+    return max(HEDGE_MIN_DELAY, observed)
+
+
+async def _race(primary_call, secondary_call, delay: float, cleanup=None):
+    """
+    Inicia primary_call(); se não terminar em `delay` segundos (ou falhar),
+    inicia secondary_call() e devolve o primeiro resultado bem-sucedido.
+    Com delay None, secondary_call() só roda se primary_call() falhar.
+    A chamada perdedora é cancelada ou, se também tiver terminado, passa
+    por cleanup(resultado).
+    """
+    primary = asyncio.ensure_future(primary_call())
+    done, _ = await asyncio.wait({primary}, timeout=delay)
+    if primary in done and primary.exception() is None:
+        return primary.result()
+
+    secondary = asyncio.ensure_future(secondary_call())
+    tasks = (primary, secondary)
+    errors = [primary.exception()] if primary.done() else []
+    pending = {task for task in tasks if not task.done()}
+    winner = None
+    try:
+        while pending and winner is None:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is not None:
+                    errors.append(task.exception())
+                elif winner is None:
+                    winner = task
+        if winner is None:
+            raise errors[0]
+        return winner.result()
+    finally:
+        for task in tasks:
+            if task is winner:
+                continue
+            if not task.done():
+                task.cancel()
+            elif cleanup is not None and not task.cancelled() and task.exception() is None:
+                await cleanup(task.result())
+
+
+class HedgedStream:
+    """
+    Stream do provedor vencedor, começando pelo primeiro token já recebido.
+    `provider` e `result` seguem a mesma interface de providers.LLMStream.
+    """
+
+    def __init__(self, stream, first: str):
+        self._stream = stream
+        self._first = first
+        self.provider = stream.provider
+
+    @property
+    def result(self):
+        return self._stream.result
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> str:
+        if self._first is not None:
+            first, self._first = self._first, None
+            return first
+        return await self._stream.__anext__()
+
+
+async def _first_token(provider, prompt: str, system: str, **kwargs):
+    stream = await provider.stream(prompt, system=system, **kwargs)
+    try:
+        first = await stream.__anext__()
+    except StopAsyncIteration:
+        first = None
+    except BaseException:
+        await stream.aclose()
+        raise
+    return stream, first
+
+
+async def _close_stream(started):
+    stream, _ = started
+    await stream.aclose()
+
+
+async def hedged_stream(primary, secondary, prompt: str, system: str = DEFAULT_SYSTEM_PROMPT,
+                        **kwargs) -> HedgedStream:
+    stream, first = await _race(
+        lambda: _first_token(primary, prompt, system, **kwargs),
+        lambda: _first_token(secondary, prompt, system, **kwargs),
+        hedge_delay(primary, "ttft", len(prompt) + len(system or "")),
+        cleanup=_close_stream,
+    )
+    return HedgedStream(stream, first)
+
+
+async def hedged_complete(primary, secondary, prompt: str, system: str = DEFAULT_SYSTEM_PROMPT,
+                          hedge: bool = True, **kwargs):
+    """
+    hedge=False: só failover (o secundário só é chamado se o principal falhar).
+    """
+    return await _race(
+        lambda: primary.complete(prompt, system=system, **kwargs),
+        lambda: secondary.complete(prompt, system=system, **kwargs),
+        hedge_delay(primary, "total", len(prompt) + len(system or "")) if hedge else None,
+    )
@@ -0,0 +1,340 @@
+﻿import os
+import json
+import time
+import uuid
+import socket
+import hashlib
+import sqlite3
+import threading
+from dataclasses import dataclass
+from scheduler import FairScheduler, QuotaExceeded
+import metrics
+
+# ================================================
+# Análises em segundo plano
+# ================================================
+# A análise não roda mais na thread do script do Streamlit: ela vira um job
+# numa tabela SQLite e é executada por um pool de workers do processo. Um
+# rerun (qualquer clique durante a análise) não descarta o trabalho em
+# andamento: a página só consulta o job pelo id e, quando ele termina, o
+# resultado é reanexado à sessão. Jobs do mesmo usuário com os mesmos
+# parâmetros são deduplicados, então um clique duplo não paga duas vezes a
+# mesma chamada. Cada job pertence ao usuário que o criou: só ele o consulta.
+# A ordem e o paralelismo de execução ficam com o FairScheduler (scheduler.py).
+#
+# Vários processos (réplicas do app, o lote) podem usar o mesmo banco. Cada
+# JobManager registra um dono (host, pid e um id aleatório) com um heartbeat
+# gravado a cada JOB_HEARTBEAT_SECONDS, e cada job guarda o dono que o executa.
+# Um job na fila ou rodando só é dado como interrompido quando o dono sumiu:
+# sem heartbeat há JOB_OWNER_TIMEOUT_SECONDS, ou, no mesmo host, com o pid
+# já encerrado.
+
+DEFAULT_STORE_PATH = os.getenv("JOBS_PATH", os.path.join(".cache", "jobs.sqlite"))
+# Um job concluído com os mesmos parâmetros é reaproveitado por este tempo
+REUSE_FINISHED_SECONDS = int(os.getenv("JOB_REUSE_SECONDS", 60 * 60))
+# Intervalo mínimo entre gravações do texto parcial
+PARTIAL_WRITE_SECONDS = 0.5
+# Duração assumida para a barra de progresso enquanto não há jobs concluídos
+DEFAULT_EXPECTED_SECONDS = 60.0
+HEARTBEAT_SECONDS = float(os.getenv("JOB_HEARTBEAT_SECONDS", 10))
+OWNER_TIMEOUT_SECONDS = float(os.getenv("JOB_OWNER_TIMEOUT_SECONDS", 3 * HEARTBEAT_SECONDS))
+
+QUEUED, RUNNING, DONE, ERROR = "queued", "running", "done", "error"
+
+
+def params_key(params: dict) -> str:
+    return hashlib.sha256(json.dumps(params, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Existe, mas é de outro usuário do sistema
+        return True
+    return True
+
+
+@dataclass
+class Job:
+    id: str
+    key: str
+    status: str
+    description: dict
+    partial: str
+    result: str
+    timings: dict
+    error: str
+    created: float
+    started: float
+    finished: float
+
+    @property
+    def done(self) -> bool:
+        return self.status in (DONE, ERROR)
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished or time.time()) - (self.started or self.created)
+
+
+_COLUMNS = "id, key, status, description, partial, result, timings, error, created, started, finished"
+
+
+class JobStore:
+    def __init__(self, path: str = DEFAULT_STORE_PATH):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                key TEXT NOT NULL,
+                status TEXT NOT NULL,
+                description TEXT,
+                partial TEXT,
+                result TEXT,
+                timings TEXT,
+                error TEXT,
+                created REAL NOT NULL,
+                started REAL,
+                finished REAL,
+                owner TEXT
+            );
+            CREATE INDEX IF NOT EXISTS jobs_key ON jobs (key, created);
+            CREATE TABLE IF NOT EXISTS owners (
+                id TEXT PRIMARY KEY,
+                host TEXT NOT NULL,
+                pid INTEGER NOT NULL,
+                heartbeat REAL NOT NULL
+            );
+        """)
+        # Bancos criados antes do dono por job
+        if "owner" not in {row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")}:
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN owner TEXT")
+        self._conn.commit()
+
+    def _execute(self, sql: str, args: tuple = ()):
+        with self._lock, self._conn:
+            return self._conn.execute(sql, args).fetchall()
+
+    @staticmethod
+    def _job(row) -> Job:
+        values = list(row)
+        values[3] = json.loads(values[3]) if values[3] else {}
+        values[6] = json.loads(values[6]) if values[6] else {}
+        return Job(*values)
+
+    def create(self, key: str, description: dict, owner: str = None) -> str:
+        job_id = uuid.uuid4().hex
+        self._execute(
+            "INSERT INTO jobs (id, key, status, description, created, owner) VALUES (?, ?, ?, ?, ?, ?)",
+            (job_id, key, QUEUED, json.dumps(description, ensure_ascii=False), time.time(), owner),
+        )
+        return job_id
+
+    def get(self, job_id: str) -> Job:
+        rows = self._execute(f"SELECT {_COLUMNS} FROM jobs WHERE id = ?", (job_id,))
+        return self._job(rows[0]) if rows else None
+
+    def find_reusable(self, key: str, reuse_finished: bool) -> Job:
+        """
+        Job com a mesma chave ainda na fila, rodando ou (se reuse_finished)
+        concluído com sucesso há pouco tempo.
+        """
+        rows = self._execute(
+            f"SELECT {_COLUMNS} FROM jobs WHERE key = ? AND status != ? ORDER BY created DESC LIMIT 1",
+            (key, ERROR),
+        )
+        if not rows:
+            return None
+        job = self._job(rows[0])
+        if job.status in (QUEUED, RUNNING):
+            return job
+        if reuse_finished and time.time() - job.finished <= REUSE_FINISHED_SECONDS:
+            return job
+        return None
+
+    def mark_running(self, job_id: str):
+        self._execute("UPDATE jobs SET status = ?, started = ? WHERE id = ?", (RUNNING, time.time(), job_id))
+
+    def update_partial(self, job_id: str, partial: str):
+        self._execute("UPDATE jobs SET partial = ? WHERE id = ?", (partial, job_id))
+
+    def finish(self, job_id: str, result: str, timings: dict):
+        self._execute(
+            "UPDATE jobs SET status = ?, result = ?, timings = ?, partial = NULL, finished = ? WHERE id = ?",
+            (DONE, result, json.dumps(timings, ensure_ascii=False, default=str), time.time(), job_id),
+        )
+
+    def fail(self, job_id: str, error: str):
+        self._execute(
+            "UPDATE jobs SET status = ?, error = ?, finished = ? WHERE id = ?",
+            (ERROR, error, time.time(), job_id),
+        )
+
+    def heartbeat(self, owner: str):
+        self._execute(
+            "INSERT INTO owners (id, host, pid, heartbeat) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (id) DO UPDATE SET heartbeat = excluded.heartbeat",
+            (owner, socket.gethostname(), os.getpid(), time.time()),
+        )
+
+    def release(self, owner: str):
+        self._execute("DELETE FROM owners WHERE id = ?", (owner,))
+
+    def fail_orphans(self, timeout: float = OWNER_TIMEOUT_SECONDS):
+        """
+        Falha os jobs na fila ou rodando cujo dono sumiu (processo parado ou
+        reiniciado); os de processos vivos, inclusive de outras réplicas, ficam.
+        """
+        now = time.time()
+        host = socket.gethostname()
+        gone = {
+            owner for owner, owner_host, pid, heartbeat in
+            self._execute("SELECT id, host, pid, heartbeat FROM owners")
+            if now - heartbeat > timeout or (owner_host == host and not _pid_alive(pid))
+        }
+        rows = self._execute(
+            "SELECT DISTINCT jobs.owner FROM jobs LEFT JOIN owners ON owners.id = jobs.owner "
+            "WHERE jobs.status IN (?, ?) AND owners.id IS NULL",
+            (QUEUED, RUNNING),
+        )
+        # Jobs sem dono registrado: de um processo já removido ou de antes desta versão
+        orphaned = gone | {row[0] for row in rows}
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "UPDATE jobs SET status = ?, error = ?, finished = ? WHERE status IN (?, ?) AND owner IS ?",
+                [(ERROR, "Análise interrompida: o servidor foi reiniciado.", now, QUEUED, RUNNING, owner)
+                 for owner in orphaned],
+            )
+            self._conn.executemany("DELETE FROM owners WHERE id = ?", [(owner,) for owner in gone])
+
+    def typical_duration(self, limit: int = 50) -> float:
+        """
+        Mediana da duração dos últimos jobs concluídos, ou None se não houver.
+        """
+        rows = self._execute(
+            "SELECT finished - started FROM jobs WHERE status = ? AND started IS NOT NULL "
+            "ORDER BY finished DESC LIMIT ?",
+            (DONE, limit),
+        )
+        durations = sorted(row[0] for row in rows)
+        return durations[len(durations) // 2] if durations else None
+
+
+class JobManager:
+    def __init__(self, store: JobStore = None, scheduler: FairScheduler = None,
+                 heartbeat_seconds: float = HEARTBEAT_SECONDS):
+        self.store = store or JobStore()
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.store.heartbeat(self.owner)
+        self.store.fail_orphans()
+        self.scheduler = scheduler or FairScheduler()
+        self._submit_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._heartbeat = threading.Thread(
+            target=self._beat, args=(heartbeat_seconds,), name="jobs-heartbeat", daemon=True
+        )
+        self._heartbeat.start()
+
+    def _beat(self, interval: float):
+        # Mantém este processo como dono vivo e recolhe os jobs de donos que pararam
+        while not self._stop.wait(interval):
+            try:
+                self.store.heartbeat(self.owner)
+                self.store.fail_orphans()
+            except sqlite3.Error:
+                pass
+
+    def close(self):
+        self._stop.set()
+        self._heartbeat.join()
+        self.store.release(self.owner)
+
+    def submit(self, params: dict, description: dict, run, reuse_finished: bool = True,
+               user: str = "anonimo", tokens: int = 0) -> str:
+        """
+        Enfileira run(on_partial, timings) -> str e retorna o id do job. Se já
+        houver um job de `user` com os mesmos params (ver JobStore.find_reusable),
+        retorna o id dele em vez de criar outro.
+        tokens: estimativa de tokens da análise, para a fila justa e a cota de `user`.
+        Levanta scheduler.QuotaExceeded se o usuário passou da cota.
+        """
+        key = params_key({**params, "user": user})
+        with self._submit_lock:
+            existing = self.store.find_reusable(key, reuse_finished)
+            if existing is not None:
+                return existing.id
+            job_id = self.store.create(key, {**description, "user": user, "tokens": tokens}, self.owner)
+            try:
+                self.scheduler.submit(job_id, user, tokens, lambda: self._run(job_id, run))
+            except QuotaExceeded as e:
+                # O job não entrou na fila: não fica "na fila" nem é reaproveitado
+                self.store.fail(job_id, str(e))
+                raise
+        return job_id
+
+    def _run(self, job_id: str, run):
+        self.store.mark_running(job_id)
+        job = self.store.get(job_id)
+        metrics.record("queue", job.started - job.created, user=job.description.get("user"))
+        last_write = 0.0
+
+        def on_partial(text: str):
+            nonlocal last_write
+            now = time.monotonic()
+            if now - last_write >= PARTIAL_WRITE_SECONDS:
+                self.store.update_partial(job_id, text)
+                last_write = now
+
+        timings = {}
+        try:
+            result = run(on_partial, timings)
+        except Exception as e:
+            self.store.fail(job_id, f"Erro na análise: {e}")
+            return None
+        self.store.finish(job_id, result, timings)
+        # Tokens reais, para o agendador acertar a cota do usuário
+        usage = timings.get("usage") or {}
+        return (usage.get("prompt_tokens") or 0) + (usage.get("completion_tokens") or 0)
+
+    def get(self, job_id: str, user: str) -> Job:
+        """
+        O job, ou None se ele não existe ou não foi criado por `user`.
+        """
+        job = self.store.get(job_id)
+        if job is None or job.description.get("user") != user:
+            return None
+        return job
+
+    def progress(self, job: Job) -> float:
+        """
+        Estimativa de 0 a 1 para a barra de progresso, pelo tempo decorrido
+        em relação à duração típica das análises anteriores.
+        """
+        if job.done:
+            return 1.0
+        if job.status == QUEUED:
+            return 0.0
+        expected = self.store.typical_duration() or DEFAULT_EXPECTED_SECONDS
+        return min(0.95, job.elapsed / max(expected, 1.0))
+
+    def queue_position(self, job: Job) -> int:
+        return self.scheduler.position(job.id)
+
+    def estimated_wait(self, job: Job) -> float:
+        """
+        Espera estimada (s) até o job sair da fila: cada "rodada" de
+        max_concurrent análises leva a duração típica de uma análise.
+        """
+        position = self.queue_position(job)
+        if position is None:
+            return 0.0
+        expected = self.store.typical_duration() or DEFAULT_EXPECTED_SECONDS
+        return (position // self.scheduler.max_concurrent + 1) * expected
@@ -0,0 +1,154 @@
+﻿from concurrent.futures import ThreadPoolExecutor
+from tokens import split_by_tokens
+
+# ================================================
+# Análise map-reduce para contratos longos
+# ================================================
+# O contrato é dividido em partes limitadas por tokens e cada parte é analisada
+# em paralelo contra os mesmos requisitos (map). Cada resposta vem em linhas
+# "CAMPO|..." fáceis de interpretar, e a junção (reduce) é feita localmente,
+# sem uma segunda chamada ao LLM: a latência total fica perto da parte mais
+# lenta, não do documento inteiro. Por isso todas as partes saem juntas (uma
+# thread por parte); quem segura o ritmo é o controle de taxa do provedor.
+
+DEFAULT_CHUNK_TOKENS = 3000
+DEFAULT_OVERLAP_TOKENS = 150
+
+STATUS_FOUND = "✅"
+STATUS_MISSING = "❌"
+
+
+def build_map_prompt(chunk: str, index: int, total: int, contract_id: str,
+                     requirements_text: str, analysis_mode: str) -> str:
+    extra = ""
+    if analysis_mode != "Apenas Requisitos":
+        extra = """
+        CLAUSULA|<número ou título da cláusula>|<resumo em uma frase>
+        ALERTA|<possível ilicitude ou incongruência encontrada neste trecho>"""
+
+    return f"""
+        Você é um assistente virtual especializado em análise de contratos.
+        Você está lendo APENAS a parte {index} de {total} de um contrato (ID {contract_id}).
+
+        TRECHO DO CONTRATO:
+        {chunk}
+
+        REQUISITOS (DO CSV):
+        {requirements_text}
+
+        INSTRUÇÕES:
+        Responda somente com linhas no formato abaixo, uma informação por linha, sem texto adicional:
+        REQ|<id do requisito>|✅ ou ❌|<trecho exato do contrato que atende o requisito, ou vazio>{extra}
+        SUGESTAO|<sugestão de melhoria>
+
+        1. Inclua uma linha REQ para cada requisito, procurando termos iguais ou equivalentes (sinônimos) neste trecho.
+        2. Use ✅ somente se este trecho atender o requisito; caso contrário use ❌.
+        """
+
+
+def parse_map_output(output: str) -> dict:
+    findings = {"requirements": {}, "clauses": [], "alerts": [], "suggestions": [], "other": []}
+    for line in output.splitlines():
+        line = line.strip().strip("-* ")
+        if not line:
+            continue
+        parts = [part.strip() for part in line.split("|")]
+        kind = parts[0].upper()
+        if kind == "REQ" and len(parts) >= 3:
+            evidence = "|".join(parts[3:]).strip()
+            findings["requirements"][parts[1]] = (STATUS_FOUND in parts[2], evidence)
+        elif kind == "CLAUSULA" and len(parts) >= 3:
+            findings["clauses"].append((parts[1], "|".join(parts[2:])))
+        elif kind == "ALERTA" and len(parts) >= 2:
+            findings["alerts"].append("|".join(parts[1:]))
+        elif kind == "SUGESTAO" and len(parts) >= 2:
+            findings["suggestions"].append("|".join(parts[1:]))
+        else:
+            findings["other"].append(line)
+    return findings
+
+
+def _unique(items: list) -> list:
+    seen = set()
+    result = []
+    for item in items:
+        key = item.casefold() if isinstance(item, str) else item
+        if key not in seen:
+            seen.add(key)
+            result.append(item)
+    return result
+
+
+def merge_findings(all_findings: list, rows: list, analysis_mode: str) -> str:
+    """
+    Junta as respostas de cada parte num único relatório ✅/❌/💡.
+    Um requisito é atendido se qualquer parte o encontrou.
+    """
+    lines = []
+
+    if analysis_mode != "Apenas Requisitos":
+        clauses = _unique([c for f in all_findings for c in f["clauses"]])
+        if clauses:
+            lines.append("CLÁUSULAS IDENTIFICADAS")
+            lines.extend(f"- {title}: {summary}" for title, summary in clauses)
+            lines.append("")
+        alerts = _unique([a for f in all_findings for a in f["alerts"]])
+        if alerts:
+            lines.append("POSSÍVEIS ILICITUDES OU INCONGRUÊNCIAS")
+            lines.extend(f"- {alert}" for alert in alerts)
+            lines.append("")
+
+    lines.append("REQUISITOS")
+    for row in rows:
+        req_id = str(row.get("id")).strip()
+        evidences = []
+        found = False
+        for f in all_findings:
+            is_found, evidence = f["requirements"].get(req_id, (False, ""))
+            if is_found:
+                found = True
+                if evidence:
+                    evidences.append(evidence)
+        icon = STATUS_FOUND if found else STATUS_MISSING
+        line = f"{icon} ({req_id}) {row.get('tema')}"
+        if evidences:
+            line += " — " + " / ".join(f'"{e}"' for e in _unique(evidences))
+        lines.append(line)
+
+    suggestions = _unique([s for f in all_findings for s in f["suggestions"]])
+    if suggestions:
+        lines.append("")
+        lines.append("SUGESTÕES DE MELHORIA")
+        lines.extend(f"💡 {suggestion}" for suggestion in suggestions)
+
+    other = _unique([o for f in all_findings for o in f["other"]])
+    if other:
+        lines.append("")
+        lines.append("OBSERVAÇÕES ADICIONAIS")
+        lines.extend(f"- {o}" for o in other)
+
+    return "\n".join(lines)
+
+
+def analyze_map_reduce(pdf_text: str, rows: list, requirements_text: str, contract_id: str,
+                       analysis_mode: str, call, model: str,
+                       chunk_tokens: int = DEFAULT_CHUNK_TOKENS,
+                       overlap_tokens: int = DEFAULT_OVERLAP_TOKENS,
+                       max_concurrency: int = None) -> str:
+    """
+    call: função que recebe um prompt e devolve o texto da resposta do LLM.
+    max_concurrency: limite de partes enviadas ao mesmo tempo (padrão: todas).
+    Levanta ValueError se o contrato não tiver texto.
+    """
+    chunks = split_by_tokens(pdf_text, chunk_tokens, model, overlap_tokens=overlap_tokens)
+    if not chunks:
+        raise ValueError("Nenhum texto encontrado no contrato.")
+
+    prompts = [
+        build_map_prompt(chunk, i + 1, len(chunks), contract_id, requirements_text, analysis_mode)
+        for i, chunk in enumerate(chunks)
+    ]
+    with ThreadPoolExecutor(max_workers=min(max_concurrency or len(prompts), len(prompts))) as pool:
+        outputs = list(pool.map(call, prompts))
+
+    return merge_findings([parse_map_output(output) for output in outputs], rows, analysis_mode)
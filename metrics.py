@@ -0,0 +1,300 @@
+﻿import os
+import json
+import time
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# ================================================
+# Métricas por etapa da análise
+# ================================================
+# Cada etapa (extração do PDF, leitura dos requisitos, montagem do prompt,
+# fila, chamada ao LLM) grava um "span" com a duração e atributos como bytes,
+# páginas, tokens de entrada/saída, provedor, modelo e acerto de cache. Os
+# spans vão para uma tabela SQLite (para os percentis da página de admin) e
+# alimentam contadores e histogramas exportados no formato texto do
+# Prometheus, num arquivo .prom (para o textfile collector do node_exporter)
+# e, se METRICS_PORT estiver definido, num endpoint HTTP /metrics. Etapas que
+# o Streamlit repete a cada rerun só gravam span quando o trabalho de fato
+# acontece; os acertos de cache delas só somam um contador (count).
+
+DEFAULT_STORE_PATH = os.getenv("METRICS_PATH", os.path.join(".cache", "metrics.sqlite"))
+PROMETHEUS_FILE = os.getenv("METRICS_PROM_FILE", os.path.join(".cache", "metrics.prom"))
+# Intervalo mínimo (s) entre regravações do arquivo .prom
+PROMETHEUS_WRITE_SECONDS = 5.0
+
+# Limites (s) dos buckets dos histogramas de duração
+DURATION_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+PERCENTILES = (0.50, 0.95, 0.99)
+
+# Atributos numéricos somados como contadores no Prometheus
+COUNTED_ATTRIBUTES = ("bytes", "pages", "tokens_in", "tokens_out")
+
+
+class MetricsStore:
+    def __init__(self, path: str = DEFAULT_STORE_PATH, prometheus_file: str = PROMETHEUS_FILE):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.prometheus_file = prometheus_file
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS spans (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                stage TEXT NOT NULL,
+                started REAL NOT NULL,
+                duration REAL NOT NULL,
+                provider TEXT,
+                model TEXT,
+                status TEXT NOT NULL,
+                attributes TEXT
+            );
+            CREATE INDEX IF NOT EXISTS spans_stage ON spans (stage, started);
+        """)
+        self._conn.commit()
+        # Séries do Prometheus desde o início do processo
+        self._histograms = {}
+        self._counters = {}
+        self._last_write = 0.0
+
+    def record(self, stage: str, duration: float, provider: str = None, model: str = None,
+               status: str = "ok", started: float = None, **attributes):
+        attributes = {k: v for k, v in attributes.items() if v is not None}
+        labels = (stage, provider or "", model or "", status)
+        with self._lock:
+            with self._conn:
+                self._conn.execute(
+                    "INSERT INTO spans (stage, started, duration, provider, model, status, attributes) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (stage, started or time.time() - duration, duration, provider, model, status,
+                     json.dumps(attributes, ensure_ascii=False, default=str)),
+                )
+            histogram = self._histograms.setdefault(labels, [[0] * len(DURATION_BUCKETS), 0, 0.0])
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if duration <= bound:
+                    histogram[0][i] += 1
+            histogram[1] += 1
+            histogram[2] += duration
+            for name in COUNTED_ATTRIBUTES:
+                if isinstance(attributes.get(name), (int, float)):
+                    key = (name, stage, provider or "", model or "")
+                    self._counters[key] = self._counters.get(key, 0) + attributes[name]
+            if "cache_hit" in attributes:
+                key = ("cache_hits" if attributes["cache_hit"] else "cache_misses", stage, provider or "", model or "")
+                self._counters[key] = self._counters.get(key, 0) + 1
+            write = self.prometheus_file and time.monotonic() - self._last_write >= PROMETHEUS_WRITE_SECONDS
+            if write:
+                self._last_write = time.monotonic()
+        if write:
+            self.write_prometheus()
+
+    def count(self, name: str, stage: str, provider: str = None, model: str = None, value: float = 1):
+        """
+        Só soma um contador do Prometheus, sem gravar span: para eventos
+        frequentes e instantâneos (acertos de cache a cada rerun), que
+        distorceriam os percentis de duração da etapa.
+        """
+        key = (name, stage, provider or "", model or "")
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    # ------------------------------------------------
+    # Prometheus
+    # ------------------------------------------------
+    def prometheus_text(self) -> str:
+        def labels(stage, provider, model, status=None):
+            pairs = [("stage", stage), ("provider", provider), ("model", model)]
+            if status is not None:
+                pairs.append(("status", status))
+            return ",".join(f'{k}="{v}"' for k, v in pairs)
+
+        lines = [
+            "# HELP analysis_stage_seconds Duração de cada etapa da análise.",
+            "# TYPE analysis_stage_seconds histogram",
+        ]
+        with self._lock:
+            histograms = {k: ([*v[0]], v[1], v[2]) for k, v in self._histograms.items()}
+            counters = dict(self._counters)
+        for (stage, provider, model, status), (buckets, count, total) in sorted(histograms.items()):
+            base = labels(stage, provider, model, status)
+            for bound, value in zip(DURATION_BUCKETS, buckets):
+                lines.append(f'analysis_stage_seconds_bucket{{{base},le="{bound}"}} {value}')
+            lines.append(f'analysis_stage_seconds_bucket{{{base},le="+Inf"}} {count}')
+            lines.append(f"analysis_stage_seconds_sum{{{base}}} {total:.6f}")
+            lines.append(f"analysis_stage_seconds_count{{{base}}} {count}")
+        names = sorted({key[0] for key in counters})
+        for name in names:
+            lines.append(f"# TYPE analysis_{name}_total counter")
+            for (counter, stage, provider, model), value in sorted(counters.items()):
+                if counter == name:
+                    lines.append(f"analysis_{name}_total{{{labels(stage, provider, model)}}} {value}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self):
+        # Grava num temporário e renomeia: o coletor nunca lê um arquivo pela metade
+        temporary = f"{self.prometheus_file}.tmp"
+        with open(temporary, "w", encoding="utf-8") as f:
+            f.write(self.prometheus_text())
+        os.replace(temporary, self.prometheus_file)
+
+    # ------------------------------------------------
+    # Consultas para a página de admin
+    # ------------------------------------------------
+    def percentiles(self, since: float = None, by: str = "stage") -> list:
+        """
+        p50/p95/p99 das durações agrupadas por etapa ("stage") ou por
+        etapa e provedor ("provider"), desde o instante `since` (epoch).
+        Agrupamento e ordenação ficam no SQLite: só uma linha por grupo
+        chega ao Python, por maior que seja a tabela.
+        """
+        group = "stage" if by == "stage" else "stage, provider, model"
+        picks = ", ".join(
+            f"MAX(CASE WHEN rank = MIN(n - 1, CAST({q} * n AS INTEGER)) THEN duration END)"
+            for q in PERCENTILES
+        )
+        with self._lock:
+            rows = self._conn.execute(
+                f"""
+                WITH ranked AS (
+                    SELECT stage, provider, model, duration,
+                           ROW_NUMBER() OVER (PARTITION BY {group} ORDER BY duration) - 1 AS rank,
+                           COUNT(*) OVER (PARTITION BY {group}) AS n
+                    FROM spans WHERE started >= ?
+                )
+                SELECT stage, provider, model, MAX(n), {picks}
+                FROM ranked GROUP BY {group} ORDER BY {group}
+                """,
+                (since or 0,),
+            ).fetchall()
+        result = []
+        for stage, provider, model, n, *values in rows:
+            entry = {"etapa": stage}
+            if by != "stage":
+                entry["provedor"] = f"{provider}/{model}" if provider else "-"
+            entry["n"] = n
+            for q, value in zip(PERCENTILES, values):
+                entry[f"p{round(q * 100)}"] = round(value, 3)
+            result.append(entry)
+        return result
+
+    def recent(self, limit: int = 50) -> list:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT stage, started, duration, provider, model, status, attributes "
+                "FROM spans ORDER BY id DESC LIMIT ?",
+                (limit,),
+            ).fetchall()
+        return [
+            {
+                "etapa": stage,
+                "inicio": time.strftime("%d/%m %H:%M:%S", time.localtime(started)),
+                "duracao_s": round(duration, 3),
+                "provedor": f"{provider}/{model}" if provider else "",
+                "status": status,
+                **json.loads(attributes or "{}"),
+            }
+            for stage, started, duration, provider, model, status, attributes in rows
+        ]
+
+
+# ================================================
+# Store do processo e spans
+# ================================================
+_store = None
+_store_lock = threading.Lock()
+# Grava os spans vindos do event loop dos provedores, que não pode esperar
+# o SQLite nem o arquivo .prom; uma thread só, para manter a ordem
+_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="metrics-writer")
+
+
+def get_store() -> MetricsStore:
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = MetricsStore()
+        return _store
+
+
+def record(stage: str, duration: float, **attributes):
+    try:
+        get_store().record(stage, duration, **attributes)
+    except (sqlite3.Error, OSError):
+        # Métrica perdida (banco travado, disco cheio, .prom sem permissão)
+        # não pode derrubar a análise
+        pass
+
+
+def count(name: str, stage: str, **labels):
+    try:
+        get_store().count(name, stage, **labels)
+    except (sqlite3.Error, OSError):
+        pass
+
+
+def record_later(stage: str, duration: float, **attributes):
+    """
+    Como record, mas sem bloquear quem chama: a gravação fica com a thread
+    metrics-writer. Para código que roda no event loop.
+    """
+    attributes.setdefault("started", time.time() - duration)
+    _writer.submit(record, stage, duration, **attributes)
+
+
+class Span:
+    def __init__(self, stage: str, attributes: dict):
+        self.stage = stage
+        self.attributes = attributes
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+
+@contextmanager
+def span(stage: str, **attributes):
+    """
+    Mede o bloco e grava o span ao sair; atributos conhecidos só no meio do
+    bloco podem ser acrescentados com .set(). Exceções marcam status "error".
+    """
+    current = Span(stage, dict(attributes))
+    started_wall = time.time()
+    started = time.perf_counter()
+    status = "ok"
+    try:
+        yield current
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        record(stage, time.perf_counter() - started, status=status, started=started_wall, **current.attributes)
+
+
+# ================================================
+# Endpoint HTTP opcional
+# ================================================
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.rstrip("/") != "/metrics":
+            self.send_error(404)
+            return
+        body = get_store().prometheus_text().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_prometheus(port: int) -> ThreadingHTTPServer:
+    """
+    Serve /metrics numa thread de fundo, na porta dada.
+    """
+    server = ThreadingHTTPServer(("0.0.0.0", port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
@@ -0,0 +1,169 @@
+﻿import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+# ================================================
+# Cache de texto extraído de PDFs
+# ================================================
+# O texto é indexado pelo SHA-256 dos bytes do arquivo enviado, então o mesmo
+# PDF só é processado uma vez, mesmo entre reruns, sessões e reinícios do
+# servidor. Em memória fica um LRU limitado por bytes; tudo o que é gravado
+# também vai para o disco, de onde é recarregado quando sai da memória.
+#
+# O disco também tem limite: um LRU por bytes (PDF_CACHE_MAX_DISK_MB) e por
+# idade do último uso (PDF_CACHE_MAX_AGE_DAYS). A pasta é listada uma única
+# vez, ao criar o cache; depois o índice dos arquivos e os contadores de
+# stats() são mantidos em memória, sem tocar no disco a cada rerun. Arquivos
+# gravados por outros processos entram no índice no primeiro acerto.
+
+DEFAULT_CACHE_DIR = os.getenv("PDF_CACHE_DIR", os.path.join(".cache", "pdf_text"))
+DEFAULT_MAX_MEMORY_BYTES = 64 * 1024 * 1024
+DEFAULT_MAX_DISK_BYTES = int(os.getenv("PDF_CACHE_MAX_DISK_MB", "1024")) * 1024 * 1024
+# 0 desliga o limite de idade
+DEFAULT_MAX_AGE_SECONDS = float(os.getenv("PDF_CACHE_MAX_AGE_DAYS", "90")) * 24 * 3600
+
+# Incrementar quando o formato do texto extraído mudar (ex.: separador de páginas)
+CACHE_VERSION = b"2"
+
+
+class PdfTextCache:
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR, max_memory_bytes: int = DEFAULT_MAX_MEMORY_BYTES,
+                 max_disk_bytes: int = DEFAULT_MAX_DISK_BYTES, max_age_seconds: float = DEFAULT_MAX_AGE_SECONDS):
+        self.cache_dir = cache_dir
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.max_age_seconds = max_age_seconds
+        self._entries = OrderedDict()  # chave -> (texto, tamanho em bytes)
+        self._memory_bytes = 0
+        self._disk = OrderedDict()  # chave -> (tamanho em bytes, último uso), do mais antigo ao mais recente
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._scan_disk()
+        self._prune()
+
+    def _scan_disk(self):
+        found = []
+        with os.scandir(self.cache_dir) as entries:
+            for entry in entries:
+                if entry.name.endswith(".txt"):
+                    try:
+                        info = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    found.append((info.st_mtime, entry.name[:-len(".txt")], info.st_size))
+        for used_at, key, size in sorted(found):
+            self._disk[key] = (size, used_at)
+            self._disk_bytes += size
+
+    @staticmethod
+    def key_for(data: bytes) -> str:
+        return hashlib.sha256(CACHE_VERSION + b"\0" + data).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.txt")
+
+    def get(self, key: str):
+        """
+        Retorna o texto em cache para a chave, ou None se ainda não foi extraído.
+        Um acerto no disco promove a entrada de volta para a memória.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.memory_hits += 1
+                if key in self._disk:
+                    self._touch_disk(key, self._disk[key][0])
+                return entry[0]
+
+        try:
+            with open(self._path(key), "r", encoding="utf-8") as f:
+                text = f.read()
+            # O mtime guarda o último uso para a limpeza por idade após um reinício
+            os.utime(self._path(key))
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+                self._forget_disk(key)
+            return None
+
+        with self._lock:
+            self.disk_hits += 1
+            self._remember(key, text)
+            self._touch_disk(key, len(text.encode("utf-8")))
+        return text
+
+    def put(self, key: str, text: str):
+        # Escrita atômica: outro processo nunca enxerga um arquivo pela metade
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self._remember(key, text)
+            self._touch_disk(key, os.path.getsize(path))
+        self._prune()
+
+    def _remember(self, key: str, text: str):
+        size = len(text.encode("utf-8"))
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._memory_bytes -= old[1]
+        if size > self.max_memory_bytes:
+            # Texto maior que o orçamento inteiro: fica só no disco
+            return
+        self._entries[key] = (text, size)
+        self._memory_bytes += size
+        while self._memory_bytes > self.max_memory_bytes:
+            _, (_, evicted_size) = self._entries.popitem(last=False)
+            self._memory_bytes -= evicted_size
+
+    def _touch_disk(self, key: str, size: int):
+        self._forget_disk(key)
+        self._disk[key] = (size, time.time())
+        self._disk_bytes += size
+
+    def _forget_disk(self, key: str):
+        old = self._disk.pop(key, None)
+        if old is not None:
+            self._disk_bytes -= old[0]
+
+    def _prune(self):
+        """
+        Apaga do disco os textos menos usados até caber em max_disk_bytes, e
+        os sem uso há mais de max_age_seconds. Continuam valendo na memória.
+        """
+        expired = []
+        with self._lock:
+            oldest_allowed = time.time() - self.max_age_seconds if self.max_age_seconds else None
+            while self._disk:
+                key, (size, used_at) = next(iter(self._disk.items()))
+                if self._disk_bytes <= self.max_disk_bytes and (oldest_allowed is None or used_at >= oldest_allowed):
+                    break
+                self._forget_disk(key)
+                expired.append(key)
+        for key in expired:
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "memory_entries": len(self._entries),
+                "memory_bytes": self._memory_bytes,
+                "disk_entries": len(self._disk),
+                "disk_bytes": self._disk_bytes,
+            }
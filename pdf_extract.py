@@ -0,0 +1,99 @@
+﻿import io
+import os
+import tempfile
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+# ================================================
+# Extração de texto de PDFs (sequencial ou em paralelo)
+# ================================================
+# No modo paralelo o intervalo de páginas é dividido em faixas contíguas,
+# cada uma extraída por um processo do pool. As páginas são entregues por um
+# gerador, sempre na ordem do documento, e o texto final é montado com um único
+# join (sem a concatenação quadrática de `text += ...`). As páginas são
+# separadas por PAGE_SEPARATOR para que as etapas seguintes saibam onde cada
+# página começa.
+
+PDF_EXTRACTION_MODE = os.getenv("PDF_EXTRACTION_MODE", "parallel")  # "parallel" ou "sequential"
+DEFAULT_WORKERS = int(os.getenv("PDF_EXTRACTION_WORKERS", os.cpu_count() or 1))
+
+# Abaixo disso o custo de despachar para o pool supera o ganho
+MIN_PAGES_PER_WORKER = 8
+
+PAGE_SEPARATOR = "\f"
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    # Pool persistente por processo: evita recriar processos a cada PDF.
+    # "spawn" porque o servidor do Streamlit tem várias threads ativas.
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=DEFAULT_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _executor
+
+
+def _extract_range(path: str, start: int, stop: int) -> list:
+    """
+    Executado nos processos do pool: extrai as páginas [start, stop) do arquivo.
+    """
+    import PyPDF2
+    with open(path, "rb") as f:
+        reader = PyPDF2.PdfReader(f)
+        return [reader.pages[i].extract_text() or "" for i in range(start, stop)]
+
+
+def _page_ranges(total: int, workers: int) -> list:
+    size = -(-total // workers)  # divisão arredondando para cima
+    return [(start, min(start + size, total)) for start in range(0, total, size)]
+
+
+def iter_pages(data: bytes, parallel: bool = None, workers: int = None):
+    """
+    Gera o texto de cada página do PDF, na ordem do documento.
+    parallel=None usa PDF_EXTRACTION_MODE; workers=None usa DEFAULT_WORKERS.
+    """
+    if parallel is None:
+        parallel = PDF_EXTRACTION_MODE != "sequential"
+    workers = workers or DEFAULT_WORKERS
+
+    # PyPDF2 só é carregado quando há um PDF para ler
+    import PyPDF2
+    reader = PyPDF2.PdfReader(io.BytesIO(data))
+    total = len(reader.pages)
+    workers = min(workers, DEFAULT_WORKERS, total // MIN_PAGES_PER_WORKER)
+
+    if not parallel or workers < 2:
+        for page in reader.pages:
+            yield page.extract_text() or ""
+        return
+
+    # Os processos leem o PDF de um arquivo temporário, em vez de receberem
+    # uma cópia serializada dos bytes em cada tarefa
+    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as tmp:
+        tmp.write(data)
+    futures = []
+    try:
+        executor = _get_executor()
+        futures = [
+            executor.submit(_extract_range, tmp.name, start, stop)
+            for start, stop in _page_ranges(total, workers)
+        ]
+        for future in futures:
+            yield from future.result()
+    finally:
+        # Se o consumidor abandonar o gerador, as faixas pendentes são descartadas
+        for future in futures:
+            future.cancel()
+        os.remove(tmp.name)
+
+
+def extract_text(data: bytes, parallel: bool = None, workers: int = None) -> str:
+    return PAGE_SEPARATOR.join(iter_pages(data, parallel=parallel, workers=workers))
@@ -0,0 +1,363 @@
+﻿import os
+import time
+import asyncio
+import bisect
+import inspect
+import threading
+from collections import deque
+from dataclasses import dataclass
+import httpx
+from openai import AsyncOpenAI, APIStatusError as OpenAIStatusError
+from groq import AsyncGroq, APIStatusError as GroqStatusError
+from rate_limit import get_limiter, call_with_retries, is_retryable
+from tokens import count_tokens
+import metrics
+
+# ================================================
+# Camada única de provedores de LLM (OpenAI e Groq)
+# ================================================
+# Cada provedor é criado uma vez por processo e todos compartilham o mesmo
+# httpx.AsyncClient, com pool de conexões keep-alive: análises concorrentes
+# reaproveitam conexões já abertas em vez de fazer um novo handshake TLS.
+# As chamadas rodam num event loop dedicado, numa thread de fundo; código
+# síncrono (Streamlit, ThreadPoolExecutor) usa run_sync/iter_sync. Toda
+# chamada passa pelo controle de taxa e pelas novas tentativas de rate_limit.
+# As métricas das chamadas são gravadas fora do loop (metrics.record_later).
+
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT", 120))
+MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", 64))
+MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", 16))
+
+DEFAULT_SYSTEM_PROMPT = "Você é um assistente jurídico especializado."
+
+# Estimativa de tokens de saída usada na admissão quando max_tokens não é informado
+DEFAULT_OUTPUT_TOKENS_ESTIMATE = 1024
+
+
+@dataclass
+class LLMResult:
+    text: str
+    provider: str
+    model: str
+    prompt_tokens: int = None
+    completion_tokens: int = None
+    latency: float = None  # segundos até o fim da resposta
+    ttft: float = None  # segundos até o primeiro token (apenas em stream)
+
+
+# ================================================
+# Latências observadas por provedor
+# ================================================
+# Faixas de tamanho do prompt (caracteres; ~4 por token). Um trecho de
+# map_reduce ou um requisito isolado respondem muito mais rápido que o
+# contrato inteiro: misturar as latências faria o hedge de uma análise
+# completa disparar quase de imediato
+PROMPT_SIZE_BUCKETS = (4_000, 16_000, 64_000)
+
+
+def size_bucket(prompt_chars: int) -> int:
+    return bisect.bisect_right(PROMPT_SIZE_BUCKETS, prompt_chars or 0)
+
+
+class LatencyTracker:
+    """
+    Guarda as latências mais recentes por (provedor, modelo, tipo, faixa de
+    tamanho do prompt), onde tipo é "ttft" (primeiro token em stream) ou
+    "total" (resposta completa).
+    """
+
+    def __init__(self, window: int = 100):
+        self.window = window
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, provider: str, model: str, kind: str, seconds: float, prompt_chars: int = 0):
+        with self._lock:
+            key = (provider, model, kind, size_bucket(prompt_chars))
+            samples = self._samples.setdefault(key, deque(maxlen=self.window))
+            samples.append(seconds)
+
+    def percentile(self, provider: str, model: str, kind: str, q: float, min_samples: int = 1,
+                   prompt_chars: int = 0):
+        """
+        Percentil q (0 a 1) das amostras recentes de prompts da mesma faixa de
+        tamanho, ou None se houver menos de min_samples.
+        """
+        with self._lock:
+            samples = sorted(self._samples.get((provider, model, kind, size_bucket(prompt_chars)), ()))
+        if len(samples) < max(1, min_samples):
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+
+latency_tracker = LatencyTracker()
+
+
+# ================================================
+# Event loop e cliente HTTP compartilhados
+# ================================================
+_loop = None
+_http_client = None
+_providers = {}
+_lock = threading.Lock()
+
+
+def get_loop() -> asyncio.AbstractEventLoop:
+    global _loop
+    with _lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="llm-event-loop", daemon=True).start()
+        return _loop
+
+
+def run_sync(coro):
+    """
+    Executa a corrotina no event loop dos provedores e espera o resultado.
+    """
+    return asyncio.run_coroutine_threadsafe(coro, get_loop()).result()
+
+
+def iter_sync(async_iterator):
+    """
+    Consome um iterador assíncrono (ex.: Provider.stream) a partir de código síncrono.
+    """
+    loop = get_loop()
+    while True:
+        try:
+            yield asyncio.run_coroutine_threadsafe(async_iterator.__anext__(), loop).result()
+        except StopAsyncIteration:
+            return
+
+
+def get_http_client() -> httpx.AsyncClient:
+    global _http_client
+    with _lock:
+        if _http_client is None:
+            _http_client = httpx.AsyncClient(
+                timeout=httpx.Timeout(LLM_TIMEOUT_SECONDS, connect=10.0),
+                limits=httpx.Limits(
+                    max_connections=MAX_CONNECTIONS,
+                    max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+                ),
+            )
+        return _http_client
+
+
+# ================================================
+# Provedores
+# ================================================
+class LLMStream:
+    """
+    Iterador assíncrono com os pedaços de texto da resposta. Ao final,
+    `result` traz o texto completo, uso de tokens e latências.
+    """
+
+    def __init__(self, provider, chunks, started: float, prompt_chars: int = 0):
+        self.provider = provider
+        self._chunks = chunks
+        self._started = started
+        self._prompt_chars = prompt_chars
+        self._parts = []
+        self.result = None
+        self._prompt_tokens = None
+        self._completion_tokens = None
+        self._ttft = None
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> str:
+        while True:
+            try:
+                chunk = await self._chunks.__anext__()
+            except StopAsyncIteration:
+                self._finish()
+                raise
+            usage = getattr(chunk, "usage", None) or getattr(getattr(chunk, "x_groq", None), "usage", None)
+            if usage is not None:
+                self._prompt_tokens = usage.prompt_tokens
+                self._completion_tokens = usage.completion_tokens
+            if chunk.choices and chunk.choices[0].delta.content:
+                if self._ttft is None:
+                    self._ttft = time.perf_counter() - self._started
+                    latency_tracker.record(self.provider.name, self.provider.model, "ttft", self._ttft,
+                                           self._prompt_chars)
+                self._parts.append(chunk.choices[0].delta.content)
+                return chunk.choices[0].delta.content
+
+    def _finish(self):
+        self.result = LLMResult(
+            text="".join(self._parts),
+            provider=self.provider.name,
+            model=self.provider.model,
+            prompt_tokens=self._prompt_tokens,
+            completion_tokens=self._completion_tokens,
+            latency=time.perf_counter() - self._started,
+            ttft=self._ttft,
+        )
+        metrics.record_later(
+            "llm_call", self.result.latency, provider=self.provider.name, model=self.provider.model,
+            tokens_in=self._prompt_tokens, tokens_out=self._completion_tokens, ttft=self._ttft, stream=True,
+        )
+
+    async def aclose(self):
+        # Encerra a conexão de um stream que não será mais consumido
+        close = getattr(self._chunks, "aclose", None)
+        if close is not None:
+            await close()
+
+
+def api_error(provider: str, exc: BaseException) -> ValueError:
+    """
+    Erro definitivo do SDK (chave inválida, contexto grande demais, modelo
+    inexistente...) traduzido para a mensagem exibida ao advogado.
+    """
+    api = provider.upper()
+    status = getattr(exc, "status_code", None)
+    # body é o JSON de resposta (a OpenAI já entrega só o objeto "error")
+    body = getattr(exc, "body", None)
+    if isinstance(body, dict) and isinstance(body.get("error"), dict):
+        body = body["error"]
+    detail = (body.get("message") if isinstance(body, dict) else None) or getattr(exc, "message", None) or str(exc)
+    if status in (401, 403):
+        return ValueError(f"A chave da API {api} é inválida ou não tem permissão para este modelo.")
+    if status == 404:
+        return ValueError(f"O modelo solicitado não está disponível na API {api}.")
+    if status in (400, 413, 422):
+        return ValueError(
+            f"A API {api} recusou a requisição (o contrato pode ser grande demais para o modelo): {detail}"
+        )
+    return ValueError(f"Erro ao processar a resposta com a API {api} (HTTP {status}): {detail}")
+
+
+class Provider:
+    name = None
+
+    def __init__(self, model: str, api_key: str, temperature: float = None):
+        self.model = model
+        self.temperature = temperature
+        self.client = self._make_client(api_key, get_http_client())
+
+    def _make_client(self, api_key: str, http_client: httpx.AsyncClient):
+        raise NotImplementedError
+
+    def _messages(self, prompt: str, system: str) -> list:
+        messages = []
+        if system:
+            messages.append({"role": "system", "content": system})
+        messages.append({"role": "user", "content": prompt})
+        return messages
+
+    def _options(self, **kwargs) -> dict:
+        options = {"model": self.model}
+        if self.temperature is not None:
+            options["temperature"] = self.temperature
+        options.update({k: v for k, v in kwargs.items() if v is not None})
+        return options
+
+    def _estimate_tokens(self, prompt: str, system: str, max_tokens: int = None) -> int:
+        return count_tokens(f"{system or ''}\n{prompt}", self.model) + (max_tokens or DEFAULT_OUTPUT_TOKENS_ESTIMATE)
+
+    async def _create(self, prompt: str, system: str, **options):
+        """
+        Cria a chamada respeitando o limite de taxa, com novas tentativas em
+        erros transitórios. Devolve a resposta já interpretada pelo SDK.
+        """
+        limiter = get_limiter(self.name, self.model)
+        estimated = self._estimate_tokens(prompt, system, options.get("max_tokens"))
+        messages = self._messages(prompt, system)
+        try:
+            raw = await call_with_retries(
+                limiter, estimated,
+                lambda: self.client.chat.completions.with_raw_response.create(messages=messages, **options),
+            )
+        except Exception as exc:
+            if is_retryable(exc):
+                raise ValueError(
+                    f"A API {self.name.upper()} está sobrecarregada ou limitando requisições "
+                    f"mesmo após várias tentativas. Tente novamente em alguns instantes."
+                ) from exc
+            if isinstance(exc, (OpenAIStatusError, GroqStatusError)):
+                raise api_error(self.name, exc) from exc
+            raise
+        parsed = raw.parse()
+        # Com stream=True, o SDK da OpenAI devolve o AsyncStream diretamente
+        if inspect.isawaitable(parsed):
+            parsed = await parsed
+        return parsed
+
+    async def complete(self, prompt: str, system: str = DEFAULT_SYSTEM_PROMPT, **kwargs) -> LLMResult:
+        started = time.perf_counter()
+        try:
+            completion = await self._create(prompt, system, **self._options(**kwargs))
+            if not completion.choices:
+                raise ValueError(f"Erro ao processar a resposta com a API {self.name.upper()}.")
+        except Exception:
+            metrics.record_later("llm_call", time.perf_counter() - started, provider=self.name, model=self.model, status="error")
+            raise
+        usage = completion.usage
+        latency = time.perf_counter() - started
+        latency_tracker.record(self.name, self.model, "total", latency, len(prompt) + len(system or ""))
+        metrics.record_later(
+            "llm_call", latency, provider=self.name, model=self.model,
+            tokens_in=getattr(usage, "prompt_tokens", None), tokens_out=getattr(usage, "completion_tokens", None),
+        )
+        return LLMResult(
+            text=completion.choices[0].message.content or "",
+            provider=self.name,
+            model=self.model,
+            prompt_tokens=getattr(usage, "prompt_tokens", None),
+            completion_tokens=getattr(usage, "completion_tokens", None),
+            latency=latency,
+        )
+
+    async def stream(self, prompt: str, system: str = DEFAULT_SYSTEM_PROMPT, **kwargs) -> LLMStream:
+        started = time.perf_counter()
+        chunks = await self._create(prompt, system, stream=True, **self._options(**self._stream_options(), **kwargs))
+        return LLMStream(self, chunks.__aiter__(), started, len(prompt) + len(system or ""))
+
+    def _stream_options(self) -> dict:
+        return {}
+
+
+class OpenAIProvider(Provider):
+    name = "openai"
+
+    def _make_client(self, api_key, http_client):
+        # max_retries=0: as novas tentativas ficam a cargo de rate_limit
+        return AsyncOpenAI(api_key=api_key, http_client=http_client, max_retries=0)
+
+    def _stream_options(self) -> dict:
+        # Pede o uso de tokens no último pedaço do stream
+        return {"stream_options": {"include_usage": True}}
+
+
+class GroqProvider(Provider):
+    name = "groq"
+
+    def _make_client(self, api_key, http_client):
+        # O uso de tokens do stream vem em x_groq.usage no último pedaço
+        return AsyncGroq(api_key=api_key, http_client=http_client, max_retries=0)
+
+
+PROVIDER_CLASSES = {
+    OpenAIProvider.name: OpenAIProvider,
+    GroqProvider.name: GroqProvider,
+}
+
+
+def get_provider(name: str, model: str, api_key: str, temperature: float = None) -> Provider:
+    """
+    Retorna o provedor compartilhado pelo processo para (name, model).
+    """
+    if name not in PROVIDER_CLASSES:
+        raise ValueError("Provedor inválido. Use 'openai' ou 'groq'.")
+    key = (name, model)
+    with _lock:
+        provider = _providers.get(key)
+    if provider is None:
+        provider = PROVIDER_CLASSES[name](model, api_key, temperature)
+        with _lock:
+            provider = _providers.setdefault(key, provider)
+    return provider
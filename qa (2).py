@@ -1,16 +1,16 @@
 ﻿import os
-import PyPDF2
-from groq import Groq
 import streamlit as st
 from dotenv import load_dotenv
-from langchain_community.document_loaders import CSVLoader
-from langchain_community.vectorstores import FAISS
-from langchain_openai import OpenAIEmbeddings, ChatOpenAI
-from google_auth_oauthlib.flow import Flow
-from google.oauth2.credentials import Credentials
+# PyPDF2, langchain, FAISS e o SDK da Groq ficam dentro das funções que os
+# usam: o Streamlit reexecuta este script a cada interação, e a tela abre
+# antes de carregá-los.
 
-# Carregar variáveis de ambiente
-load_dotenv()
+# Carregar variáveis de ambiente (uma vez por processo, e não a cada rerun)
+@st.cache_resource(show_spinner=False)
+def load_environment():
+    load_dotenv()
+
+load_environment()
 
 # Chaves de API
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
@@ -19,13 +19,45 @@ GOOGLE_CLIENT_ID = os.getenv("GOOGLE_CLIENT_ID")
 GOOGLE_CLIENT_SECRET = os.getenv("GOOGLE_CLIENT_SECRET")
 REDIRECT_URI = os.getenv("REDIRECT_URI")
 
-# Inicializar cliente GROQ
-groq_client = Groq(api_key=GROQ_API_KEY)
+# Cliente GROQ e LLM da OpenAI: criados uma vez por processo
+@st.cache_resource
+def get_groq_client():
+    from groq import Groq
+    return Groq(api_key=GROQ_API_KEY)
+
+@st.cache_resource
+def get_openai_llm():
+    from langchain_openai import ChatOpenAI
+    return ChatOpenAI(temperature=0, model="gpt-3.5-turbo", openai_api_key=OPENAI_API_KEY)
 
-# Carregar o CSV
+# Carregar o CSV (lido uma vez por processo; de novo só se o arquivo mudar)
 data_file = "qa_with_id_first_column.csv"
-loader = CSVLoader(file_path=data_file)
-documents = loader.load()
+
+@st.cache_resource
+def get_documents(csv_mtime: float):
+    from langchain_community.document_loaders import CSVLoader
+    return CSVLoader(file_path=data_file).load()
+
+def load_documents():
+    return get_documents(os.path.getmtime(data_file))
+
+# Índice id -> documento, montado uma vez junto com os documentos.
+# O page_content do CSVLoader tem uma linha "coluna: valor" por coluna, começando por "id: 5"
+@st.cache_resource
+def get_documents_by_id(csv_mtime: float):
+    return {
+        doc.page_content.split("\n", 1)[0].partition(":")[2].strip(): doc for doc in get_documents(csv_mtime)
+    }
+
+# Índice FAISS persistente (reconstruído só para linhas alteradas do CSV)
+@st.cache_resource
+def get_vector_store(csv_mtime: float):
+    # csv_mtime faz parte da chave do cache: editar o CSV força a revalidação
+    from langchain_openai import OpenAIEmbeddings
+    from embedding_cache import CachedEmbeddings
+    from faiss_store import default_index_dir, load_or_build_index
+    embeddings = CachedEmbeddings(OpenAIEmbeddings(openai_api_key=OPENAI_API_KEY))
+    return load_or_build_index(get_documents(csv_mtime), embeddings, default_index_dir(data_file))
 
 # ============================================
 # Função que localiza a linha de CSV por ID
@@ -33,29 +65,23 @@ documents = loader.load()
 def get_document_for_contract(selection: str):
     """
     Recebe algo como '5 - Contrato de Consumo ou prestação de serviços'
-    Extrai o '5' e localiza a linha do CSV (doc) que inicia com '5,'.
+    Extrai o '5' e retorna o conteúdo do documento do CSV com esse id.
     """
     # Tenta extrair o ID:
     contract_id = selection.split("-")[0].strip()  # '5'
 
-    # Ver o que realmente tem em doc.page_content
-    # (Se quiser depurar, pode imprimir doc.page_content)
-    for doc in documents:
-        splitted = doc.page_content.split(",", 1)  # ['5', 'Contrato de Consumo...,Protege...']
-        if splitted[0].strip() == contract_id:
-            return doc.page_content  # retorna a linha inteira do CSV
-    return None
+    doc = get_documents_by_id(os.path.getmtime(data_file)).get(contract_id)
+    return doc.page_content if doc is not None else None  # a linha inteira do CSV
 
 
 def initialize_embeddings(provider):
     if provider == "openai":
-        embeddings = OpenAIEmbeddings(openai_api_key=OPENAI_API_KEY)
-        llm = ChatOpenAI(temperature=0, model="gpt-3.5-turbo", openai_api_key=OPENAI_API_KEY)
-        db = FAISS.from_documents(documents, embeddings)
+        llm = get_openai_llm()
+        db = get_vector_store(os.path.getmtime(data_file))
         return db, llm
     elif provider == "groq":
-        db = [{"content": doc.page_content} for doc in documents]
-        return db, groq_client
+        db = [{"content": doc.page_content} for doc in load_documents()]
+        return db, get_groq_client()
     else:
         raise ValueError("Provedor de API inválido. Use 'openai' ou 'groq'.")
 
@@ -109,7 +135,7 @@ def generate_response(pdf_text, contract_type, db, llm, provider):
             {"role": "system", "content": "Você é um assistente jurídico e deve se ater ao escopo do contrato."},
             {"role": "user", "content": prompt}
         ]
-        chat_completion = groq_client.chat.completions.create(
+        chat_completion = get_groq_client().chat.completions.create(
             messages=messages,
             model="llama-3.3-70b-versatile",
         )
@@ -123,6 +149,7 @@ def generate_response(pdf_text, contract_type, db, llm, provider):
 
 def process_pdf(file):
     try:
+        import PyPDF2
         pdf_reader = PyPDF2.PdfReader(file)
         text = ""
         for page in pdf_reader.pages:
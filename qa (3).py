@@ -1,55 +1,80 @@
 ﻿import os
-import csv
-import PyPDF2
 import streamlit as st
 from dotenv import load_dotenv
-from langchain_openai import OpenAIEmbeddings, ChatOpenAI
-from groq import Groq
+from requirements_registry import CsvTable
+from user_store import UserStore
+# PyPDF2, langchain e o SDK da Groq ficam dentro das funções que os usam: o
+# Streamlit reexecuta este script a cada interação, e o login abre antes de
+# carregá-los.
 
 # ================================================
 # Carregar variáveis de ambiente (opcional)
 # ================================================
-load_dotenv()
+@st.cache_resource(show_spinner=False)
+def load_environment():
+    # Uma vez por processo, e não a cada rerun
+    load_dotenv()
+
+load_environment()
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 
 # ================================================
-# Ler CSV de usuários (para autenticação)
+# Usuários (para autenticação)
 # ================================================
+# Cadastro em SQLite com senhas em bcrypt (user_store.py); users.csv é
+# sincronizado a cada login e a cada rerun de uma sessão aberta, se tiver
+# mudado. Nos reruns o usuário é reconhecido pelo token da sessão, sem bcrypt
 users_file = "users.csv"
-users_data = []
-with open(users_file, "r", encoding="utf-8-sig") as f:
-    reader = csv.DictReader(f)
-    for row in reader:
-        users_data.append(row)
 
-def authenticate_user(username: str, password: str) -> bool:
-    for user in users_data:
-        if user["username"] == username and user["password"] == password:
-            return True
-    return False
+@st.cache_resource(show_spinner=False)
+def get_user_store() -> UserStore:
+    return UserStore()
+
+def sync_users() -> UserStore:
+    store = get_user_store()
+    store.sync_csv(users_file)
+    return store
+
+def authenticate_user(username: str, password: str) -> str:
+    # Token da nova sessão, ou None se o usuário ou a senha não conferem
+    return sync_users().login(username, password)
+
+def end_session():
+    token = st.session_state.pop("session_token", None)
+    if token:
+        get_user_store().logout(token)
+    st.session_state["logged_in"] = False
 
 # ================================================
 # Ler CSV de contratos (qa_with_id_first_column.csv)
 # ================================================
 data_file = "qa_with_id_first_column.csv"
-rows = []
-with open(data_file, "r", encoding="utf-8") as f:
-    reader = csv.DictReader(f)
-    for r in reader:
-        rows.append(r)
+
+# Indexado por id uma vez por processo; relido só se o arquivo mudar
+@st.cache_resource
+def get_contracts_table() -> CsvTable:
+    return CsvTable(data_file)
 
 # ================================================
 # Inicializar LLMs ou outra IA
 # ================================================
+# Clientes criados uma vez por processo, e não a cada análise
+@st.cache_resource
+def get_openai_llm():
+    from langchain_openai import ChatOpenAI
+    return ChatOpenAI(temperature=0, model="gpt-3.5-turbo", openai_api_key=OPENAI_API_KEY)
+
+@st.cache_resource
+def get_groq_client():
+    from groq import Groq
+    return Groq(api_key=GROQ_API_KEY)
+
 def initialize_embeddings(provider="openai"):
     if provider == "openai":
-        embeddings = OpenAIEmbeddings(openai_api_key=OPENAI_API_KEY)
-        llm = ChatOpenAI(temperature=0, model="gpt-3.5-turbo", openai_api_key=OPENAI_API_KEY)
-        return llm
+        return get_openai_llm()
     elif provider == "groq":
-        groq_client = Groq(api_key=GROQ_API_KEY)
-        return groq_client
+        return get_groq_client()
     else:
         raise ValueError("Provedor inválido. Use 'openai' ou 'groq'.")
 
@@ -58,10 +83,7 @@ def initialize_embeddings(provider="openai"):
 # ================================================
 def get_csv_row_by_id(selection: str):
     contract_id = selection.split("-")[0].strip()  # ex.: '5'
-    for r in rows:
-        if r["id"].strip() == contract_id:
-            return r
-    return None
+    return get_contracts_table().get(contract_id)
 
 # ================================================
 # Geração de resposta final
@@ -87,6 +109,7 @@ def generate_response(pdf_text: str, selected_contract: str, llm_or_groq, analys
         [PROMPT DE ANÁLISE COMPLETA...]
         """
 
+    from langchain_openai import ChatOpenAI
     if isinstance(llm_or_groq, ChatOpenAI):
         response = llm_or_groq(prompt)
         return response.content if hasattr(response, "content") else "Erro ao processar."
@@ -111,6 +134,7 @@ def generate_response(pdf_text: str, selected_contract: str, llm_or_groq, analys
 # ================================================
 def process_pdf(file) -> str:
     try:
+        import PyPDF2
         pdf_reader = PyPDF2.PdfReader(file)
         text = ""
         for page in pdf_reader.pages:
@@ -144,13 +168,20 @@ def main():
     if "logged_in" not in st.session_state:
         st.session_state["logged_in"] = False
 
+    # Sessão expirada ou encerrada (ex.: senha trocada): volta para o login
+    if st.session_state["logged_in"] and not sync_users().verify_session(st.session_state.get("session_token")):
+        end_session()
+        st.warning("Sua sessão expirou. Entre novamente.")
+
     if not st.session_state["logged_in"]:
         st.subheader("Login")
         username = st.text_input("Usuário:")
         password = st.text_input("Senha:", type="password")
         if st.button("Entrar"):
-            if authenticate_user(username, password):
+            token = authenticate_user(username, password)
+            if token:
                 st.session_state["logged_in"] = True
+                st.session_state["session_token"] = token
                 st.success(f"Bem-vindo, {username}!")
                 st.write("DEBUG: logged_in =", st.session_state["logged_in"])
             else:
@@ -1,17 +1,16 @@
 ﻿import os
-import PyPDF2
-from groq import Groq
 import streamlit as st
 from dotenv import load_dotenv
-from langchain_community.document_loaders import CSVLoader
-from langchain_community.vectorstores import FAISS
-from langchain_openai import OpenAIEmbeddings, ChatOpenAI
-from streamlit_authenticator import Authenticate
-from google_auth_oauthlib.flow import Flow
-from google.oauth2.credentials import Credentials
+# PyPDF2, langchain, FAISS, o SDK da Groq e o OAuth do Google ficam dentro
+# das funções que os usam: o Streamlit reexecuta este script a cada
+# interação, e a tela abre antes de carregá-los.
 
-# Carregar variáveis de ambiente
-load_dotenv()
+# Carregar variáveis de ambiente (uma vez por processo, e não a cada rerun)
+@st.cache_resource(show_spinner=False)
+def load_environment():
+    load_dotenv()
+
+load_environment()
 
 # Chaves de API
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
@@ -20,24 +19,47 @@ GOOGLE_CLIENT_ID = os.getenv("GOOGLE_CLIENT_ID")
 GOOGLE_CLIENT_SECRET = os.getenv("GOOGLE_CLIENT_SECRET")
 REDIRECT_URI = os.getenv("REDIRECT_URI")
 
-# Inicializar cliente GROQ
-groq_client = Groq(api_key=GROQ_API_KEY)
+# Cliente GROQ e LLM da OpenAI: criados uma vez por processo
+@st.cache_resource
+def get_groq_client():
+    from groq import Groq
+    return Groq(api_key=GROQ_API_KEY)
+
+@st.cache_resource
+def get_openai_llm():
+    from langchain_openai import ChatOpenAI
+    return ChatOpenAI(temperature=0, model="gpt-3.5-turbo", openai_api_key=OPENAI_API_KEY)
 
-# Carregar o CSV
+# Carregar o CSV (lido uma vez por processo; de novo só se o arquivo mudar)
 data_file = "qa_with_id_first_column.csv"
-loader = CSVLoader(file_path=data_file)
-documents = loader.load()
+
+@st.cache_resource
+def get_documents(csv_mtime: float):
+    from langchain_community.document_loaders import CSVLoader
+    return CSVLoader(file_path=data_file).load()
+
+def load_documents():
+    return get_documents(os.path.getmtime(data_file))
+
+# Índice FAISS persistente (reconstruído só para linhas alteradas do CSV)
+@st.cache_resource
+def get_vector_store(csv_mtime: float):
+    # csv_mtime faz parte da chave do cache: editar o CSV força a revalidação
+    from langchain_openai import OpenAIEmbeddings
+    from embedding_cache import CachedEmbeddings
+    from faiss_store import default_index_dir, load_or_build_index
+    embeddings = CachedEmbeddings(OpenAIEmbeddings(openai_api_key=OPENAI_API_KEY))
+    return load_or_build_index(get_documents(csv_mtime), embeddings, default_index_dir(data_file))
 
 # Configurar embeddings e FAISS
 def initialize_embeddings(provider):
     if provider == "openai":
-        embeddings = OpenAIEmbeddings(openai_api_key=OPENAI_API_KEY)
-        llm = ChatOpenAI(temperature=0, model="gpt-3.5-turbo", openai_api_key=OPENAI_API_KEY)
-        db = FAISS.from_documents(documents, embeddings)
+        llm = get_openai_llm()
+        db = get_vector_store(os.path.getmtime(data_file))
         return db, llm
     elif provider == "groq":
-        db = [{"content": doc.page_content} for doc in documents]
-        return db, groq_client
+        db = [{"content": doc.page_content} for doc in load_documents()]
+        return db, get_groq_client()
     else:
         raise ValueError("Provedor de API inválido. Use 'openai' ou 'groq'.")
 
@@ -51,7 +73,7 @@ def retrieve_info(query, db, provider):
             {"role": "system", "content": "Você é um assistente jurídico."},
             {"role": "user", "content": f"Encontre informações relacionadas a: {query}"}
         ]
-        response = groq_client.chat.completions.create(
+        response = get_groq_client().chat.completions.create(
             messages=messages,
             model="llama-3.3-70b-versatile"
         )
@@ -140,7 +162,7 @@ def generate_response(message, contract_type, db, llm, provider):
         response = llm(prompt)
         return response.content if hasattr(response, 'content') else "Erro ao processar a resposta."
     elif provider == "groq":
-        chat_completion = groq_client.chat.completions.create(
+        chat_completion = get_groq_client().chat.completions.create(
             messages=[
                 {"role": "system", "content": "Você é um assistente jurídico e deve se ater com a solicitação e os dados que possui."},
                 {"role": "user", "content": prompt2}
@@ -155,6 +177,7 @@ def generate_response(message, contract_type, db, llm, provider):
 # Função para processar PDF
 def process_pdf(file):
     try:
+        import PyPDF2
         pdf_reader = PyPDF2.PdfReader(file)
         text = ""
         for page in pdf_reader.pages:
@@ -168,6 +191,7 @@ def process_pdf(file):
 
 # Função de autenticação com Google
 def authenticate_user():
+    from google_auth_oauthlib.flow import Flow
     flow = Flow.from_client_config(
         {
             "web": {
@@ -1,33 +1,98 @@
 ﻿import os
-import csv
-import PyPDF2
+import time
+import startup_profile
+# Com STARTUP_PROFILE=1, mede os imports abaixo e as etapas desta execução do script
+startup_profile.start()
 import streamlit as st
 from dotenv import load_dotenv
-from langchain_openai import OpenAIEmbeddings, ChatOpenAI
-from groq import Groq
+from pdf_cache import PdfTextCache
+from pdf_extract import extract_text, PAGE_SEPARATOR
+from text_normalize import normalize_cached
+from response_cache import ResponseCache
+from requirements_registry import RequirementsRegistry
+from contract_versions import VersionStore, analyze_incremental, text_hash
+from tokens import split_by_tokens, count_tokens
+from jobs import JobManager
+from user_store import UserStore
+import metrics
+from scheduler import QuotaExceeded
+from token_budget import plan_prompt, UsageMeter, UsageLog
+from map_reduce import analyze_map_reduce, DEFAULT_CHUNK_TOKENS
+from fanout import analyze_per_requirement, select_passages
+from clause_index import get_clause_index, requirement_query
+# providers/hedging (SDKs da OpenAI e da Groq, httpx) e structured_output
+# (pydantic) são os imports mais pesados: ficam dentro das funções que os
+# usam, para a tela de login abrir sem carregá-los.
 
 # ================================================
 # Carregar variáveis de ambiente
 # ================================================
-load_dotenv()
+@st.cache_resource(show_spinner=False)
+def load_environment():
+    # O .env é lido uma vez por processo, e não a cada rerun do script. Sem
+    # spinner: ele seria um elemento na tela antes do st.set_page_config
+    load_dotenv()
+
+with startup_profile.section("load_environment"):
+    load_environment()
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 
+OPENAI_MODEL = "gpt-3.5-turbo"
+GROQ_MODEL = "llama-3.3-70b-versatile"
+
+# Incrementar sempre que os prompts de generate_response mudarem,
+# para que respostas em cache de prompts antigos não sejam reaproveitadas
+PROMPT_VERSION = "2"
+
+# Tokens reservados para a resposta ao decidir se o prompt cabe no contexto do modelo
+RESERVED_OUTPUT_TOKENS = 2048
+
+# Cláusulas buscadas por requisito na estratégia "relevant_clauses"
+RELEVANT_CLAUSES_PER_REQUIREMENT = 3
+
+# Intervalo mínimo (s) entre atualizações da tela durante o streaming
+STREAM_REFRESH_SECONDS = 0.1
+
+# Usuários que veem a página de métricas
+ADMIN_USERS = set(os.getenv("ADMIN_USERS", "admin").split(","))
+
 # ================================================
-# Ler CSV de usuários (para autenticação)
+# Usuários (para autenticação)
 # ================================================
+# Cadastro em SQLite com senhas em bcrypt (user_store.py). Os CSVs continuam
+# valendo: a cada login e a cada rerun de uma sessão aberta, um CSV alterado
+# é sincronizado (inclusões, senhas trocadas e remoções; sem mudança, custa
+# só um stat do arquivo). O usuário logado é reconhecido nos reruns pelo
+# token da sessão, sem refazer o bcrypt.
 users_file = "users.csv"
-users_data = []
-with open(users_file, "r", encoding="utf-8-sig") as f:
-    reader = csv.DictReader(f)
-    for row in reader:
-        users_data.append(row)
+authorized_users_file = "authorized_users.csv"
+
+@st.cache_resource
+def get_user_store() -> UserStore:
+    return UserStore()
 
-def authenticate_user(username: str, password: str) -> bool:
-    for user in users_data:
-        if user["username"] == username and user["password"] == password:
-            return True
-    return False
+def sync_users() -> UserStore:
+    store = get_user_store()
+    for path in (users_file, authorized_users_file):
+        store.sync_csv(path)
+    return store
+
+def authenticate_user(username: str, password: str) -> str:
+    """
+    Retorna o token da nova sessão, ou None se o usuário ou a senha não conferem.
+    """
+    return sync_users().login(username, password)
+
+def end_session():
+    token = st.session_state.pop("session_token", None)
+    if token:
+        get_user_store().logout(token)
+    st.session_state["logged_in"] = False
+    st.session_state.pop("username", None)
+    # O job da análise é do usuário que saiu: não fica na sessão nem na URL
+    st.session_state.pop("job_id", None)
+    st.query_params.pop("job", None)
 
 # ================================================
 # Mapear cada contrato a um arquivo CSV específico
@@ -39,70 +104,95 @@ contract_csv_map = {
     # etc. (adicione os outros contratos conforme você criar os arquivos)
 }
 
+@st.cache_resource
+def get_requirements_registry() -> RequirementsRegistry:
+    # Todos os CSVs são lidos uma vez; depois só são relidos se o arquivo mudar
+    with metrics.span("requirements_load", contract_id="*") as span:
+        registry = RequirementsRegistry(contract_csv_map)
+        span.set(rows=registry.stats()["requisitos"])
+    return registry
+
+def get_contract_requirements(contract_id: str):
+    """
+    Tabela de requisitos (requirements_registry.CsvTable) do contrato, ou None.
+    O span só é gravado quando o CSV é de fato relido; a consulta ao registro
+    em memória conta só como acerto de cache.
+    """
+    registry = get_requirements_registry()
+    loads = registry.loads
+    started = time.perf_counter()
+    requirements = registry.get(contract_id)
+    if registry.loads != loads:
+        metrics.record("requirements_load", time.perf_counter() - started, contract_id=contract_id,
+                       rows=len(requirements.rows) if requirements is not None else 0, cache_hit=False)
+    else:
+        metrics.count("cache_hits", "requirements_load")
+    return requirements
+
 def load_contract_requirements(contract_id: str):
     """
-    Carrega o arquivo CSV específico para o contrato.
-    Ex: se contract_id = '5', abre '5_consumo_prestacaoservico.csv'.
-    Retorna uma lista de dicionários (each row).
+    Requisitos do contrato a partir do registro em memória.
+    Ex: se contract_id = '5', vêm de '5_consumo_prestacaoservico.csv'.
+    Retorna uma lista de dicionários (each row), somente leitura.
     """
-    if contract_id not in contract_csv_map:
-        # Retorna lista vazia ou levanta exceção caso não haja mapeamento
+    requirements = get_contract_requirements(contract_id)
+    if requirements is None:
+        # Retorna lista vazia caso não haja mapeamento ou arquivo
         return []
-
-    data_file = contract_csv_map[contract_id]
-    
-    rows = []
-    with open(data_file, "r", encoding="utf-8") as f:
-        reader = csv.DictReader(f, delimiter=",")
-        for r in reader:
-            rows.append(r)
-    return rows
+    return requirements.rows
 
 # ================================================
 # Inicializar LLMs
 # ================================================
 def initialize_embeddings(provider="openai"):
+    """
+    Retorna o provedor (providers.Provider) compartilhado pelo processo:
+    o cliente e o pool de conexões HTTP são criados só na primeira chamada.
+    """
+    from providers import get_provider
     if provider == "openai":
-        embeddings = OpenAIEmbeddings(openai_api_key=OPENAI_API_KEY)
-        llm = ChatOpenAI(temperature=0, model="gpt-3.5-turbo", openai_api_key=OPENAI_API_KEY)
-        return llm
+        return get_provider("openai", OPENAI_MODEL, OPENAI_API_KEY, temperature=0)
     elif provider == "groq":
-        groq_client = Groq(api_key=GROQ_API_KEY)
-        return groq_client
+        return get_provider("groq", GROQ_MODEL, GROQ_API_KEY)
     else:
         raise ValueError("Provedor inválido. Use 'openai' ou 'groq'.")
 
 # ================================================
-# Geração de resposta 
+# Cache de respostas
 # ================================================
-def generate_response(pdf_text: str, selected_contract: str, llm_or_groq, analysis_mode: str) -> str:
+@st.cache_resource
+def get_response_cache() -> ResponseCache:
+    return ResponseCache()
+
+@st.cache_resource
+def get_version_store() -> VersionStore:
+    # Versões já analisadas de cada contrato, para a reanálise incremental
+    return VersionStore()
+
+@st.cache_resource
+def get_usage_log() -> UsageLog:
+    # Tokens e custo estimado de cada análise, em .cache/usage.jsonl
+    return UsageLog()
+
+# ================================================
+# Montagem do prompt
+# ================================================
+def relevant_clauses_text(pdf_text: str, rows: list) -> str:
     """
-    analysis_mode: "Apenas Requisitos" ou "Completo".
+    Só as cláusulas encontradas pelo índice BM25 para os requisitos.
     """
-    # 1) Extrair ID do contrato
-    contract_id = selected_contract.split("-")[0].strip()  # e.g. '5'
-    
-    # 2) Carregar requisitos do CSV específico
-    rows = load_contract_requirements(contract_id)
-    if not rows:
-        return f"Não encontrei arquivo de requisitos para o contrato de ID {contract_id}."
-
-    # 3) Montar texto com base nos requisitos
-    # Por exemplo, iremos concatenar todos os requisitos em um texto para a IA
-    requirements_text = ""
-    for row in rows:
-        requirements_text += (
-            f"- ({row.get('id')}) {row.get('tema')}: {row.get('requisito')} "
-            f"[Fundamento: {row.get('fundamento_legal')}] "
-            f"(Prioridade: {row.get('prioridade')})\n"
-        )
+    clauses = get_clause_index(pdf_text).search_many(
+        [requirement_query(row) for row in rows], k=RELEVANT_CLAUSES_PER_REQUIREMENT
+    )
+    return "\n\n".join(clause.render() for clause in clauses)
 
+def build_prompt(contract_text: str, requirements_text: str, contract_id: str, analysis_mode: str) -> str:
     if analysis_mode == "Apenas Requisitos":
-        prompt = f"""
+        return f"""
         Você é um assistente virtual especializado em análise de contratos.
 
         TEXTO DO CONTRATO:
-        {pdf_text}
+        {contract_text}
 
         REQUISITOS (DO CSV):
         {requirements_text}
@@ -115,13 +205,12 @@ def generate_response(pdf_text: str, selected_contract: str, llm_or_groq, analys
         5. Conclua com sugestões de melhoria (💡).
         """
 
-    else:
-        # "Completo": cláusula a cláusula
-        prompt = f"""
+    # "Completo": cláusula a cláusula
+    return f"""
         Você é um assistente virtual especializado em análise de contratos.
 
         TEXTO DO CONTRATO:
-        {pdf_text}
+        {contract_text}
 
         Estes são os requisitos pertinentes a esse tipo de contrato (ID {contract_id}):
         {requirements_text}
@@ -133,50 +222,391 @@ def generate_response(pdf_text: str, selected_contract: str, llm_or_groq, analys
         - Ao final, inclua sugestões de melhoria com o ícone 💡.
         """
 
-    # 4) Chamar LLM
-    if hasattr(llm_or_groq, "predict"):
-        # Caso seja um ChatOpenAI (Langchain)
-        response = llm_or_groq.predict(prompt)
-        return response
-    elif hasattr(llm_or_groq, "__call__"):
-        # Versão de ChatOpenAI que funciona como call
-        response = llm_or_groq(prompt)
-        if hasattr(response, "content"):
-            return response.content
-        return str(response)
-    elif hasattr(llm_or_groq, "chat"):
-        # GROQ
-        messages = [
-            {"role": "system", "content": "Você é um assistente jurídico especializado."},
-            {"role": "user", "content": prompt}
-        ]
-        chat_completion = llm_or_groq.chat.completions.create(
-            messages=messages,
-            model="llama-3.3-70b-versatile",
-        )
-        if hasattr(chat_completion, "choices") and len(chat_completion.choices) > 0:
-            return chat_completion.choices[0].message.content
+# ================================================
+# Geração de resposta 
+# ================================================
+class AnalysisError(ValueError):
+    """
+    A análise não pôde ser feita (requisitos ausentes, provedor indisponível...).
+    A mensagem já é própria para o usuário.
+    """
+
+def generate_response(pdf_text: str, selected_contract: str, llm, analysis_mode: str,
+                      force_refresh: bool = False, strategy: str = "auto", on_partial=None,
+                      timings: dict = None, fallback_llm=None, document_key: str = None,
+                      output_format: str = "text") -> str:
+    """
+    llm: provedor retornado por initialize_embeddings.
+    analysis_mode: "Apenas Requisitos" ou "Completo".
+    force_refresh: ignora a resposta em cache e refaz a análise.
+    strategy: "single" (documento inteiro num prompt), "map_reduce" (em partes),
+              "per_requirement" (uma requisição por requisito, só em "Apenas Requisitos"),
+              "relevant_clauses" (um prompt só com as cláusulas relevantes, só em "Apenas Requisitos")
+              ou "auto". Antes do envio o prompt passa pelo orçamento de tokens: se não
+              couber no contexto do modelo, "auto" e "single" passam a "relevant_clauses"
+              (em "Apenas Requisitos") ou a "map_reduce"; "relevant_clauses" passa a "map_reduce".
+              "incremental" (só em "Apenas Requisitos", com document_key) compara o texto com a
+              última versão analisada do mesmo contrato e envia ao modelo só as cláusulas alteradas;
+              com force_refresh, reanalisa o texto inteiro como uma nova versão.
+    on_partial: recebe o texto parcial à medida que a resposta é gerada (tokens
+                em streaming, ou requisitos prontos na estratégia "per_requirement").
+    timings: se informado, recebe provedor, modelo, estratégia, uso do cache,
+             tempo até o primeiro token ("ttft") e tempo total ("total"), em segundos,
+             a decisão do orçamento ("budget") e os tokens e custo gastos ("usage").
+    fallback_llm: outro provedor para hedge/failover; se o principal demorar
+                  mais que o usual (ou falhar), a análise também é enviada a ele.
+    document_key: identificador do contrato informado pelo usuário, que liga as
+                  versões umas às outras na estratégia "incremental".
+    output_format: "text" (relatório ✅/❌/💡) ou "json" (só em "Apenas Requisitos",
+                   exceto "incremental"): devolve o JSON de structured_output.AnalysisVerdicts,
+                   a partir do qual o relatório e a tabela são montados localmente.
+    Levanta AnalysisError quando não há resultado: a mensagem de erro nunca é
+    devolvida como se fosse a análise (nem vai para o cache, o job ou o checkpoint do lote).
+    """
+    started = time.perf_counter()
+    if timings is None:
+        timings = {}
+    # 1) Extrair ID do contrato
+    contract_id = selected_contract.split("-")[0].strip()  # e.g. '5'
+    
+    # 2) Carregar requisitos do registro (CSV lido uma vez, relido só se mudar)
+    requirements = get_contract_requirements(contract_id)
+    if requirements is None or not requirements.rows:
+        raise AnalysisError(f"Não encontrei arquivo de requisitos para o contrato de ID {contract_id}.")
+    rows = requirements.rows
+
+    # 3) Texto com todos os requisitos para a IA, já montado pelo registro
+    requirements_text = requirements.rendered
+
+    # 4) Estratégia e formato pedidos
+    provider, model = llm.name, llm.model
+    budget_models = [llm.model]
+    if fallback_llm is not None:
+        budget_models.append(fallback_llm.model)
+        # Com hedge, a resposta pode vir de qualquer um dos dois provedores
+        provider = f"{provider}+{fallback_llm.name}"
+        model = f"{model}+{fallback_llm.model}"
+    if strategy in ("per_requirement", "relevant_clauses", "incremental") and analysis_mode != "Apenas Requisitos":
+        strategy = "auto"
+    if strategy == "incremental" and not document_key:
+        strategy = "auto"
+    if output_format == "json" and (analysis_mode != "Apenas Requisitos" or strategy == "incremental"):
+        output_format = "text"
+
+    # 5) Consultar o cache antes de montar e orçar o prompt: a chave usa a
+    # estratégia pedida, e o orçamento (contar tokens, comprimir) só roda na falta
+    cache = get_response_cache()
+    cache_key = cache.make_key(
+        pdf_text, contract_id, analysis_mode, provider, model, PROMPT_VERSION, requirements_text,
+        strategy=strategy if output_format == "text" else f"{strategy}+{output_format}"
+    )
+    timings.update(provider=provider, model=model, strategy=strategy, output_format=output_format,
+                   cached=False, ttft=None)
+    # Na estratégia incremental, o histórico de versões faz o papel do cache
+    if not force_refresh and strategy != "incremental":
+        cached = cache.get(cache_key)
+        if cached is not None:
+            timings.update(cached=True, ttft=0.0, total=time.perf_counter() - started)
+            record_usage(timings, contract_id, analysis_mode, UsageMeter())
+            return cached
+
+    # 6) Montar o prompt e fechar a estratégia
+    if output_format == "json":
+        from structured_output import build_structured_prompt, per_requirement_jobs, analyze_structured
+
+    def make_prompt(contract_text: str) -> str:
+        if output_format == "json":
+            return build_structured_prompt(contract_text, rows)
+        return build_prompt(contract_text, requirements_text, contract_id, analysis_mode)
+
+    prompt = None
+    if strategy in ("auto", "single", "relevant_clauses"):
+        # Orçamento de tokens: enviar como está, comprimir (só cláusulas relevantes) ou dividir em partes
+        def compress():
+            return make_prompt(relevant_clauses_text(pdf_text, rows))
+        with metrics.span("prompt_build", strategy=strategy) as span:
+            if strategy == "relevant_clauses":
+                decision = plan_prompt(compress(), budget_models, RESERVED_OUTPUT_TOKENS)
+            else:
+                decision = plan_prompt(
+                    make_prompt(pdf_text),
+                    budget_models, RESERVED_OUTPUT_TOKENS,
+                    compress if analysis_mode == "Apenas Requisitos" else None,
+                )
+            span.set(action=decision.action, tokens_in=decision.compressed_tokens or decision.prompt_tokens)
+        timings["budget"] = decision.summary()
+        if decision.action == "chunk":
+            strategy = "map_reduce"
+        elif decision.action == "compress":
+            strategy = "relevant_clauses"
+        elif strategy == "auto":
+            strategy = "single"
+        prompt = decision.prompt
+        timings["strategy"] = strategy
+
+    # 7) Chamar LLM
+    usage = UsageMeter()
+    error = None
+    try:
+        if strategy == "incremental":
+            result = analyze_incremental(
+                pdf_text, rows, contract_id, document_key,
+                requirements_digest=text_hash(f"{PROMPT_VERSION}\0{requirements_text}"),
+                call=lambda chunk_prompt: call_llm(llm, chunk_prompt, fallback_llm, usage, hedge=False),
+                model=llm.model, store=get_version_store(), full=force_refresh,
+            )
+            timings.update(version=result.version, clauses_sent=result.clauses_sent,
+                           requirements_reviewed=result.requirements_reviewed)
+            return result.report
+        elif output_format == "json":
+            # Mesmas estratégias, com prompts que pedem JSON; vereditos juntados localmente
+            if strategy == "per_requirement":
+                jobs = per_requirement_jobs(rows, lambda row: select_passages(pdf_text, row))
+            elif strategy == "map_reduce":
+                jobs = [(make_prompt(chunk), rows) for chunk in split_by_tokens(pdf_text, DEFAULT_CHUNK_TOKENS, llm.model)]
+                if not jobs:
+                    raise AnalysisError("Nenhum texto encontrado no contrato.")
+            else:
+                jobs = [(prompt, rows)]
+            response = analyze_structured(
+                jobs, rows, call=lambda json_prompt: call_llm(
+                    llm, json_prompt, fallback_llm, usage, json_mode=True, hedge=len(jobs) == 1
+                ),
+            ).model_dump_json()
+        elif strategy == "per_requirement":
+            response = analyze_per_requirement(
+                pdf_text, rows,
+                call=lambda requirement_prompt: call_llm(llm, requirement_prompt, fallback_llm, usage, hedge=False),
+                on_partial=on_partial,
+            )
+        elif strategy == "map_reduce":
+            response = analyze_map_reduce(
+                pdf_text, rows, requirements_text, contract_id, analysis_mode,
+                call=lambda chunk_prompt: call_llm(llm, chunk_prompt, fallback_llm, usage, hedge=False),
+                model=llm.model,
+            )
+        elif on_partial is not None:
+            response = consume_stream(stream_llm(llm, prompt, fallback_llm, timings, usage), on_partial, timings)
         else:
-            return "Erro ao processar a resposta com a API GROQ."
+            response = call_llm(llm, prompt, fallback_llm, usage)
+    except ValueError as e:
+        error = str(e)
+        raise AnalysisError(error) from e
+    finally:
+        timings["total"] = time.perf_counter() - started
+        record_usage(timings, contract_id, analysis_mode, usage, error)
+    cache.put(cache_key, response)
+    return response
+
+def record_usage(timings: dict, contract_id: str, analysis_mode: str, usage: UsageMeter, error: str = None):
+    """
+    Guarda em timings["usage"] os tokens e o custo da análise e registra a linha no log de uso.
+    """
+    timings["usage"] = usage.summary()
+    metrics.record(
+        "analysis", timings.get("total") or 0.0,
+        provider=timings.get("provider"), model=timings.get("model"),
+        status="error" if error else "ok", strategy=timings.get("strategy"),
+        cache_hit=timings.get("cached"), ttft=timings.get("ttft"),
+        tokens_in=timings["usage"]["prompt_tokens"], tokens_out=timings["usage"]["completion_tokens"],
+    )
+    get_usage_log().record({
+        "contract_id": contract_id,
+        "analysis_mode": analysis_mode,
+        "strategy": timings.get("strategy"),
+        "provider": timings.get("provider"),
+        "model": timings.get("model"),
+        "cached": timings.get("cached"),
+        "budget": timings.get("budget"),
+        **timings["usage"],
+        "ttft": timings.get("ttft"),
+        "total": timings.get("total"),
+        "error": error,
+    })
+
+def call_llm(llm, prompt: str, fallback_llm=None, usage: UsageMeter = None, json_mode: bool = False,
+             hedge: bool = True) -> str:
+    """
+    Envia o prompt ao provedor e devolve o texto da resposta.
+    Levanta ValueError com a mensagem de erro para o usuário se não houver resposta.
+    usage: se informado, soma os tokens gastos na chamada.
+    json_mode: pede ao provedor uma resposta que seja um objeto JSON válido.
+    hedge: False nas chamadas parciais (partes, requisitos): fallback_llm só
+           entra se o principal falhar (ver hedging.py).
+    """
+    from providers import run_sync, DEFAULT_SYSTEM_PROMPT
+    from hedging import hedged_complete
+    options = {"response_format": {"type": "json_object"}} if json_mode else {}
+    if fallback_llm is not None:
+        result = run_sync(hedged_complete(llm, fallback_llm, prompt, system=DEFAULT_SYSTEM_PROMPT,
+                                          hedge=hedge, **options))
     else:
-        return "Provedor de IA inválido ou não suportado."
+        result = run_sync(llm.complete(prompt, system=DEFAULT_SYSTEM_PROMPT, **options))
+    if usage is not None:
+        usage.add(result, prompt)
+    return result.text
+
+def stream_llm(llm, prompt: str, fallback_llm=None, timings: dict = None, usage: UsageMeter = None):
+    """
+    Gera os pedaços de texto da resposta à medida que o provedor os envia.
+    Ao final, timings (se informado) recebe o provedor que de fato respondeu
+    e usage (se informado) soma os tokens gastos.
+    """
+    from providers import run_sync, iter_sync, DEFAULT_SYSTEM_PROMPT
+    from hedging import hedged_stream
+    if fallback_llm is not None:
+        stream = run_sync(hedged_stream(llm, fallback_llm, prompt, system=DEFAULT_SYSTEM_PROMPT))
+    else:
+        stream = run_sync(llm.stream(prompt, system=DEFAULT_SYSTEM_PROMPT))
+    yield from iter_sync(stream)
+    if timings is not None:
+        timings["served_by"] = f"{stream.provider.name}/{stream.provider.model}"
+    if usage is not None and stream.result is not None:
+        usage.add(stream.result, prompt)
+
+def consume_stream(pieces, on_partial, timings: dict) -> str:
+    """
+    Junta os pedaços do stream, repassando o texto parcial para on_partial
+    (no máximo a cada STREAM_REFRESH_SECONDS) e registrando o tempo até o primeiro token.
+    """
+    started = time.perf_counter()
+    parts = []
+    last_refresh = 0.0
+    for piece in pieces:
+        now = time.perf_counter()
+        if not parts:
+            timings["ttft"] = now - started
+        parts.append(piece)
+        if now - last_refresh >= STREAM_REFRESH_SECONDS:
+            on_partial("".join(parts))
+            last_refresh = now
+    if not parts:
+        raise ValueError("Erro ao processar a resposta: o provedor não retornou texto.")
+    response = "".join(parts)
+    on_partial(response)
+    return response
 
 # ================================================
 # Processar PDF
 # ================================================
+@st.cache_resource
+def get_pdf_cache() -> PdfTextCache:
+    # Uma única instância por processo, compartilhada entre sessões e reruns
+    return PdfTextCache()
+
 def process_pdf(file) -> str:
     try:
-        pdf_reader = PyPDF2.PdfReader(file)
-        text = ""
-        for page in pdf_reader.pages:
-            text += page.extract_text()
-        if not text.strip():
-            raise ValueError("Nenhum texto encontrado no PDF.")
+        data = file.getvalue() if hasattr(file, "getvalue") else file.read()
+        cache = get_pdf_cache()
+        key = cache.key_for(data)
+        text = cache.get(key)
+        if text is not None:
+            # Todo rerun passa por aqui com o mesmo PDF: só o contador, sem span
+            metrics.count("cache_hits", "pdf_extract")
+            return text
+        with metrics.span("pdf_extract", bytes=len(data), cache_hit=False) as span:
+            # Modo paralelo ou sequencial definido por PDF_EXTRACTION_MODE
+            text = extract_text(data)
+            if not text.strip():
+                raise ValueError("Nenhum texto encontrado no PDF.")
+            cache.put(key, text)
+            span.set(pages=text.count(PAGE_SEPARATOR) + 1)
         return text
     except Exception as e:
         st.error(f"Erro ao processar o PDF: {e}")
         return ""
 
+# ================================================
+# Jobs de análise
+# ================================================
+# Intervalo (s) entre consultas ao job em andamento
+JOB_POLL_SECONDS = 1.0
+
+@st.cache_resource
+def get_job_manager() -> JobManager:
+    # Um pool de workers por processo, compartilhado por todas as sessões
+    return JobManager()
+
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def show_job_progress(job_id: str):
+    """
+    Mostra o andamento do job; quando termina, reexecuta a página para exibir o resultado.
+    """
+    jobs = get_job_manager()
+    job = jobs.get(job_id, st.session_state.get("username", "anonimo"))
+    if job is None or job.done:
+        st.rerun()
+    if job.status == "queued":
+        position = jobs.queue_position(job)
+        label = "Na fila..." if position is None else (
+            f"Na fila: {position + 1}ª posição, espera estimada de {jobs.estimated_wait(job):.0f}s"
+        )
+    else:
+        label = f"Gerando análise... {job.elapsed:.0f}s"
+    st.progress(jobs.progress(job), text=label)
+    if job.partial:
+        st.markdown(job.partial)
+
+def render_result(result: str, timings: dict, contract_id: str):
+    if timings.get("ttft") is not None:
+        caption = f"Primeiro token em {timings['ttft']:.2f}s · total {timings['total']:.2f}s"
+    else:
+        caption = f"Tempo total: {timings.get('total', 0):.2f}s"
+    usage = timings.get("usage")
+    if usage and usage["calls"]:
+        caption += (
+            f" · {usage['prompt_tokens']} tokens de entrada, {usage['completion_tokens']} de saída"
+            f" · custo estimado US$ {usage['cost_usd']:.4f}"
+        )
+    st.caption(caption)
+    st.subheader("Resposta Gerada")
+    analysis = None
+    if timings.get("output_format") == "json":
+        from structured_output import try_parse, render_markdown, verdicts_table, summarize
+        analysis = try_parse(result)
+    if analysis is not None:
+        rows = load_contract_requirements(contract_id)
+        counts = summarize(analysis)
+        st.write(
+            f"✅ {counts['atendido']} atendidos · ⚠️ {counts['parcial']} parciais · "
+            f"❌ {counts['nao_atendido']} não atendidos"
+        )
+        st.dataframe(verdicts_table(analysis, rows), hide_index=True, use_container_width=True)
+        result = render_markdown(analysis, rows)
+        with st.expander("JSON"):
+            st.json(analysis.model_dump())
+    st.text_area("Resultado da Análise", value=result, height=300, disabled=True)
+
+# ================================================
+# Página de métricas (admin)
+# ================================================
+METRICS_WINDOWS = {
+    "Última hora": 60 * 60,
+    "Últimas 24 horas": 24 * 60 * 60,
+    "Últimos 7 dias": 7 * 24 * 60 * 60,
+    "Tudo": None,
+}
+
+@st.cache_resource
+def get_metrics_server():
+    # Endpoint /metrics para o Prometheus, só se METRICS_PORT estiver definido
+    port = os.getenv("METRICS_PORT")
+    return metrics.serve_prometheus(int(port)) if port else None
+
+def render_metrics_page():
+    st.subheader("Métricas das análises")
+    window = METRICS_WINDOWS[st.selectbox("Período:", tuple(METRICS_WINDOWS))]
+    since = time.time() - window if window else None
+    store = metrics.get_store()
+    st.write("Duração por etapa (s)")
+    st.dataframe(store.percentiles(since, by="stage"), hide_index=True, use_container_width=True)
+    st.write("Duração por etapa e provedor (s)")
+    st.dataframe(store.percentiles(since, by="provider"), hide_index=True, use_container_width=True)
+    with st.expander("Spans recentes"):
+        st.dataframe(store.recent(), hide_index=True, use_container_width=True)
+    st.caption(f"Formato Prometheus em {store.prometheus_file}")
+    st.download_button("Baixar métricas (Prometheus)", store.prometheus_text(), file_name="metrics.prom")
+
 # ================================================
 # MAIN
 # ================================================
@@ -188,13 +618,23 @@ def main():
     if "logged_in" not in st.session_state:
         st.session_state["logged_in"] = False
 
+    # Sessão expirada ou encerrada (ex.: senha trocada): volta para o login
+    if st.session_state["logged_in"] and not sync_users().verify_session(st.session_state.get("session_token")):
+        end_session()
+        st.warning("Sua sessão expirou. Entre novamente.")
+
     if not st.session_state["logged_in"]:
         st.subheader("Login")
         username = st.text_input("Usuário:")
         password = st.text_input("Senha:", type="password")
         if st.button("Entrar"):
-            if authenticate_user(username, password):
+            token = authenticate_user(username, password)
+            if token:
                 st.session_state["logged_in"] = True
+                st.session_state["session_token"] = token
+                # Identifica o usuário na fila justa e na cota de tokens (o
+                # login não diferencia maiúsculas de minúsculas)
+                st.session_state["username"] = username.strip().casefold()
                 st.success(f"Bem-vindo, {username}!")
             else:
                 st.error("Usuário ou senha inválidos.")
@@ -204,8 +644,65 @@ def main():
     if "user_text" not in st.session_state:
         st.session_state["user_text"] = None
 
+    get_metrics_server()
+    if st.sidebar.button("Sair"):
+        end_session()
+        st.rerun()
+    if st.session_state.get("username") in ADMIN_USERS:
+        page = st.sidebar.radio("Página:", ("Análise", "Métricas"))
+        if page == "Métricas":
+            render_metrics_page()
+            return
+
+    with st.sidebar.expander("Cache de PDFs"):
+        stats = get_pdf_cache().stats()
+        st.write(f"Acertos (memória/disco): {stats['memory_hits']} / {stats['disk_hits']}")
+        st.write(f"Falhas: {stats['misses']}")
+        st.write(f"Em memória: {stats['memory_entries']} arquivos, {stats['memory_bytes'] / 1024:.1f} KB")
+        st.write(f"Em disco: {stats['disk_entries']} arquivos, {stats['disk_bytes'] / 1024:.1f} KB")
+
+    if "analysis_timings" not in st.session_state:
+        st.session_state["analysis_timings"] = []
+
+    with st.sidebar.expander("Tempos das análises"):
+        for entry in reversed(st.session_state["analysis_timings"]):
+            ttft = "-" if entry.get("ttft") is None else f"{entry['ttft']:.2f}s"
+            origin = "cache" if entry.get("cached") else entry.get("served_by") or f"{entry.get('provider')}/{entry.get('model')}"
+            st.write(f"{origin} ({entry.get('strategy')}): 1º token {ttft}, total {entry.get('total', 0):.2f}s")
+
+    with st.sidebar.expander("Cache de respostas"):
+        stats = get_response_cache().stats()
+        st.write(f"Acertos: {stats['hits']} | Falhas: {stats['misses']}")
+        st.write(f"Respostas guardadas: {stats['entries']} ({stats['chars'] / 1000:.1f} mil caracteres)")
+
+    with st.sidebar.expander("Consumo de tokens"):
+        stats = get_usage_log().stats()
+        st.write(f"Análises: {stats['analyses']}")
+        st.write(f"Tokens de entrada/saída: {stats['prompt_tokens']} / {stats['completion_tokens']}")
+        st.write(f"Custo estimado: US$ {stats['cost_usd']:.4f}")
+
+    with st.sidebar.expander("Fila de análises"):
+        scheduler = get_job_manager().scheduler
+        stats = scheduler.stats()
+        st.write(f"Em execução: {stats['running']} de {stats['max_concurrent']} | Na fila: {stats['queued']}")
+        if scheduler.token_quota:
+            used = scheduler.user_usage(st.session_state.get("username", "anonimo"))
+            st.write(f"Sua cota de tokens: {used} de {scheduler.token_quota} na janela atual")
+
+    with st.sidebar.expander("Requisitos carregados"):
+        stats = get_requirements_registry().stats()
+        st.write(f"Tipos de contrato: {stats['tipos_carregados']} de {stats['tipos_mapeados']} mapeados")
+        st.write(f"Requisitos: {stats['requisitos']} | Leituras de CSV: {stats['leituras']}")
+
     provider = st.radio("Escolha o provedor de API:", ("openai", "groq"))
-    llm_or_groq = initialize_embeddings(provider)
+    llm = initialize_embeddings(provider)
+
+    use_failover = st.checkbox(
+        "Failover automático: se o provedor escolhido demorar mais que o normal, enviar também ao outro"
+    )
+    fallback_llm = None
+    if use_failover:
+        fallback_llm = initialize_embeddings("groq" if provider == "openai" else "openai")
 
     analysis_mode = st.radio(
         "Escolha o modo de análise:",
@@ -214,9 +711,20 @@ def main():
 
     input_mode = st.radio("Modo de entrada do contrato:", ("Carregar PDF", "Inserir Manualmente"))
     if input_mode == "Carregar PDF":
+        normalize = st.checkbox(
+            "Limpar o texto do PDF (cabeçalhos e rodapés repetidos, números de página, rubricas, hifenização)",
+            value=True,
+        )
         uploaded_file = st.file_uploader("Carregue um arquivo PDF", type="pdf")
         if uploaded_file is not None:
             text = process_pdf(uploaded_file)
+            if text and normalize:
+                normalized = normalize_cached(text, llm.model)
+                text = normalized.text
+                st.caption(
+                    f"Limpeza do texto: {normalized.chars_removed} caracteres e "
+                    f"{normalized.tokens_removed} tokens removidos ({normalized.percent_tokens_removed:.0f}%)"
+                )
             if text:
                 st.session_state["user_text"] = text
                 st.success("Texto processado!")
@@ -236,16 +744,105 @@ def main():
     ]
     selected_contract = st.selectbox("Selecione a característica contratual (ID - Nome):", contract_types)
 
+    strategies = {
+        "Automática": "auto",
+        "Documento inteiro": "single",
+        "Em partes (map-reduce)": "map_reduce",
+        "Um requisito por vez (Apenas Requisitos)": "per_requirement",
+        "Só cláusulas relevantes (Apenas Requisitos)": "relevant_clauses",
+        "Nova versão de contrato já analisado (Apenas Requisitos)": "incremental",
+    }
+    strategy_label = st.radio("Estratégia de execução da análise:", tuple(strategies))
+
+    document_key = None
+    if strategies[strategy_label] == "incremental":
+        document_key = st.text_input(
+            "Identificador do contrato (o mesmo em todas as versões, ex.: \"ACME - prestação de serviços\"):"
+        ).strip() or None
+        if document_key is None:
+            st.info("Informe o identificador para comparar com a versão anterior.")
+
+    output_formats = {
+        "Relatório em texto": "text",
+        "Estruturado: tabela por requisito (Apenas Requisitos)": "json",
+    }
+    output_label = st.radio("Formato da resposta:", tuple(output_formats))
+
+    force_refresh = st.checkbox("Forçar nova análise (ignorar resultado em cache)")
+
+    jobs = get_job_manager()
+    user = st.session_state.get("username", "anonimo")
     if st.session_state["user_text"] and st.button("Analisar Informação"):
-        st.write("Gerando análise...")
-        result = generate_response(
-            pdf_text=st.session_state["user_text"],
-            selected_contract=selected_contract,
-            llm_or_groq=llm_or_groq,
-            analysis_mode=analysis_mode
-        )
-        st.subheader("Resposta Gerada")
-        st.text_area("Resultado da Análise", value=result, height=300, disabled=True)
+        # A análise roda num worker; reruns da página não a interrompem nem a repetem
+        pdf_text = st.session_state["user_text"]
+        params = {
+            "text": text_hash(pdf_text),
+            "contract": selected_contract,
+            "mode": analysis_mode,
+            "strategy": strategies[strategy_label],
+            "provider": provider,
+            "failover": fallback_llm is not None,
+            "document_key": document_key,
+            "output_format": output_formats[output_label],
+        }
+        description = {"contract_id": selected_contract.split("-")[0].strip(), "provider": provider,
+                       "strategy": params["strategy"], "mode": analysis_mode}
+
+        def run(on_partial, timings):
+            return generate_response(
+                pdf_text=pdf_text,
+                selected_contract=selected_contract,
+                llm=llm,
+                analysis_mode=analysis_mode,
+                force_refresh=force_refresh,
+                strategy=params["strategy"],
+                on_partial=on_partial,
+                timings=timings,
+                fallback_llm=fallback_llm,
+                document_key=document_key,
+                output_format=params["output_format"]
+            )
+
+        try:
+            job_id = jobs.submit(
+                params, description, run, reuse_finished=not force_refresh,
+                user=user,
+                tokens=count_tokens(pdf_text, llm.model),
+            )
+        except QuotaExceeded as e:
+            st.error(str(e))
+        else:
+            st.session_state["job_id"] = job_id
+            # Com o id na URL, o resultado volta mesmo após recarregar a página
+            st.query_params["job"] = job_id
+
+    job_id = st.session_state.get("job_id") or st.query_params.get("job")
+    # Um id de outro usuário (link compartilhado, por exemplo) não é exibido
+    job = jobs.get(job_id, user) if job_id else None
+    if job is not None:
+        st.session_state["job_id"] = job.id
+        if not job.done:
+            show_job_progress(job.id)
+        elif job.status == "error":
+            st.error(job.error)
+        else:
+            recorded = st.session_state.setdefault("recorded_jobs", set())
+            if job.id not in recorded:
+                recorded.add(job.id)
+                st.session_state["analysis_timings"].append(job.timings)
+            render_result(job.result, job.timings, job.description.get("contract_id"))
+
+def render_profile(summary: dict):
+    if summary is not None:
+        with st.sidebar.expander("Perfil desta execução"):
+            st.code(startup_profile.format_profile(summary), language=None)
 
 if __name__ == '__main__':
-    main()
+    # st.rerun()/st.stop() interrompem main() com uma exceção: o perfil é
+    # encerrado mesmo assim, e só é exibido quando a execução vai até o fim
+    try:
+        with startup_profile.section("main"):
+            main()
+    finally:
+        profile = startup_profile.finish()
+    render_profile(profile)
@@ -0,0 +1,237 @@
+﻿import os
+import re
+import time
+import random
+import asyncio
+import threading
+from tenacity import AsyncRetrying, retry_if_exception, stop_after_attempt, wait_random_exponential
+
+# ================================================
+# Controle de taxa e novas tentativas para os provedores de LLM
+# ================================================
+# Cada par (provedor, modelo) tem dois token buckets: requisições/minuto e
+# tokens/minuto. Uma chamada só é admitida quando há saldo nos dois. Os limites
+# iniciais vêm da configuração e são ajustados pelos cabeçalhos
+# x-ratelimit-* de cada resposta (na Groq, os de requisições são diários e só
+# pausam o bucket quando a cota do dia acaba); um 429 com retry-after pausa o bucket. Erros
+# transitórios (429, 5xx, conexão) são repetidos com backoff exponencial com
+# jitter, via tenacity, sem que o advogado precise recomeçar a análise.
+
+MAX_ATTEMPTS = int(os.getenv("LLM_MAX_ATTEMPTS", 6))
+MAX_BACKOFF_SECONDS = float(os.getenv("LLM_MAX_BACKOFF", 60))
+
+# (requisições/min, tokens/min) de partida; os cabeçalhos corrigem em seguida
+DEFAULT_LIMITS = {
+    ("openai", "gpt-3.5-turbo"): (3500, 160000),
+    ("groq", "llama-3.3-70b-versatile"): (30, 6000),
+}
+FALLBACK_LIMITS = (60, 40000)
+
+# Provedores cujos cabeçalhos x-ratelimit-*-requests contam requisições por
+# dia, não por minuto (a Groq informa RPD). Nesses, o bucket de requisições
+# fica com o RPM configurado; do cabeçalho vale só o aviso de cota esgotada.
+DAILY_REQUEST_HEADERS = {"groq"}
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+
+
+def parse_duration(value: str) -> float:
+    """
+    Converte durações dos cabeçalhos ("1s", "6m0s", "2.5s", "120ms") em segundos.
+    """
+    if value is None:
+        return None
+    value = value.strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    units = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        return None
+    return sum(float(number) * units[unit] for number, unit in parts)
+
+
+def configured_limits(provider: str, model: str) -> tuple:
+    rpm, tpm = DEFAULT_LIMITS.get((provider, model), FALLBACK_LIMITS)
+    prefix = provider.upper()
+    return (
+        float(os.getenv(f"{prefix}_RPM", rpm)),
+        float(os.getenv(f"{prefix}_TPM", tpm)),
+    )
+
+
+class TokenBucket:
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.level = per_minute
+        self.refill_per_second = per_minute / 60.0
+        self.blocked_until = 0.0
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.refill_per_second)
+        self.updated = now
+
+    async def acquire(self, amount: float):
+        # O lock mantém a fila em ordem de chegada
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            while True:
+                self._refill()
+                now = time.monotonic()
+                if now < self.blocked_until:
+                    await asyncio.sleep(self.blocked_until - now)
+                    continue
+                if self.level >= amount:
+                    self.level -= amount
+                    return
+                await asyncio.sleep((amount - self.level) / self.refill_per_second)
+
+    def observe(self, limit: float = None, remaining: float = None, reset_seconds: float = None):
+        """
+        Ajusta o bucket ao que o provedor informou nos cabeçalhos.
+        """
+        self._refill()
+        if limit:
+            self.capacity = limit
+            self.refill_per_second = limit / 60.0
+        if remaining is not None:
+            self.level = min(self.level, remaining)
+            if remaining <= 0 and reset_seconds:
+                self.block(reset_seconds)
+
+    def block(self, seconds: float):
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+        self.level = 0.0
+
+
+class RateLimiter:
+    def __init__(self, provider: str, model: str):
+        rpm, tpm = configured_limits(provider, model)
+        self.daily_requests = provider in DAILY_REQUEST_HEADERS
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.throttled = 0
+        self.retries = 0
+
+    async def acquire(self, estimated_tokens: int):
+        await self.requests.acquire(1)
+        await self.tokens.acquire(estimated_tokens)
+
+    def update_from_headers(self, headers):
+        if headers is None:
+            return
+        remaining_requests = _number(headers.get("x-ratelimit-remaining-requests"))
+        reset_requests = parse_duration(headers.get("x-ratelimit-reset-requests"))
+        if self.daily_requests:
+            # Cota diária: só pausa quando acabou, até a virada informada
+            if remaining_requests is not None and remaining_requests <= 0 and reset_requests:
+                self.requests.block(reset_requests)
+        else:
+            self.requests.observe(
+                _number(headers.get("x-ratelimit-limit-requests")),
+                remaining_requests,
+                reset_requests,
+            )
+        self.tokens.observe(
+            _number(headers.get("x-ratelimit-limit-tokens")),
+            _number(headers.get("x-ratelimit-remaining-tokens")),
+            parse_duration(headers.get("x-ratelimit-reset-tokens")),
+        )
+
+    def penalize(self, retry_after: float):
+        self.throttled += 1
+        self.requests.block(retry_after)
+
+
+def _number(value):
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(provider: str, model: str) -> RateLimiter:
+    with _limiters_lock:
+        limiter = _limiters.get((provider, model))
+        if limiter is None:
+            limiter = _limiters[(provider, model)] = RateLimiter(provider, model)
+        return limiter
+
+
+# ================================================
+# Novas tentativas
+# ================================================
+def _status_code(exc: BaseException):
+    return getattr(exc, "status_code", None)
+
+
+def is_retryable(exc: BaseException) -> bool:
+    # APIConnectionError/APITimeoutError (openai e groq) não têm status_code
+    if _status_code(exc) in RETRYABLE_STATUS:
+        return True
+    return type(exc).__name__ in ("APIConnectionError", "APITimeoutError")
+
+
+def retry_after_seconds(exc: BaseException) -> float:
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None)
+    if headers is None:
+        return None
+    retry_after = parse_duration(headers.get("retry-after"))
+    if retry_after is None:
+        retry_after = parse_duration(headers.get("retry-after-ms"))
+        retry_after = retry_after / 1000 if retry_after is not None else None
+    return retry_after
+
+
+class _BackoffWait:
+    # Backoff exponencial com jitter, mas nunca menos do que o retry-after do provedor
+    def __init__(self):
+        self._exponential = wait_random_exponential(multiplier=1, max=MAX_BACKOFF_SECONDS)
+
+    def __call__(self, retry_state) -> float:
+        wait = self._exponential(retry_state)
+        exc = retry_state.outcome.exception() if retry_state.outcome else None
+        retry_after = retry_after_seconds(exc) if exc is not None else None
+        if retry_after is not None:
+            wait = max(wait, retry_after + random.uniform(0, 0.5))
+        return wait
+
+
+async def call_with_retries(limiter: RateLimiter, estimated_tokens: int, make_request):
+    """
+    Admite a chamada pelos buckets do limiter e executa `make_request()`
+    (corrotina que devolve a resposta bruta do SDK, com .headers), repetindo
+    em erros transitórios. Devolve a resposta bruta.
+    """
+    async for attempt in AsyncRetrying(
+        retry=retry_if_exception(is_retryable),
+        wait=_BackoffWait(),
+        stop=stop_after_attempt(MAX_ATTEMPTS),
+        reraise=True,
+    ):
+        with attempt:
+            if attempt.retry_state.attempt_number > 1:
+                limiter.retries += 1
+            await limiter.acquire(estimated_tokens)
+            try:
+                raw = await make_request()
+            except Exception as exc:
+                response = getattr(exc, "response", None)
+                limiter.update_from_headers(getattr(response, "headers", None))
+                if _status_code(exc) == 429:
+                    limiter.penalize(retry_after_seconds(exc) or 1.0)
+                raise
+            limiter.update_from_headers(raw.headers)
+            return raw
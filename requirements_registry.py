@@ -0,0 +1,125 @@
+﻿import os
+import csv
+import io
+import hashlib
+import threading
+
+# ================================================
+# Registro em memória dos CSVs de requisitos
+# ================================================
+# Cada CSV de tipo de contrato é lido uma única vez, indexado pela coluna `id`
+# e tem o bloco de requisitos do prompt já montado. A cada consulta só é feito
+# um os.stat: se mtime e tamanho não mudaram, nada é relido; se mudaram, o
+# arquivo é relido e só é reinterpretado se o hash do conteúdo também mudou.
+
+
+def render_requirements(rows: list) -> str:
+    """
+    Bloco de requisitos usado nos prompts de análise, uma linha por requisito.
+    """
+    return "".join(
+        f"- ({row.get('id')}) {row.get('tema')}: {row.get('requisito')} "
+        f"[Fundamento: {row.get('fundamento_legal')}] "
+        f"(Prioridade: {row.get('prioridade')})\n"
+        for row in rows
+    )
+
+
+class CsvTable:
+    """
+    Um CSV indexado pela coluna `key`, recarregado quando o arquivo muda.
+    `rows`, `by_id` e `rendered` devem ser tratados como somente leitura.
+    """
+
+    def __init__(self, path: str, key: str = "id", render=None):
+        self.path = path
+        self.key = key
+        self._render = render
+        self.rows = []
+        self.by_id = {}
+        self.rendered = ""
+        self.digest = None
+        self.loads = 0
+        self._signature = None
+        self._lock = threading.Lock()
+        self.refresh()
+
+    def _stat_signature(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def refresh(self) -> bool:
+        """
+        Relê o arquivo se ele mudou desde a última leitura. Retorna True se o conteúdo mudou.
+        """
+        signature = self._stat_signature()
+        if signature == self._signature:
+            return False
+        with self._lock:
+            if signature == self._signature:
+                return False
+            if signature is None:
+                changed = self.digest is not None
+                self.rows, self.by_id, self.rendered, self.digest = [], {}, "", None
+                self._signature = None
+                return changed
+            with open(self.path, "rb") as f:
+                data = f.read()
+            digest = hashlib.sha256(data).hexdigest()
+            self._signature = signature
+            if digest == self.digest:
+                # Só o mtime mudou (ex.: arquivo salvo sem alterações)
+                return False
+            # utf-8-sig: alguns CSVs são salvos com BOM, que iria parar no nome da primeira coluna
+            rows = list(csv.DictReader(io.StringIO(data.decode("utf-8-sig"))))
+            self.rows = rows
+            self.by_id = {(row.get(self.key) or "").strip(): row for row in rows}
+            self.rendered = self._render(rows) if self._render else ""
+            self.digest = digest
+            self.loads += 1
+            return True
+
+    def get(self, row_id: str):
+        self.refresh()
+        return self.by_id.get(str(row_id).strip())
+
+
+class RequirementsRegistry:
+    """
+    Tabelas de requisitos de todos os tipos de contrato, por ID do contrato.
+    """
+
+    def __init__(self, csv_map: dict, base_dir: str = "."):
+        self.csv_map = dict(csv_map)
+        self.base_dir = base_dir
+        self._tables = {
+            contract_id: CsvTable(os.path.join(base_dir, file_name), render=render_requirements)
+            for contract_id, file_name in self.csv_map.items()
+        }
+
+    def get(self, contract_id: str) -> CsvTable:
+        """
+        Tabela atualizada do contrato, ou None se o tipo não tem CSV (mapeado e existente).
+        """
+        table = self._tables.get(str(contract_id).strip())
+        if table is None:
+            return None
+        table.refresh()
+        return table if table.digest is not None else None
+
+    @property
+    def loads(self) -> int:
+        # Leituras de CSV feitas até agora, somando todos os tipos
+        return sum(table.loads for table in self._tables.values())
+
+    def stats(self) -> dict:
+        loaded = [table for table in self._tables.values() if table.digest is not None]
+        return {
+            "tipos_mapeados": len(self._tables),
+            "tipos_carregados": len(loaded),
+            "requisitos": sum(len(table.rows) for table in loaded),
+            "leituras": self.loads,
+        }
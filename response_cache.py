@@ -0,0 +1,68 @@
+﻿import os
+import hashlib
+import threading
+from cachetools import TTLCache
+
+# ================================================
+# Cache de respostas do LLM
+# ================================================
+# A chave combina o hash do texto do contrato com tudo o que muda a resposta:
+# contrato, modo e estratégia de análise, provedor, modelo, versão do prompt e os requisitos
+# carregados. As entradas expiram após RESPONSE_CACHE_TTL segundos e o total
+# guardado é limitado em caracteres (as mais antigas saem primeiro).
+
+DEFAULT_TTL_SECONDS = int(os.getenv("RESPONSE_CACHE_TTL", 24 * 60 * 60))
+DEFAULT_MAX_CHARS = int(os.getenv("RESPONSE_CACHE_MAX_CHARS", 20_000_000))
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    def __init__(self, ttl: int = DEFAULT_TTL_SECONDS, max_chars: int = DEFAULT_MAX_CHARS):
+        self._cache = TTLCache(maxsize=max_chars, ttl=ttl, getsizeof=len)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(contract_text: str, contract_id: str, analysis_mode: str, provider: str,
+                 model: str, prompt_version: str, requirements_text: str = "",
+                 strategy: str = "single") -> tuple:
+        return (
+            text_hash(contract_text),
+            contract_id,
+            analysis_mode,
+            strategy,
+            provider,
+            model,
+            prompt_version,
+            text_hash(requirements_text),
+        )
+
+    def get(self, key: tuple):
+        with self._lock:
+            response = self._cache.get(key)
+            if response is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return response
+
+    def put(self, key: tuple, response: str):
+        with self._lock:
+            try:
+                self._cache[key] = response
+            except ValueError:
+                # Resposta maior que o limite inteiro do cache: não é guardada
+                pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._cache),
+                "chars": self._cache.currsize,
+            }
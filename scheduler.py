@@ -0,0 +1,219 @@
+﻿import os
+import time
+import threading
+from collections import deque
+from dataclasses import dataclass, field
+from concurrent.futures import ThreadPoolExecutor
+
+# ================================================
+# Fila justa de análises entre usuários
+# ================================================
+# Todas as sessões do Streamlit do processo passam pelo mesmo agendador:
+#   - no máximo MAX_CONCURRENT análises rodam ao mesmo tempo (limite global,
+#     para não estourar os limites dos provedores);
+#   - cada usuário tem a sua fila; a próxima análise a rodar é a do usuário
+#     que menos consumiu até agora, medido em tokens (fila justa ponderada
+#     pelo tamanho: um contrato de 500 páginas "custa" mais vez na fila que
+#     um de 5), e um usuário não ocupa mais que MAX_RUNNING_PER_USER vagas;
+#   - cada usuário tem uma cota de tokens por janela de tempo; acima dela a
+#     análise é recusada na hora, com o tempo até a cota liberar.
+
+MAX_CONCURRENT = int(os.getenv("SCHEDULER_MAX_CONCURRENT", 4))
+MAX_RUNNING_PER_USER = int(os.getenv("SCHEDULER_MAX_PER_USER", max(1, MAX_CONCURRENT // 2)))
+# Tokens por usuário na janela; 0 desliga a cota
+USER_TOKEN_QUOTA = int(os.getenv("USER_TOKEN_QUOTA", 2_000_000))
+QUOTA_WINDOW_SECONDS = int(os.getenv("USER_QUOTA_WINDOW", 60 * 60))
+
+
+class QuotaExceeded(ValueError):
+    def __init__(self, user: str, used: int, quota: int, retry_after: float):
+        self.user = user
+        self.used = used
+        self.quota = quota
+        # None: a análise sozinha já é maior que a cota
+        self.retry_after = retry_after
+        if retry_after is None:
+            message = f"A análise (tokens estimados) é maior que a cota de {quota} tokens por usuário."
+        else:
+            message = (
+                f"Cota de tokens excedida ({used} de {quota} na janela atual). "
+                f"Tente novamente em {max(1, round(retry_after / 60))} min."
+            )
+        super().__init__(message)
+
+
+@dataclass
+class _Task:
+    task_id: str
+    user: str
+    tokens: int
+    run: object
+    submitted: float = field(default_factory=time.monotonic)
+
+
+@dataclass
+class _UserState:
+    queue: deque = field(default_factory=deque)
+    # Tokens já despachados (tempo virtual da fila justa)
+    virtual_tokens: float = 0.0
+    running: int = 0
+    # (instante, tokens) despachados dentro da janela da cota
+    usage: deque = field(default_factory=deque)
+
+
+class FairScheduler:
+    def __init__(self, max_concurrent: int = MAX_CONCURRENT,
+                 max_running_per_user: int = MAX_RUNNING_PER_USER,
+                 token_quota: int = USER_TOKEN_QUOTA,
+                 quota_window: float = QUOTA_WINDOW_SECONDS):
+        self.max_concurrent = max_concurrent
+        self.max_running_per_user = max_running_per_user
+        self.token_quota = token_quota
+        self.quota_window = quota_window
+        self._users = {}
+        self._running = 0
+        # Consumo (tempo virtual) do usuário na última análise despachada
+        self._virtual_clock = 0.0
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max_concurrent, thread_name_prefix="analysis")
+
+    def _user(self, user: str) -> _UserState:
+        state = self._users.get(user)
+        if state is None:
+            state = self._users[user] = _UserState()
+        return state
+
+    # ------------------------------------------------
+    # Cota
+    # ------------------------------------------------
+    def _used(self, state: _UserState, now: float) -> int:
+        while state.usage and now - state.usage[0][0] > self.quota_window:
+            state.usage.popleft()
+        queued = sum(task.tokens for task in state.queue)
+        return sum(entry[1] for entry in state.usage) + queued
+
+    def _check_quota(self, user: str, tokens: int):
+        # Chamado com self._lock já adquirido
+        if not self.token_quota:
+            return
+        state = self._user(user)
+        now = time.monotonic()
+        used = self._used(state, now)
+        if used + tokens <= self.token_quota:
+            return
+        if tokens > self.token_quota:
+            raise QuotaExceeded(user, used, self.token_quota, None)
+        # Quando as entradas mais antigas saírem da janela, sobra espaço
+        retry_after = self.quota_window
+        freed = used
+        for moment, amount in state.usage:
+            freed -= amount
+            if freed + tokens <= self.token_quota:
+                retry_after = moment + self.quota_window - now
+                break
+        raise QuotaExceeded(user, used, self.token_quota, retry_after)
+
+    def check_quota(self, user: str, tokens: int):
+        """
+        Levanta QuotaExceeded se `tokens` a mais (somados ao que está na fila)
+        passariam da cota do usuário.
+        """
+        with self._lock:
+            self._check_quota(user, tokens)
+
+    # ------------------------------------------------
+    # Fila
+    # ------------------------------------------------
+    def submit(self, task_id: str, user: str, tokens: int, run):
+        """
+        Enfileira run() -> tokens realmente usados (ou None) para `user`.
+        `tokens` é a estimativa usada na fila justa e na cota até run() terminar.
+        Levanta QuotaExceeded se passaria da cota: a conferência e a reserva
+        acontecem sob o mesmo lock, então dois envios simultâneos não passam
+        juntos por uma cota que só comporta um.
+        """
+        with self._lock:
+            self._check_quota(user, tokens)
+            state = self._user(user)
+            if not state.queue and not state.running:
+                # Quem estava parado não acumula crédito: entra no ponto atual da fila
+                state.virtual_tokens = max(state.virtual_tokens, self._virtual_clock)
+            state.queue.append(_Task(task_id, user, max(tokens, 1), run))
+        self._dispatch()
+
+    def _pick(self, users: dict, running: int):
+        # Usuário com fila, abaixo do limite por usuário e com menor consumo
+        if running >= self.max_concurrent:
+            return None
+        eligible = [
+            (state.virtual_tokens, state.queue[0].submitted, name)
+            for name, state in users.items()
+            if state.queue and state.running < self.max_running_per_user
+        ]
+        return min(eligible)[2] if eligible else None
+
+    def _dispatch(self):
+        with self._lock:
+            while True:
+                user = self._pick(self._users, self._running)
+                if user is None:
+                    return
+                state = self._users[user]
+                task = state.queue.popleft()
+                state.running += 1
+                self._virtual_clock = state.virtual_tokens
+                state.virtual_tokens += task.tokens
+                entry = [time.monotonic(), task.tokens]
+                state.usage.append(entry)
+                self._running += 1
+                self._pool.submit(self._execute, task, entry)
+
+    def _execute(self, task: _Task, entry: list):
+        actual = None
+        try:
+            actual = task.run()
+        finally:
+            with self._lock:
+                state = self._users[task.user]
+                if actual is not None:
+                    # A cota e a fila passam a contar os tokens reais informados
+                    # (0 num acerto do cache de respostas)
+                    state.virtual_tokens += actual - task.tokens
+                    entry[1] = actual
+                state.running -= 1
+                self._running -= 1
+            self._dispatch()
+
+    def position(self, task_id: str) -> int:
+        """
+        Quantas análises na fila rodam antes desta (0 = é a próxima), ou None
+        se ela não está mais na fila. Simula a ordem de despacho atual.
+        """
+        with self._lock:
+            users = {
+                name: _UserState(queue=deque(state.queue), virtual_tokens=state.virtual_tokens)
+                for name, state in self._users.items() if state.queue
+            }
+        ahead = 0
+        while True:
+            user = self._pick(users, 0)
+            if user is None:
+                return None
+            task = users[user].queue.popleft()
+            if task.task_id == task_id:
+                return ahead
+            users[user].virtual_tokens += task.tokens
+            ahead += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "running": self._running,
+                "queued": sum(len(state.queue) for state in self._users.values()),
+                "max_concurrent": self.max_concurrent,
+                "users_waiting": sum(1 for state in self._users.values() if state.queue),
+            }
+
+    def user_usage(self, user: str) -> int:
+        with self._lock:
+            return self._used(self._user(user), time.monotonic())
@@ -0,0 +1,152 @@
+﻿import os
+import sys
+import time
+import runpy
+import logging
+import builtins
+import argparse
+import threading
+from contextlib import contextmanager
+
+# ================================================
+# Perfil de inicialização e de rerun
+# ================================================
+# O Streamlit reexecuta o script do app inteiro a cada interação. Com
+# STARTUP_PROFILE=1, cada execução registra o tempo total, o tempo de cada
+# import feito pela primeira vez no processo (por módulo de nível mais alto) e
+# o de cada etapa marcada com section(). O app mostra o perfil da última
+# execução; pela linha de comando, o script roda uma vez (frio) e depois
+# --reruns vezes em modo "bare", e o perfil de cada execução é impresso:
+#   python startup_profile.py qa.py
+#   python startup_profile.py "qa (2).py" --reruns 3
+
+ENABLED = os.getenv("STARTUP_PROFILE", "0") == "1"
+
+_local = threading.local()
+_original_import = builtins.__import__
+_installed = False
+_install_lock = threading.Lock()
+
+
+class RunProfile:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.finished = None
+        self.imports = {}
+        self.sections = []
+
+    @property
+    def total(self) -> float:
+        return (self.finished or time.perf_counter()) - self.started
+
+    def summary(self) -> dict:
+        return {
+            "total_ms": round(self.total * 1000, 1),
+            "imports_ms": {name: round(seconds * 1000, 1) for name, seconds in
+                           sorted(self.imports.items(), key=lambda item: -item[1])},
+            "sections_ms": [(name, round(seconds * 1000, 1)) for name, seconds in self.sections],
+        }
+
+
+def _profiled_import(name, globals=None, locals=None, fromlist=(), level=0):
+    profile = getattr(_local, "profile", None)
+    # Só imports absolutos ainda não carregados, contados no nível mais externo
+    if profile is None or level or getattr(_local, "depth", 0) or name in sys.modules:
+        return _original_import(name, globals, locals, fromlist, level)
+    _local.depth = 1
+    started = time.perf_counter()
+    try:
+        return _original_import(name, globals, locals, fromlist, level)
+    finally:
+        _local.depth = 0
+        top = name.partition(".")[0]
+        profile.imports[top] = profile.imports.get(top, 0.0) + time.perf_counter() - started
+
+
+def _install():
+    global _installed
+    with _install_lock:
+        if not _installed:
+            builtins.__import__ = _profiled_import
+            _installed = True
+
+
+def start(force: bool = False):
+    """
+    Começa o perfil da execução atual do script (na thread atual). Sem
+    STARTUP_PROFILE=1 (ou force), não faz nada. Se já há um perfil em
+    andamento (ex.: aberto pela linha de comando), ele continua valendo.
+    """
+    if not (ENABLED or force):
+        return
+    _install()
+    if getattr(_local, "profile", None) is not None:
+        _local.nesting += 1
+        return
+    _local.profile = RunProfile()
+    _local.nesting = 0
+
+
+@contextmanager
+def section(name: str):
+    profile = getattr(_local, "profile", None)
+    if profile is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.sections.append((name, time.perf_counter() - started))
+
+
+def finish() -> dict:
+    """
+    Encerra o perfil da execução atual e o devolve (ou None, se desligado).
+    Num start() aninhado, só devolve o perfil até agora.
+    """
+    profile = getattr(_local, "profile", None)
+    if profile is None:
+        return None
+    if _local.nesting:
+        _local.nesting -= 1
+        return profile.summary()
+    profile.finished = time.perf_counter()
+    _local.profile = None
+    return profile.summary()
+
+
+def format_profile(summary: dict, limit: int = 15) -> str:
+    lines = [f"Total: {summary['total_ms']:.1f} ms"]
+    for name, ms in summary["sections_ms"]:
+        lines.append(f"  etapa  {name:<28} {ms:>9.1f} ms")
+    for name, ms in list(summary["imports_ms"].items())[:limit]:
+        lines.append(f"  import {name:<28} {ms:>9.1f} ms")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Perfil de import e inicialização de um app Streamlit.")
+    parser.add_argument("script", help="arquivo do app (ex.: qa.py)")
+    parser.add_argument("--reruns", type=int, default=1, help="execuções depois da primeira")
+    args = parser.parse_args()
+
+    global ENABLED
+    ENABLED = True
+    os.environ["STARTUP_PROFILE"] = "1"
+    # Sem `streamlit run`, cada st.* avisa que falta o contexto do script
+    logging.disable(logging.WARNING)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(args.script)))
+    # O app faz `import startup_profile`: que seja este mesmo módulo (e não uma
+    # segunda cópia), para que as etapas dele entrem no perfil aberto aqui
+    sys.modules.setdefault("startup_profile", sys.modules[__name__])
+    for run in range(args.reruns + 1):
+        start()
+        runpy.run_path(args.script, run_name="__main__")
+        summary = finish()
+        print(f"== {args.script}: {'primeira execução' if run == 0 else f'rerun {run}'}")
+        print(format_profile(summary))
+
+
+if __name__ == "__main__":
+    main()
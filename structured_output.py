@@ -0,0 +1,186 @@
+﻿import re
+from typing import Literal
+from concurrent.futures import ThreadPoolExecutor
+from pydantic import BaseModel, ValidationError
+
+# ================================================
+# Vereditos estruturados (JSON) por requisito
+# ================================================
+# Em vez de prosa com ✅/❌/💡, o modelo devolve um objeto JSON com um item
+# por requisito (status, trecho de evidência, cláusula e sugestão), validado
+# com pydantic. A resposta é bem mais curta, pode ir para o cache e ser
+# agregada, e tanto a tabela quanto o relatório em texto são gerados
+# localmente a partir do JSON, sem uma segunda chamada ao LLM.
+
+STATUS_ICONS = {"atendido": "✅", "parcial": "⚠️", "nao_atendido": "❌"}
+# Ao juntar respostas de várias partes do contrato, vale o melhor status
+_STATUS_RANK = {"nao_atendido": 0, "parcial": 1, "atendido": 2}
+
+DEFAULT_MAX_CONCURRENCY = 4
+
+
+class RequirementVerdict(BaseModel):
+    id: str
+    status: Literal["atendido", "parcial", "nao_atendido"]
+    evidencia: str = ""
+    clausula: str = ""
+    sugestao: str = ""
+
+
+class AnalysisVerdicts(BaseModel):
+    verdicts: list[RequirementVerdict]
+
+
+def build_structured_prompt(contract_text: str, rows: list) -> str:
+    requirements = "\n".join(
+        f"- {row.get('id')}: {row.get('tema')}: {row.get('requisito')}" for row in rows
+    )
+    return f"""
+        Você é um assistente virtual especializado em análise de contratos.
+
+        TEXTO DO CONTRATO:
+        {contract_text}
+
+        REQUISITOS:
+        {requirements}
+
+        Responda APENAS com um objeto JSON neste formato:
+        {{"verdicts": [{{"id": "<id do requisito>", "status": "atendido" | "parcial" | "nao_atendido", "evidencia": "<trecho exato e curto do contrato, ou vazio>", "clausula": "<cláusula ou página da evidência, ou vazio>", "sugestao": "<sugestão curta de melhoria, ou vazio>"}}]}}
+
+        1. Inclua um item para cada requisito, na ordem dada.
+        2. Procure termos iguais ou equivalentes (sinônimos) no contrato.
+        3. Seja conciso: nada fora do JSON.
+        """
+
+
+def per_requirement_jobs(rows: list, passages) -> list:
+    """
+    Um prompt por requisito, só com os trechos dele (passages(row) -> lista de
+    trechos) e pedindo só o veredito dele: a resposta encolhe para um item.
+    """
+    return [(build_structured_prompt("\n\n".join(passages(row)), [row]), [row]) for row in rows]
+
+
+def _extract_json(text: str) -> str:
+    # Alguns modelos cercam o JSON com ```json ... ``` mesmo em modo JSON
+    text = re.sub(r"^```(json)?|```$", "", text.strip(), flags=re.MULTILINE).strip()
+    start, end = text.find("{"), text.rfind("}")
+    return text[start:end + 1] if start >= 0 and end > start else text
+
+
+def parse_verdicts(output: str, rows: list) -> list:
+    """
+    Valida a resposta do modelo e devolve um RequirementVerdict por linha de
+    `rows`, na mesma ordem. Requisitos ausentes na resposta ficam como não atendidos.
+    Levanta ValueError se a resposta não for o JSON esperado.
+    """
+    try:
+        analysis = AnalysisVerdicts.model_validate_json(_extract_json(output))
+    except ValidationError as e:
+        raise ValueError(f"A resposta do modelo não veio no formato JSON esperado: {e.error_count()} erro(s).") from e
+    by_id = {verdict.id.strip().strip("()"): verdict for verdict in analysis.verdicts}
+    result = []
+    for row in rows:
+        req_id = str(row.get("id")).strip()
+        verdict = by_id.get(req_id)
+        if verdict is None:
+            verdict = RequirementVerdict(id=req_id, status="nao_atendido")
+        else:
+            verdict = verdict.model_copy(update={"id": req_id})
+        result.append(verdict)
+    return result
+
+
+def merge_verdicts(groups: list, rows: list) -> AnalysisVerdicts:
+    """
+    Junta vereditos de várias chamadas (partes do contrato ou um requisito por
+    vez): para cada requisito vale o melhor status encontrado.
+    """
+    best = {}
+    for verdicts in groups:
+        for verdict in verdicts:
+            current = best.get(verdict.id)
+            if current is None or _STATUS_RANK[verdict.status] > _STATUS_RANK[current.status]:
+                best[verdict.id] = verdict
+    return AnalysisVerdicts(verdicts=[
+        best.get(str(row.get("id")).strip()) or RequirementVerdict(id=str(row.get("id")).strip(), status="nao_atendido")
+        for row in rows
+    ])
+
+
+def analyze_structured(jobs: list, rows: list, call,
+                       max_concurrency: int = DEFAULT_MAX_CONCURRENCY) -> AnalysisVerdicts:
+    """
+    jobs: lista de (prompt, linhas do CSV cobertas pelo prompt).
+    call: função que recebe um prompt e devolve o texto (JSON) da resposta do LLM.
+    """
+    if not jobs:
+        return merge_verdicts([], rows)
+    with ThreadPoolExecutor(max_workers=min(max_concurrency, len(jobs))) as pool:
+        outputs = list(pool.map(call, [prompt for prompt, _ in jobs]))
+    return merge_verdicts(
+        [parse_verdicts(output, job_rows) for output, (_, job_rows) in zip(outputs, jobs)], rows
+    )
+
+
+def try_parse(text: str):
+    """
+    AnalysisVerdicts de um resultado de generate_response em modo JSON, ou
+    None se o texto for uma mensagem de erro.
+    """
+    try:
+        return AnalysisVerdicts.model_validate_json(text)
+    except (ValidationError, ValueError):
+        return None
+
+
+# ================================================
+# Renderização local
+# ================================================
+def render_markdown(analysis: AnalysisVerdicts, rows: list) -> str:
+    """
+    O relatório ✅/❌/💡 de sempre, gerado a partir do JSON.
+    """
+    themes = {str(row.get("id")).strip(): row.get("tema") for row in rows}
+    lines = ["REQUISITOS"]
+    suggestions = []
+    for verdict in analysis.verdicts:
+        line = f"{STATUS_ICONS[verdict.status]} ({verdict.id}) {themes.get(verdict.id, '')}".rstrip()
+        if verdict.evidencia:
+            line += f' — "{verdict.evidencia}"'
+        if verdict.clausula:
+            line += f" [{verdict.clausula}]"
+        lines.append(line)
+        if verdict.sugestao and verdict.status != "atendido":
+            suggestions.append(f"💡 ({verdict.id}) {verdict.sugestao}")
+    if suggestions:
+        lines.append("")
+        lines.append("SUGESTÕES DE MELHORIA")
+        lines.extend(suggestions)
+    return "\n".join(lines)
+
+
+def verdicts_table(analysis: AnalysisVerdicts, rows: list) -> list:
+    """
+    Uma linha por requisito, pronta para st.dataframe.
+    """
+    by_id = {str(row.get("id")).strip(): row for row in rows}
+    return [
+        {
+            "ID": verdict.id,
+            "Tema": by_id.get(verdict.id, {}).get("tema"),
+            "Prioridade": by_id.get(verdict.id, {}).get("prioridade"),
+            "Status": f"{STATUS_ICONS[verdict.status]} {verdict.status.replace('_', ' ')}",
+            "Evidência": verdict.evidencia,
+            "Cláusula": verdict.clausula,
+            "Sugestão": verdict.sugestao,
+        }
+        for verdict in analysis.verdicts
+    ]
+
+
+def summarize(analysis: AnalysisVerdicts) -> dict:
+    counts = {status: 0 for status in STATUS_ICONS}
+    for verdict in analysis.verdicts:
+        counts[verdict.status] += 1
+    return counts
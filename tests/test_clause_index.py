@@ -0,0 +1,85 @@
+﻿import pytest
+from pdf_extract import PAGE_SEPARATOR
+from clause_index import HEADING_PATTERN, ClauseIndex, normalize_terms, segment_clauses
+
+
+@pytest.mark.parametrize("line", [
+    "CLÁUSULA PRIMEIRA - DO OBJETO",
+    "Cláusula 3ª – Do Prazo",
+    "Art. 5º O contratante...",
+    "CAPÍTULO I",
+    "§ 1º O pagamento será feito...",
+    "Parágrafo único. Em caso de atraso...",
+    "2.1 - O prazo de vigência",
+    "3.4.1. Multa",
+    "3) Obrigações",
+    "1. DO OBJETO",
+    "IV - DA RESCISÃO",
+    "II) Do foro",
+    "a) entregar os produtos",
+])
+def test_heading_lines(line):
+    assert HEADING_PATTERN.match(line)
+
+
+@pytest.mark.parametrize("line", [
+    # Regressões: iniciais de nomes e letras soltas não são numerais romanos
+    "C. Silva assinou o contrato na presença das testemunhas.",
+    "L - teste",
+    "V. Exa. deverá comparecer",
+    # Ano ou valor no início de uma linha longa de texto
+    "2024. O contratante declara que leu e concorda com todas as condições aqui estabelecidas pelas partes.",
+    "cláusulas gerais são aplicáveis",
+    "Título de crédito emitido pela contratante",
+])
+def test_text_lines_are_not_headings(line):
+    assert not HEADING_PATTERN.match(line)
+
+
+CONTRACT = PAGE_SEPARATOR.join([
+    "CONTRATO DE PRESTAÇÃO DE SERVIÇOS\n"
+    "CLÁUSULA PRIMEIRA - DO OBJETO\n"
+    "O objeto é a prestação de serviços de limpeza.\n"
+    "C. Silva assinou como testemunha.",
+    "CLÁUSULA SEGUNDA - DO PRAZO\n"
+    "O prazo de vigência é de doze meses.\n"
+    "CLÁUSULA TERCEIRA - DO FORO\n"
+    "Fica eleito o foro da comarca de Curitiba.",
+])
+
+
+def test_segment_clauses_titles_pages_and_offsets():
+    clauses = segment_clauses(CONTRACT)
+    flat = CONTRACT.replace(PAGE_SEPARATOR, "\n")
+    assert [c.title for c in clauses] == [
+        "Trecho 1",
+        "CLÁUSULA PRIMEIRA - DO OBJETO",
+        "CLÁUSULA SEGUNDA - DO PRAZO",
+        "CLÁUSULA TERCEIRA - DO FORO",
+    ]
+    assert [c.page for c in clauses] == [1, 1, 2, 2]
+    # A linha "C. Silva..." continua dentro da cláusula primeira
+    assert "C. Silva" in clauses[1].text
+    for clause in clauses:
+        assert flat[clause.start:clause.end] == clause.text
+
+
+def test_long_clause_is_split_keeping_title():
+    text = "CLÁUSULA PRIMEIRA\n" + "\n".join(f"Texto corrido da linha {i}." for i in range(40))
+    clauses = segment_clauses(text, max_chars=200)
+    assert len(clauses) > 1
+    assert all(c.title == "CLÁUSULA PRIMEIRA" and len(c.text) <= 200 for c in clauses)
+
+
+def test_normalize_terms_drops_accents_and_stopwords():
+    assert normalize_terms("Da Rescisão do Contrato") == ["rescisao", "contrato"]
+
+
+def test_bm25_search_returns_relevant_clause_in_document_order():
+    index = ClauseIndex(CONTRACT)
+    assert [c.title for c in index.search("foro comarca", k=1)] == ["CLÁUSULA TERCEIRA - DO FORO"]
+    assert [c.title for c in index.search_many(["foro", "prazo vigência"], k=1)] == [
+        "CLÁUSULA SEGUNDA - DO PRAZO",
+        "CLÁUSULA TERCEIRA - DO FORO",
+    ]
+    assert index.search("inexistente", k=3) == []
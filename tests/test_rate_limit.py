@@ -0,0 +1,108 @@
+﻿import asyncio
+import types
+import pytest
+import rate_limit
+from rate_limit import RateLimiter, TokenBucket, is_retryable, parse_duration, retry_after_seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """
+    Relógio falso para o módulo: asyncio.sleep só avança o relógio, e o
+    teste mede quanto tempo as chamadas teriam esperado.
+    """
+    state = types.SimpleNamespace(now=1000.0, slept=0.0)
+
+    async def sleep(seconds):
+        state.now += seconds
+        state.slept += seconds
+
+    monkeypatch.setattr(rate_limit, "time", types.SimpleNamespace(monotonic=lambda: state.now))
+    monkeypatch.setattr(rate_limit, "asyncio", types.SimpleNamespace(Lock=asyncio.Lock, sleep=sleep))
+    return state
+
+
+def test_acquire_within_capacity_does_not_wait(clock):
+    bucket = TokenBucket(60)
+    asyncio.run(bucket.acquire(60))
+    assert clock.slept == 0
+    assert bucket.level == 0
+
+
+def test_acquire_waits_for_refill(clock):
+    bucket = TokenBucket(60)  # 1 por segundo
+    asyncio.run(bucket.acquire(50))
+    asyncio.run(bucket.acquire(20))
+    assert clock.slept == pytest.approx(10)
+
+
+def test_acquire_larger_than_capacity_is_clamped(clock):
+    bucket = TokenBucket(60)
+    asyncio.run(bucket.acquire(1000))
+    assert clock.slept == 0
+
+
+def test_block_pauses_until_reset(clock):
+    bucket = TokenBucket(6000)
+    bucket.block(30)
+    asyncio.run(bucket.acquire(1))
+    assert clock.slept == pytest.approx(30, abs=0.1)
+
+
+def test_observe_adjusts_capacity_and_blocks_when_exhausted(clock):
+    bucket = TokenBucket(60)
+    bucket.observe(limit=120, remaining=10)
+    assert bucket.capacity == 120 and bucket.refill_per_second == 2
+    assert bucket.level == 10
+    bucket.observe(remaining=0, reset_seconds=5)
+    assert bucket.blocked_until == pytest.approx(clock.now + 5)
+
+
+def test_minute_request_headers_update_the_request_bucket(clock):
+    limiter = RateLimiter("openai", "gpt-3.5-turbo")
+    limiter.update_from_headers({
+        "x-ratelimit-limit-requests": "500", "x-ratelimit-remaining-requests": "499",
+        "x-ratelimit-limit-tokens": "30000", "x-ratelimit-remaining-tokens": "29000",
+    })
+    assert limiter.requests.capacity == 500 and limiter.requests.level == 499
+    assert limiter.tokens.capacity == 30000 and limiter.tokens.level == 29000
+
+
+def test_groq_request_headers_are_a_daily_quota(clock, monkeypatch):
+    monkeypatch.setenv("GROQ_RPM", "30")
+    limiter = RateLimiter("groq", "llama-3.3-70b-versatile")
+    # Regressão: o RPD (14400 por dia) não pode virar o limite por minuto
+    limiter.update_from_headers({"x-ratelimit-limit-requests": "14400", "x-ratelimit-remaining-requests": "14000"})
+    assert limiter.requests.capacity == 30 and limiter.requests.level == 30
+    assert limiter.requests.blocked_until == 0
+    limiter.update_from_headers({"x-ratelimit-remaining-requests": "0", "x-ratelimit-reset-requests": "2m30s"})
+    assert limiter.requests.blocked_until == pytest.approx(clock.now + 150)
+
+
+@pytest.mark.parametrize("value, seconds", [
+    ("1s", 1), ("6m0s", 360), ("2.5s", 2.5), ("120ms", 0.12), ("1h2m", 3720), ("7", 7), ("", None), (None, None),
+])
+def test_parse_duration(value, seconds):
+    assert parse_duration(value) == (pytest.approx(seconds) if seconds is not None else None)
+
+
+class ApiError(Exception):
+    def __init__(self, status_code=None, headers=None):
+        self.status_code = status_code
+        self.response = types.SimpleNamespace(headers=headers or {})
+
+
+class APIConnectionError(Exception):
+    pass
+
+
+def test_retryable_errors():
+    assert is_retryable(ApiError(429)) and is_retryable(ApiError(503))
+    assert is_retryable(APIConnectionError())
+    assert not is_retryable(ApiError(400)) and not is_retryable(ApiError(401))
+
+
+def test_retry_after_seconds():
+    assert retry_after_seconds(ApiError(429, {"retry-after": "3"})) == 3
+    assert retry_after_seconds(ApiError(429, {"retry-after-ms": "1500"})) == 1.5
+    assert retry_after_seconds(ApiError(429)) is None
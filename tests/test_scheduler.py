@@ -0,0 +1,118 @@
+﻿import threading
+import pytest
+from scheduler import FairScheduler, QuotaExceeded
+
+TIMEOUT = 5
+
+
+class Recorder:
+    """
+    Tarefas que anotam a ordem em que rodaram; a primeira segura a vaga até
+    release(), para as demais se acumularem na fila.
+    """
+
+    def __init__(self):
+        self.order = []
+        self.gate = threading.Event()
+        self.all_done = threading.Event()
+        self.expected = 0
+        self._lock = threading.Lock()
+
+    def task(self, name: str, actual: int = None, wait: bool = False):
+        self.expected += 1
+
+        def run():
+            if wait:
+                assert self.gate.wait(TIMEOUT)
+            with self._lock:
+                self.order.append(name)
+                if len(self.order) == self.expected:
+                    self.all_done.set()
+            return actual
+        return run
+
+    def release(self):
+        self.gate.set()
+        assert self.all_done.wait(TIMEOUT)
+        return self.order
+
+
+def test_next_task_is_from_user_with_least_tokens():
+    scheduler = FairScheduler(max_concurrent=1, max_running_per_user=1, token_quota=0)
+    recorder = Recorder()
+    scheduler.submit("bloqueio", "outro", 1, recorder.task("bloqueio", wait=True))
+    # "ana" manda dois contratos grandes antes de "bia" mandar dois pequenos
+    scheduler.submit("ana-1", "ana", 1000, recorder.task("ana-1"))
+    scheduler.submit("ana-2", "ana", 1000, recorder.task("ana-2"))
+    scheduler.submit("bia-1", "bia", 10, recorder.task("bia-1"))
+    scheduler.submit("bia-2", "bia", 10, recorder.task("bia-2"))
+    assert scheduler.position("ana-1") == 0
+    assert scheduler.position("bia-2") == 2
+    assert recorder.release() == ["bloqueio", "ana-1", "bia-1", "bia-2", "ana-2"]
+    assert scheduler.position("ana-2") is None
+
+
+def test_per_user_cap_leaves_slots_for_other_users():
+    scheduler = FairScheduler(max_concurrent=2, max_running_per_user=1, token_quota=0)
+    recorder = Recorder()
+    scheduler.submit("ana-1", "ana", 10, recorder.task("ana-1", wait=True))
+    scheduler.submit("ana-2", "ana", 10, recorder.task("ana-2"))
+    scheduler.submit("bia-1", "bia", 10, recorder.task("bia-1", wait=True))
+    stats = scheduler.stats()
+    # ana tem uma vaga só: a segunda vaga fica com bia, e ana-2 espera
+    assert stats["running"] == 2 and stats["queued"] == 1
+    assert scheduler.position("ana-2") == 0
+    assert sorted(recorder.release()) == ["ana-1", "ana-2", "bia-1"]
+
+
+def test_quota_refuses_submission_and_reports_retry_after():
+    scheduler = FairScheduler(max_concurrent=1, token_quota=100, quota_window=3600)
+    recorder = Recorder()
+    scheduler.submit("ana-1", "ana", 80, recorder.task("ana-1"))
+    with pytest.raises(QuotaExceeded) as refused:
+        scheduler.submit("ana-2", "ana", 30, recorder.task("ana-2"))
+    assert refused.value.used == 80
+    assert 0 < refused.value.retry_after <= 3600
+    with pytest.raises(QuotaExceeded) as too_big:
+        scheduler.check_quota("bia", 101)
+    assert too_big.value.retry_after is None
+    # A cota é por usuário
+    scheduler.check_quota("bia", 100)
+
+
+def test_actual_tokens_replace_estimate_in_quota():
+    scheduler = FairScheduler(max_concurrent=1, token_quota=100)
+    recorder = Recorder()
+    # Acerto do cache de respostas: 0 tokens de verdade
+    scheduler.submit("ana-1", "ana", 90, recorder.task("ana-1", actual=0))
+    recorder.release()
+    for _ in range(TIMEOUT * 100):
+        if scheduler.stats()["running"] == 0:
+            break
+        threading.Event().wait(0.01)
+    assert scheduler.user_usage("ana") == 0
+    scheduler.check_quota("ana", 100)
+
+
+def test_concurrent_submissions_cannot_both_pass_quota():
+    scheduler = FairScheduler(max_concurrent=1, token_quota=100)
+    recorder = Recorder()
+    scheduler.submit("bloqueio", "outro", 1, recorder.task("bloqueio", wait=True))
+    results = []
+    barrier = threading.Barrier(8)
+
+    def submit(i):
+        barrier.wait()
+        try:
+            scheduler.submit(f"ana-{i}", "ana", 60, lambda: None)
+            results.append("ok")
+        except QuotaExceeded:
+            results.append("recusado")
+
+    threads = [threading.Thread(target=submit, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(TIMEOUT)
+    recorder.gate.set()
+    assert results.count("ok") == 1
@@ -0,0 +1,52 @@
+﻿import json
+import pytest
+from structured_output import (
+    AnalysisVerdicts, RequirementVerdict, build_structured_prompt, merge_verdicts,
+    parse_verdicts, per_requirement_jobs,
+)
+
+ROWS = [
+    {"id": "1", "tema": "Identificação", "requisito": "Qualificação das partes"},
+    {"id": "2", "tema": "Prazo", "requisito": "Prazo de vigência"},
+    {"id": "3", "tema": "Foro", "requisito": "Foro de eleição"},
+]
+
+
+def listed_requirements(prompt: str) -> list:
+    section = prompt.split("REQUISITOS:", 1)[1].split("Responda APENAS", 1)[0]
+    return [line.strip() for line in section.splitlines() if line.strip().startswith("- ")]
+
+
+def test_structured_prompt_lists_every_requirement():
+    assert len(listed_requirements(build_structured_prompt("texto", ROWS))) == len(ROWS)
+
+
+def test_per_requirement_prompts_list_exactly_one_requirement():
+    jobs = per_requirement_jobs(ROWS, lambda row: [f"trecho do requisito {row['id']}"])
+    assert len(jobs) == len(ROWS)
+    for (prompt, job_rows), row in zip(jobs, ROWS):
+        assert job_rows == [row]
+        assert listed_requirements(prompt) == [f"- {row['id']}: {row['tema']}: {row['requisito']}"]
+        assert f"trecho do requisito {row['id']}" in prompt
+
+
+def test_parse_verdicts_fills_missing_and_normalizes_ids():
+    output = "```json\n" + json.dumps({"verdicts": [{"id": "(2)", "status": "atendido", "evidencia": "12 meses"}]}) + "\n```"
+    verdicts = parse_verdicts(output, ROWS)
+    assert [v.id for v in verdicts] == ["1", "2", "3"]
+    assert [v.status for v in verdicts] == ["nao_atendido", "atendido", "nao_atendido"]
+    assert verdicts[1].evidencia == "12 meses"
+
+
+def test_parse_verdicts_rejects_invalid_json():
+    with pytest.raises(ValueError, match="JSON"):
+        parse_verdicts('{"verdicts": [{"id": "1", "status": "talvez"}]}', ROWS)
+
+
+def test_merge_keeps_best_status_per_requirement():
+    first = [RequirementVerdict(id="1", status="parcial"), RequirementVerdict(id="2", status="atendido")]
+    second = [RequirementVerdict(id="1", status="atendido", evidencia="x"), RequirementVerdict(id="2", status="nao_atendido")]
+    merged = merge_verdicts([first, second], ROWS)
+    assert isinstance(merged, AnalysisVerdicts)
+    assert [(v.id, v.status) for v in merged.verdicts] == [("1", "atendido"), ("2", "atendido"), ("3", "nao_atendido")]
+    assert merged.verdicts[0].evidencia == "x"
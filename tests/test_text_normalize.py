@@ -0,0 +1,80 @@
+﻿import pytest
+from pdf_extract import PAGE_SEPARATOR
+from text_normalize import BARE_PAGE_NUMBER, PAGE_FURNITURE, normalize_pages, normalize_text
+
+WORDS = ["serviços", "pagamento", "prazo", "multa", "rescisão", "foro", "sigilo", "garantia", "reajuste", "seguro"]
+
+
+def page(n: int, top: list = (), bottom: list = ()) -> str:
+    # Corpo diferente em cada página, com linhas longe do topo e do fim
+    body = [f"Cláusula sobre {WORDS[(n + i) % len(WORDS)]} e {WORDS[(2 * n + i) % len(WORDS)]}, item {i}."
+            for i in range(8)]
+    return "\n".join([*top, *body, *bottom])
+
+
+@pytest.mark.parametrize("line", ["Página 3 de 10", "pág. 3", "p. 3", "Fls. 12", "Rubrica: ____", "__________", "......."])
+def test_page_furniture(line):
+    assert PAGE_FURNITURE.match(line)
+
+
+@pytest.mark.parametrize("line", ["3", "- 3 -", "— 12 —"])
+def test_bare_page_number(line):
+    assert BARE_PAGE_NUMBER.match(line)
+
+
+@pytest.mark.parametrize("line", ["15 de 2024", "3/10", "3 of 10", "R$ 15", "2024a"])
+def test_bare_page_number_is_digits_only(line):
+    assert not BARE_PAGE_NUMBER.match(line)
+
+
+def test_repeated_header_kept_once_and_prefixed_page_numbers_removed():
+    pages = [page(n, top=["TAHECH ADVOGADOS - Curitiba"], bottom=[f"Página {n} de 4"]) for n in range(1, 5)]
+    cleaned, removed = normalize_pages(pages)
+    assert cleaned[0].startswith("TAHECH ADVOGADOS")
+    assert all("TAHECH" not in p for p in cleaned[1:])
+    assert all("Página" not in p for p in cleaned)
+    assert removed == 3 + 4
+
+
+def test_bare_page_numbers_removed_only_at_page_edges():
+    pages = [page(n, bottom=[str(n)]) for n in range(1, 5)]
+    lines = pages[1].splitlines()
+    pages[1] = "\n".join(lines[:4] + ["2024"] + lines[4:])
+    cleaned, _ = normalize_pages(pages)
+    assert all(not p.splitlines()[-1].isdigit() for p in cleaned)
+    # No corpo (longe do topo/fim), "2024" é conteúdo
+    assert "2024" in cleaned[1].splitlines()
+
+
+def test_numbers_with_connectors_at_page_edges_are_kept():
+    # Regressão: "15 de 2024" repetido na borda da página era apagado como número de página
+    pages = [page(n, bottom=["15 de 2024"]) for n in range(1, 5)]
+    cleaned, removed = normalize_pages(pages)
+    assert removed == 0
+    assert all(p.splitlines()[-1] == "15 de 2024" for p in cleaned)
+
+
+def test_year_at_page_edge_is_kept_when_not_repeated():
+    pages = [page(n) for n in range(1, 5)]
+    pages[2] = pages[2] + "\n2024"
+    cleaned, _ = normalize_pages(pages)
+    assert cleaned[2].splitlines()[-1] == "2024"
+
+
+def test_repeated_headings_are_content():
+    pages = [page(n, top=["CLÁUSULA PRIMEIRA"]) for n in range(1, 5)]
+    cleaned, _ = normalize_pages(pages)
+    assert all(p.startswith("CLÁUSULA PRIMEIRA") for p in cleaned)
+
+
+def test_hyphenated_words_joined_keeping_clitics():
+    cleaned, _ = normalize_pages(["O contra-\ntante obriga-\nse a pagar."])
+    assert cleaned == ["O contratante obriga-se a pagar."]
+
+
+def test_normalize_text_counts_removed_tokens():
+    pages = [page(n, bottom=[f"Página {n} de 4"]) for n in range(1, 5)]
+    result = normalize_text(PAGE_SEPARATOR.join(pages), "gpt-4o-mini")
+    assert result.text.count(PAGE_SEPARATOR) == 3
+    assert result.lines_removed == 4
+    assert result.tokens_removed > 0 and result.chars_removed > 0
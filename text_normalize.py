@@ -0,0 +1,169 @@
+﻿import re
+import functools
+from collections import Counter
+from dataclasses import dataclass
+from pdf_extract import PAGE_SEPARATOR
+from tokens import count_tokens
+from clause_index import HEADING_PATTERN
+
+# ================================================
+# Limpeza do texto extraído dos PDFs
+# ================================================
+# O texto dos contratos escaneados e passados por OCR repete em toda página o
+# timbre, o número da página, as linhas de "Rubrica" e palavras quebradas com
+# hífen no fim da linha. Tudo isso iria para o prompt como tokens desperdiçados.
+# Esta etapa roda entre process_pdf e a montagem do prompt, página a página
+# (as páginas continuam separadas por PAGE_SEPARATOR):
+#   - linhas de cabeçalho/rodapé repetidas na maioria das páginas ficam só na primeira;
+#   - números de página com prefixo ("Página 3 de 10", "Fls. 3"), "Rubrica" e
+#     linhas só de traços/pontos são descartados em qualquer posição;
+#   - números de página sem prefixo (só dígitos: "3", "- 3 -") só saem do
+#     topo/fim da página e quando o formato se repete nas páginas: no corpo, uma
+#     linha "2024" é conteúdo (ano, valor). Linhas de números com "de" ou "/"
+#     ("15 de 2024", "3/10") nunca são tratadas como cabeçalho ou rodapé: só a
+#     forma com prefixo ("Página 3 de 10") é descartada;
+#   - palavras hifenizadas na quebra de linha são reunidas;
+#   - espaços e linhas em branco repetidos são colapsados.
+
+# Linhas olhadas no topo e no fim de cada página ao procurar cabeçalhos/rodapés
+EDGE_LINES = 3
+# Uma linha é considerada repetida se aparece em pelo menos esta fração das páginas...
+REPEATED_MIN_RATIO = 0.5
+# ... e em pelo menos este número de páginas
+REPEATED_MIN_PAGES = 3
+
+PAGE_FURNITURE = re.compile(
+    r"^("
+    r"(p[áa]g(ina)?\.?|p\.|page|fls?\.?|folha)\s*\d+(\s*(de|/|of)\s*\d+)?"  # Página 3 de 10 / p. 3 / Fls. 3
+    r"|rubricas?\b.*"                                                 # Rubrica: ____
+    r"|[\s_.\-–—=*]{3,}"                                              # ______ / ....... / -----
+    r")$",
+    re.IGNORECASE,
+)
+
+# Número de página sem prefixo, só dígitos; só vale no topo/fim da página e repetido (ver normalize_pages)
+BARE_PAGE_NUMBER = re.compile(r"^[-–—\s]*\d{1,4}[-–—\s]*$")
+# Chave (_line_key) de uma linha só de números e conectores: "15 de 2024", "3/10", "12.500,00"
+_NUMERIC_KEY = re.compile(r"^[#\s/.,\-–—]*#[#\s/.,\-–—]*((de|of)\b[#\s/.,\-–—]*)*$")
+
+# Pronomes que, depois de hífen no fim da linha, indicam ênclise/mesóclise
+# ("obriga-\nse"): o hífen é mantido ao reunir as partes
+CLITICS = {
+    "se", "lhe", "lhes", "o", "a", "os", "as", "lo", "la", "los", "las", "no", "na",
+    "nos", "nas", "me", "te", "vos", "á", "ão", "ia", "iam", "emos", "ei",
+}
+
+_SPACES = re.compile(r"[ \t ]+")
+_HYPHEN_BREAK = re.compile(r"(\w)-\n([a-zà-ÿ]\w*)")
+
+
+@dataclass
+class NormalizedText:
+    text: str
+    chars_before: int
+    chars_after: int
+    tokens_before: int
+    tokens_after: int
+    lines_removed: int
+
+    @property
+    def chars_removed(self) -> int:
+        return self.chars_before - self.chars_after
+
+    @property
+    def tokens_removed(self) -> int:
+        return self.tokens_before - self.tokens_after
+
+    @property
+    def percent_tokens_removed(self) -> float:
+        return 100.0 * self.tokens_removed / self.tokens_before if self.tokens_before else 0.0
+
+
+def _line_key(line: str) -> str:
+    # Cabeçalhos costumam variar só nos números (data, página): os dígitos não contam
+    return re.sub(r"\d+", "#", line.lower()).strip()
+
+
+def _edge_positions(lines: list) -> set:
+    # Posições das primeiras e últimas EDGE_LINES linhas com conteúdo da página
+    content = [i for i, line in enumerate(lines) if line]
+    return set(content[:EDGE_LINES] + content[-EDGE_LINES:])
+
+
+def _repeated_keys(pages: list) -> set:
+    counts = Counter()
+    for lines in pages:
+        # Títulos (CLÁUSULA 3ª, Parágrafo único...) e linhas de números que não
+        # são número de página (datas, valores) se repetem entre páginas, mas são conteúdo
+        counts.update({
+            _line_key(lines[i]) for i in _edge_positions(lines)
+            if not HEADING_PATTERN.match(lines[i])
+            and (BARE_PAGE_NUMBER.match(lines[i]) or not _NUMERIC_KEY.match(_line_key(lines[i])))
+        })
+    threshold = max(REPEATED_MIN_PAGES, REPEATED_MIN_RATIO * len(pages))
+    return {key for key, count in counts.items() if key and count >= threshold}
+
+
+def _join_hyphenated(match: re.Match) -> str:
+    following = match.group(2)
+    if following.lower() in CLITICS:
+        return f"{match.group(1)}-{following}"
+    return f"{match.group(1)}{following}"
+
+
+def normalize_pages(pages: list) -> tuple:
+    """
+    Limpa uma lista de páginas de texto. Retorna (páginas limpas, linhas removidas).
+    """
+    split_pages = [[_SPACES.sub(" ", line).strip() for line in page.split("\n")] for page in pages]
+    repeated = _repeated_keys(split_pages)
+    seen = set()
+    removed = 0
+    cleaned = []
+    for lines in split_pages:
+        edges = _edge_positions(lines)
+        kept = []
+        for position, line in enumerate(lines):
+            if not line:
+                # Linhas em branco seguidas viram uma só
+                if kept and kept[-1]:
+                    kept.append(line)
+                continue
+            if PAGE_FURNITURE.match(line):
+                removed += 1
+                continue
+            key = _line_key(line)
+            # Só no topo/fim da página: no corpo, a linha é conteúdo do contrato
+            if position in edges and key in repeated:
+                # O número de página sai de todas as páginas, até da primeira
+                if key in seen or BARE_PAGE_NUMBER.match(line):
+                    removed += 1
+                    continue
+                seen.add(key)
+            kept.append(line)
+        page = "\n".join(kept).strip()
+        cleaned.append(_HYPHEN_BREAK.sub(_join_hyphenated, page))
+    return cleaned, removed
+
+
+def normalize_text(text: str, model: str) -> NormalizedText:
+    """
+    Limpa o texto de um contrato (páginas separadas por PAGE_SEPARATOR) e
+    informa quantos caracteres e tokens (pelo tokenizador de `model`) saíram.
+    """
+    pages, removed = normalize_pages(text.split(PAGE_SEPARATOR))
+    normalized = PAGE_SEPARATOR.join(pages)
+    return NormalizedText(
+        text=normalized,
+        chars_before=len(text),
+        chars_after=len(normalized),
+        tokens_before=count_tokens(text, model),
+        tokens_after=count_tokens(normalized, model),
+        lines_removed=removed,
+    )
+
+
+@functools.lru_cache(maxsize=16)
+def normalize_cached(text: str, model: str) -> NormalizedText:
+    # O Streamlit reexecuta o script a cada interação com o mesmo PDF carregado
+    return normalize_text(text, model)
@@ -0,0 +1,171 @@
+﻿import os
+import json
+import time
+import threading
+from dataclasses import dataclass, asdict
+from tokens import count_tokens, context_window
+
+# ================================================
+# Orçamento e contabilidade de tokens
+# ================================================
+# Antes do envio, o prompt é contado com o tokenizador de cada modelo que pode
+# recebê-lo e comparado com a janela de contexto menos os tokens reservados
+# para a resposta. Se couber, vai como está; se não, tenta-se a versão
+# comprimida (só as cláusulas relevantes); se ainda assim não couber, a análise
+# passa a ser feita em partes. Depois da chamada, os tokens reais informados
+# pelo provedor e o custo estimado de cada análise vão para um log JSONL.
+
+USAGE_LOG_FILE = os.getenv("USAGE_LOG_FILE", os.path.join(".cache", "usage.jsonl"))
+
+# US$ por 1 milhão de tokens (entrada, saída); atualizar quando a tabela de preços mudar
+PRICES_PER_MILLION = {
+    "gpt-3.5-turbo": (0.50, 1.50),
+    "llama-3.3-70b-versatile": (0.59, 0.79),
+}
+
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int) -> float:
+    """
+    Custo estimado em US$, ou None se o modelo não tem preço cadastrado.
+    """
+    prices = PRICES_PER_MILLION.get(model)
+    if prices is None:
+        return None
+    return ((prompt_tokens or 0) * prices[0] + (completion_tokens or 0) * prices[1]) / 1_000_000
+
+
+# ================================================
+# Decisão antes do envio
+# ================================================
+@dataclass
+class BudgetDecision:
+    action: str  # "send", "compress" ou "chunk"
+    prompt_tokens: int
+    budget: int
+    compressed_tokens: int = None
+    prompt: str = None  # prompt a enviar ("send" e "compress")
+
+    def summary(self) -> dict:
+        summary = asdict(self)
+        summary.pop("prompt")
+        return summary
+
+
+def prompt_budget(models: list, reserved_output_tokens: int) -> int:
+    # Com hedge, o prompt precisa caber no menor contexto entre os modelos
+    return min(context_window(model) for model in models) - reserved_output_tokens
+
+
+def prompt_tokens(prompt: str, models: list) -> int:
+    # Cada modelo conta com o próprio tokenizador; vale a maior contagem
+    return max(count_tokens(prompt, model) for model in models)
+
+
+def plan_prompt(prompt: str, models: list, reserved_output_tokens: int, compress=None) -> BudgetDecision:
+    """
+    Decide como enviar `prompt` aos modelos em `models`.
+    compress: função opcional que devolve uma versão menor do prompt (ou None);
+              só é chamada se o prompt original não couber.
+    """
+    budget = prompt_budget(models, reserved_output_tokens)
+    tokens = prompt_tokens(prompt, models)
+    if tokens <= budget:
+        return BudgetDecision("send", tokens, budget, prompt=prompt)
+    compressed = compress() if compress is not None else None
+    if compressed is not None:
+        compressed_tokens = prompt_tokens(compressed, models)
+        if compressed_tokens <= budget:
+            return BudgetDecision("compress", tokens, budget, compressed_tokens, prompt=compressed)
+        return BudgetDecision("chunk", tokens, budget, compressed_tokens)
+    return BudgetDecision("chunk", tokens, budget)
+
+
+# ================================================
+# Contabilidade depois do envio
+# ================================================
+class UsageMeter:
+    """
+    Soma o uso de tokens das chamadas de uma análise (várias em map-reduce
+    ou por requisito). Pode ser usado por várias threads.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cost_usd = 0.0
+        self.estimated = False
+        self.models = set()
+        self._lock = threading.Lock()
+
+    def add(self, result, prompt: str = None):
+        """
+        result: providers.LLMResult. Se o provedor não informou o uso, os tokens
+        são estimados a partir do prompt e do texto da resposta.
+        """
+        prompt_count = result.prompt_tokens
+        completion_count = result.completion_tokens
+        estimated = False
+        if prompt_count is None and prompt is not None:
+            prompt_count = count_tokens(prompt, result.model)
+            estimated = True
+        if completion_count is None:
+            completion_count = count_tokens(result.text, result.model)
+            estimated = True
+        cost = estimate_cost(result.model, prompt_count, completion_count)
+        with self._lock:
+            self.calls += 1
+            self.prompt_tokens += prompt_count or 0
+            self.completion_tokens += completion_count or 0
+            self.cost_usd += cost or 0.0
+            self.estimated = self.estimated or estimated
+            self.models.add(f"{result.provider}/{result.model}")
+
+    def summary(self) -> dict:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens,
+                "cost_usd": round(self.cost_usd, 6),
+                "estimated": self.estimated,
+                "models": sorted(self.models),
+            }
+
+
+class UsageLog:
+    """
+    Log JSONL com uma linha por análise, para prever gasto e latência.
+    Mantém também os totais do processo desde que foi criado.
+    """
+
+    def __init__(self, path: str = USAGE_LOG_FILE):
+        self.path = path
+        self.analyses = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cost_usd = 0.0
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def record(self, entry: dict):
+        entry = {"timestamp": time.time(), **entry}
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        with self._lock:
+            self.analyses += 1
+            self.prompt_tokens += entry.get("prompt_tokens") or 0
+            self.completion_tokens += entry.get("completion_tokens") or 0
+            self.cost_usd += entry.get("cost_usd") or 0.0
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "analyses": self.analyses,
+                "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens,
+                "cost_usd": self.cost_usd,
+            }
@@ -0,0 +1,92 @@
+﻿import functools
+import tiktoken
+
+# ================================================
+# Contagem e divisão de texto por tokens
+# ================================================
+# Modelos da OpenAI usam o tokenizador do próprio modelo. Para os demais (ex.:
+# llama no Groq) o cl100k_base serve de aproximação. Se nem ele puder ser
+# carregado (servidor sem acesso à internet para baixar o vocabulário), cai
+# para a estimativa de ~4 caracteres por token.
+
+CHARS_PER_TOKEN = 4
+
+CONTEXT_WINDOWS = {
+    "gpt-3.5-turbo": 16385,
+    "llama-3.3-70b-versatile": 128000,
+}
+DEFAULT_CONTEXT_WINDOW = 8192
+
+
+@functools.lru_cache(maxsize=None)
+def get_encoding(model: str):
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        pass
+    except Exception:
+        return None
+    try:
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        return None
+
+
+def count_tokens(text: str, model: str) -> int:
+    encoding = get_encoding(model)
+    if encoding is None:
+        return -(-len(text) // CHARS_PER_TOKEN)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def context_window(model: str) -> int:
+    return CONTEXT_WINDOWS.get(model, DEFAULT_CONTEXT_WINDOW)
+
+
+def _split_long(text: str, max_tokens: int, model: str) -> list:
+    # Um único parágrafo maior que o limite é cortado na fronteira de tokens
+    encoding = get_encoding(model)
+    if encoding is None:
+        size = max_tokens * CHARS_PER_TOKEN
+        return [text[i:i + size] for i in range(0, len(text), size)]
+    ids = encoding.encode(text, disallowed_special=())
+    return [encoding.decode(ids[i:i + max_tokens]) for i in range(0, len(ids), max_tokens)]
+
+
+def split_by_tokens(text: str, max_tokens: int, model: str, overlap_tokens: int = 0) -> list:
+    """
+    Divide o texto em partes de até max_tokens, respeitando quebras de linha
+    sempre que possível. Cada parte repete as últimas linhas da anterior
+    (até overlap_tokens) para não separar uma cláusula do seu contexto.
+    """
+    paragraphs = []
+    for line in text.split("\n"):
+        if not line.strip():
+            continue
+        tokens = count_tokens(line, model)
+        if tokens > max_tokens:
+            paragraphs.extend((part, count_tokens(part, model)) for part in _split_long(line, max_tokens, model))
+        else:
+            paragraphs.append((line, tokens))
+
+    chunks = []
+    current = []
+    current_tokens = 0
+    for paragraph, tokens in paragraphs:
+        if current and current_tokens + tokens > max_tokens:
+            chunks.append("\n".join(p for p, _ in current))
+            # Mantém o final da parte anterior como sobreposição
+            overlap = []
+            overlap_total = 0
+            for p, t in reversed(current):
+                if overlap_total + t > overlap_tokens or overlap_total + t + tokens > max_tokens:
+                    break
+                overlap.insert(0, (p, t))
+                overlap_total += t
+            current = overlap
+            current_tokens = overlap_total
+        current.append((paragraph, tokens))
+        current_tokens += tokens
+    if current:
+        chunks.append("\n".join(p for p, _ in current))
+    return chunks
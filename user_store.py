@@ -0,0 +1,361 @@
+﻿import os
+import csv
+import hmac
+import time
+import getpass
+import hashlib
+import secrets
+import sqlite3
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import bcrypt
+
+# ================================================
+# Cadastro de usuários e sessões
+# ================================================
+# Os usuários ficam numa tabela SQLite indexada pelo hash (SHA-256) do nome de
+# usuário ou e-mail normalizado; o nome em si não é gravado. As senhas são
+# guardadas só como hash bcrypt. Como o bcrypt é lento de propósito, ele roda
+# uma vez por login: o login bem-sucedido gera um token de sessão aleatório,
+# e os reruns seguintes só conferem o token num dicionário em memória. O banco
+# (uma consulta pela chave primária, sem bcrypt) só é lido quando o token não
+# está no dicionário ou a cada SESSION_RECHECK_SECONDS, para que uma troca de
+# senha ou remoção feita por outro processo (ex.: a linha de comando) encerre
+# a sessão. Da tabela de sessões também só sai o hash do token.
+#
+# users.csv (username,password) e authorized_users.csv (email) são importados
+# em lote; e-mails autorizados não têm senha e valem para o login com Google.
+# O CSV continua mandando nos usuários que vieram dele: quando o arquivo muda,
+# senhas alteradas são atualizadas e linhas apagadas removem o usuário. Para
+# não pagar um bcrypt por usuário a cada mudança no arquivo, cada linha
+# importada deixa uma impressão digital (HMAC da senha com o hash bcrypt
+# gravado como chave): linhas com a mesma impressão são puladas. Ela é tão
+# forte quanto um hash rápido, mas a senha já está em claro no próprio CSV. Quem
+# foi cadastrado (ou teve a senha trocada) pela linha de comando sai do
+# controle do CSV:
+#   python user_store.py import users.csv authorized_users.csv
+#   python user_store.py set-password joao
+#   python user_store.py remove joao
+
+DEFAULT_STORE_PATH = os.getenv("USERS_PATH", os.path.join(".cache", "users.sqlite"))
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", 12))
+SESSION_TTL_SECONDS = int(os.getenv("SESSION_TTL_SECONDS", 12 * 60 * 60))
+SESSION_RECHECK_SECONDS = float(os.getenv("SESSION_RECHECK_SECONDS", 60))
+# O bcrypt libera o GIL: a importação em lote calcula os hashes em paralelo
+IMPORT_WORKERS = int(os.getenv("USER_IMPORT_WORKERS", os.cpu_count() or 1))
+
+
+def user_key(name: str) -> str:
+    # Logins e e-mails não diferenciam maiúsculas de minúsculas
+    return hashlib.sha256(name.strip().casefold().encode("utf-8")).hexdigest()
+
+
+def _token_key(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+def hash_password(password: str, rounds: int = BCRYPT_ROUNDS) -> str:
+    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt(rounds)).decode("ascii")
+
+
+def _is_bcrypt_hash(value: str) -> bool:
+    # Permite importar CSVs que já trazem o hash em vez da senha
+    return value.startswith(("$2a$", "$2b$", "$2y$")) and len(value) == 60
+
+
+def _row_fingerprint(stored_hash: str, password: str) -> str:
+    # Muda quando a senha do CSV muda ou quando o hash gravado é trocado por outro caminho
+    return hmac.new(stored_hash.encode("ascii"), password.encode("utf-8"), hashlib.sha256).hexdigest()
+
+
+class UserStore:
+    def __init__(self, path: str = DEFAULT_STORE_PATH, session_ttl: int = SESSION_TTL_SECONDS,
+                 recheck_seconds: float = SESSION_RECHECK_SECONDS):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.session_ttl = session_ttl
+        self.recheck_seconds = recheck_seconds
+        self._lock = threading.Lock()
+        # Uma sincronização de CSV por vez; arquivo -> mtime já importado
+        self._import_lock = threading.Lock()
+        self._synced = {}
+        # hash do token -> (chave do usuário, expiração, quando foi conferido no banco)
+        self._sessions = {}
+        # Hash de referência para gastar o mesmo tempo quando o usuário não existe
+        self._dummy_hash = hash_password(secrets.token_urlsafe(16)).encode("ascii")
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS users (
+                key TEXT PRIMARY KEY,
+                password_hash TEXT,
+                source TEXT,
+                created REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS sessions (
+                token TEXT PRIMARY KEY,
+                user TEXT NOT NULL,
+                expires REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS sessions_user ON sessions (user);
+            CREATE TABLE IF NOT EXISTS imports (
+                path TEXT PRIMARY KEY,
+                mtime REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS csv_rows (
+                key TEXT PRIMARY KEY,
+                fingerprint TEXT NOT NULL
+            );
+        """)
+        self._conn.commit()
+
+    def _execute(self, sql: str, args: tuple = ()):
+        with self._lock, self._conn:
+            return self._conn.execute(sql, args).fetchall()
+
+    def count(self) -> int:
+        return self._execute("SELECT COUNT(*) FROM users")[0][0]
+
+    # ------------------------------------------------
+    # Cadastro
+    # ------------------------------------------------
+    def set_password(self, username: str, password: str, source: str = "manual"):
+        """
+        Cadastra o usuário ou troca a senha dele. As sessões abertas com a
+        senha antiga são encerradas. O usuário deixa de ser controlado pelo
+        CSV de onde veio.
+        """
+        if not username.strip() or not password:
+            raise ValueError("Usuário e senha não podem ficar em branco.")
+        key = user_key(username)
+        self._execute(
+            "INSERT INTO users (key, password_hash, source, created) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (key) DO UPDATE SET password_hash = excluded.password_hash, source = excluded.source",
+            (key, hash_password(password), source, time.time()),
+        )
+        self.revoke_user(key)
+
+    def authorize_email(self, email: str, source: str = "manual"):
+        """
+        Autoriza o e-mail (login com Google), sem senha. Não altera um
+        cadastro que já existe.
+        """
+        self._execute(
+            "INSERT OR IGNORE INTO users (key, password_hash, source, created) VALUES (?, NULL, ?, ?)",
+            (user_key(email), source, time.time()),
+        )
+
+    def is_authorized(self, name: str) -> bool:
+        return bool(self._execute("SELECT 1 FROM users WHERE key = ?", (user_key(name),)))
+
+    def remove(self, name: str) -> bool:
+        key = user_key(name)
+        removed = self.is_authorized(name)
+        self._execute("DELETE FROM users WHERE key = ?", (key,))
+        self._execute("DELETE FROM csv_rows WHERE key = ?", (key,))
+        self.revoke_user(key)
+        return removed
+
+    def import_csv(self, path: str) -> dict:
+        """
+        Sincroniza o cadastro com um CSV de colunas username,password e/ou
+        email. O CSV manda nos usuários que vieram dele: os novos entram, os
+        de senha alterada são atualizados e os que saíram do arquivo são
+        removidos (nos dois últimos casos, as sessões abertas são encerradas).
+        Usuários de outra origem (outro CSV ou set-password) não são tocados.
+        Retorna quantos foram incluídos, atualizados e removidos.
+        """
+        with open(path, "r", encoding="utf-8-sig", newline="") as f:
+            rows = list(csv.DictReader(f))
+        source = os.path.basename(path)
+        current = {key: (stored, origin) for key, stored, origin in
+                   self._execute("SELECT key, password_hash, source FROM users")}
+        fingerprints = dict(self._execute("SELECT key, fingerprint FROM csv_rows"))
+        credentials = {}
+        emails = set()
+        for row in rows:
+            username = (row.get("username") or "").strip()
+            password = row.get("password") or ""
+            email = (row.get("email") or "").strip()
+            if username and password:
+                credentials.setdefault(user_key(username), password)
+            if email:
+                emails.add(user_key(email))
+        emails -= credentials.keys()
+
+        def owned(key: str) -> bool:
+            return key not in current or current[key][1] == source
+
+        def new_hash(item: tuple) -> tuple:
+            # (chave, hash a gravar ou None se a senha não mudou, impressão digital
+            # a gravar ou None). Linha com a impressão de antes não passa pelo
+            # bcrypt; as demais custam um bcrypt cada (ou um CSV com os hashes)
+            key, password = item
+            stored = current.get(key, (None, None))[0]
+            if _is_bcrypt_hash(password):
+                return key, None if password == stored else password, None
+            if stored:
+                fingerprint = _row_fingerprint(stored, password)
+                if fingerprints.get(key) == fingerprint:
+                    return key, None, None
+                if bcrypt.checkpw(password.encode("utf-8"), stored.encode("ascii")):
+                    return key, None, fingerprint
+            hashed = hash_password(password)
+            return key, hashed, _row_fingerprint(hashed, password)
+
+        pending = [(key, password) for key, password in credentials.items() if owned(key)]
+        with ThreadPoolExecutor(max_workers=max(1, min(IMPORT_WORKERS, len(pending) or 1))) as pool:
+            results = list(pool.map(new_hash, pending))
+        changed = [(key, hashed) for key, hashed, _ in results if hashed is not None]
+        new_fingerprints = [(key, fingerprint) for key, _, fingerprint in results if fingerprint is not None]
+        # E-mail que antes tinha senha neste CSV passa a ser só autorizado
+        changed += [(key, None) for key in emails if key in current and owned(key) and current[key][0]]
+        added = [(key, None) for key in emails if key not in current]
+        removed = [key for key, (_, origin) in current.items()
+                   if origin == source and key not in credentials and key not in emails]
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT INTO users (key, password_hash, source, created) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET password_hash = excluded.password_hash",
+                [(key, hashed, source, now) for key, hashed in changed + added],
+            )
+            self._conn.executemany("DELETE FROM users WHERE key = ?", [(key,) for key in removed])
+            self._conn.executemany(
+                "INSERT INTO csv_rows (key, fingerprint) VALUES (?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET fingerprint = excluded.fingerprint",
+                new_fingerprints,
+            )
+            self._conn.executemany("DELETE FROM csv_rows WHERE key = ?", [(key,) for key in removed])
+        updated = [key for key, _ in changed if key in current]
+        for key in updated + removed:
+            self.revoke_user(key)
+        return {"added": len(changed) + len(added) - len(updated), "updated": len(updated), "removed": len(removed)}
+
+    def sync_csv(self, path: str) -> dict:
+        """
+        import_csv só quando o arquivo mudou desde a última importação (ou
+        nunca foi importado); barato o bastante para rodar a cada login.
+        Arquivo inexistente é ignorado.
+        """
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            return None
+        name = os.path.abspath(path)
+        if self._synced.get(name) == mtime:
+            return None
+        with self._import_lock:
+            rows = self._execute("SELECT mtime FROM imports WHERE path = ?", (name,))
+            if rows and rows[0][0] == mtime:
+                self._synced[name] = mtime
+                return None
+            counts = self.import_csv(path)
+            self._execute(
+                "INSERT INTO imports (path, mtime) VALUES (?, ?) ON CONFLICT (path) DO UPDATE SET mtime = excluded.mtime",
+                (name, mtime),
+            )
+            self._synced[name] = mtime
+        return counts
+
+    # ------------------------------------------------
+    # Login e sessões
+    # ------------------------------------------------
+    def login(self, username: str, password: str) -> str:
+        """
+        Confere a senha (bcrypt) e abre uma sessão. Retorna o token da sessão,
+        ou None se o usuário ou a senha não conferem.
+        """
+        key = user_key(username)
+        rows = self._execute("SELECT password_hash FROM users WHERE key = ?", (key,))
+        stored = rows[0][0] if rows and rows[0][0] else None
+        # Sem usuário (ou sem senha), confere contra um hash qualquer: o tempo
+        # de resposta não revela quais usuários existem
+        ok = bcrypt.checkpw(password.encode("utf-8"), stored.encode("ascii") if stored else self._dummy_hash)
+        if not (ok and stored):
+            return None
+        self.purge_expired()
+        token = secrets.token_urlsafe(32)
+        expires = time.time() + self.session_ttl
+        self._execute("INSERT INTO sessions (token, user, expires) VALUES (?, ?, ?)", (_token_key(token), key, expires))
+        with self._lock:
+            self._sessions[_token_key(token)] = (key, expires, time.time())
+        return token
+
+    def verify_session(self, token: str) -> bool:
+        """
+        Sessão válida? Chamado a cada rerun: sem bcrypt, e sem consultar o
+        banco quando o token já está no cache em memória.
+        """
+        if not token:
+            return False
+        token_key = _token_key(token)
+        now = time.time()
+        with self._lock:
+            cached = self._sessions.get(token_key)
+        if cached is None or now - cached[2] > self.recheck_seconds:
+            rows = self._execute("SELECT user, expires FROM sessions WHERE token = ?", (token_key,))
+            with self._lock:
+                if not rows:
+                    self._sessions.pop(token_key, None)
+                    return False
+                cached = self._sessions[token_key] = (rows[0][0], rows[0][1], now)
+        if cached[1] < now:
+            self.logout(token)
+            return False
+        return True
+
+    def logout(self, token: str):
+        token_key = _token_key(token)
+        with self._lock:
+            self._sessions.pop(token_key, None)
+        self._execute("DELETE FROM sessions WHERE token = ?", (token_key,))
+
+    def revoke_user(self, key: str):
+        # Encerra todas as sessões do usuário (troca de senha, remoção)
+        with self._lock:
+            for token_key in [t for t, (user, _, _) in self._sessions.items() if user == key]:
+                del self._sessions[token_key]
+        self._execute("DELETE FROM sessions WHERE user = ?", (key,))
+
+    def purge_expired(self):
+        now = time.time()
+        with self._lock:
+            for token_key in [t for t, (_, expires, _) in self._sessions.items() if expires < now]:
+                del self._sessions[token_key]
+        self._execute("DELETE FROM sessions WHERE expires < ?", (now,))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cadastro de usuários do analisador.")
+    parser.add_argument("--path", default=DEFAULT_STORE_PATH, help="banco SQLite dos usuários")
+    commands = parser.add_subparsers(dest="command", required=True)
+    import_parser = commands.add_parser("import", help="importa CSVs (username,password e/ou email)")
+    import_parser.add_argument("files", nargs="+")
+    password_parser = commands.add_parser("set-password", help="cadastra o usuário ou troca a senha")
+    password_parser.add_argument("username")
+    remove_parser = commands.add_parser("remove", help="remove o usuário e encerra as sessões dele")
+    remove_parser.add_argument("username")
+    args = parser.parse_args()
+
+    store = UserStore(args.path)
+    if args.command == "import":
+        for path in args.files:
+            counts = store.import_csv(path)
+            print(f"{path}: {counts['added']} incluído(s), {counts['updated']} atualizado(s), "
+                  f"{counts['removed']} removido(s)")
+    elif args.command == "set-password":
+        password = getpass.getpass("Nova senha: ")
+        if password != getpass.getpass("Repita a senha: "):
+            parser.error("as senhas não conferem")
+        store.set_password(args.username, password)
+        print("Senha gravada.")
+    elif args.command == "remove":
+        print("Usuário removido." if store.remove(args.username) else "Usuário não encontrado.")
+    print(f"Total de usuários cadastrados: {store.count()}")
+
+
+if __name__ == "__main__":
+    main()